@@ -27,6 +27,7 @@ from .config import init as config_init
 from .helpers import frontend
 from .helpers import logging as pmb_logging
 from .helpers import other
+from .helpers import root_helper
 
 
 def main():
@@ -44,7 +45,9 @@ def main():
 
         # Initialize or require config
         if args.action == "init":
-            return config_init.frontend(args)
+            ret = config_init.frontend(args)
+            root_helper.stop(args)
+            return ret
         elif not os.path.exists(args.config):
             raise RuntimeError("Please specify a config file, or run"
                                " 'pmbootstrap init' to generate one.")
@@ -62,6 +65,12 @@ def main():
         else:
             logging.info("Run pmbootstrap -h for usage information.")
 
+        # Store the APKBUILDs parsed in this session for the next call
+        parse._apkbuild.cache_save(args)
+
+        # Let the root helper processes exit (see pmb/helpers/root_helper.py)
+        root_helper.stop(args)
+
         # Print finish timestamp
         logging.info("Done")
 
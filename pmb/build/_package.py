@@ -22,6 +22,8 @@ import os
 
 import pmb.build
 import pmb.build.autodetect
+import pmb.build.binary_cache
+import pmb.build.history
 import pmb.chroot
 import pmb.chroot.apk
 import pmb.chroot.distccd
@@ -47,16 +49,18 @@ def skip_already_built(args, pkgname, arch):
     return False
 
 
-def get_apkbuild(args, pkgname, arch):
+def get_apkbuild(args, pkgname, arch, update_repo=True):
     """
     Find the APKBUILD path for pkgname. When there is none, try to find it in
     the binary package APKINDEX files or raise an exception.
 
     :param pkgname: package name to be built, as specified in the APKBUILD
+    :param update_repo: download missing and outdated APKINDEX files first
     :returns: None or full path to APKBUILD
     """
     # Get existing binary package indexes
-    pmb.helpers.repo.update(args, arch)
+    if update_repo:
+        pmb.helpers.repo.update(args, arch)
 
     # Get aport, skip upstream only packages
     aport = pmb.build.find_aport(args, pkgname, False)
@@ -154,8 +158,28 @@ def is_necessary_warn_depends(args, apkbuild, arch, force, depends_built):
     return ret
 
 
+def build_depends_necessary(args, apkbuild, arch, strict=False, force=False,
+                            record=None):
+    """
+    Build all dependencies and check if we need to build the package itself.
+
+    :param record: build history record (see pmb.build.history.start())
+    :returns: (necessary, depends): necessary is True when the build is
+              necessary, depends is the return value of get_depends()
+    """
+    with pmb.build.history.measure(record, "depends"):
+        # Build dependencies (package arch)
+        depends, built = build_depends(args, apkbuild, arch, strict)
+
+        # Check if build is necessary
+        necessary = is_necessary_warn_depends(args, apkbuild, arch, force,
+                                              built)
+    return (necessary, depends)
+
+
 def init_buildenv(args, apkbuild, arch, strict=False, force=False, cross=None,
-                  suffix="native", skip_init_buildenv=False, src=None):
+                  suffix="native", skip_init_buildenv=False, src=None,
+                  record=None):
     """
     Build all dependencies, check if we need to build at all (otherwise we've
     just initialized the build environment for nothing) and then setup the
@@ -167,41 +191,62 @@ def init_buildenv(args, apkbuild, arch, strict=False, force=False, cross=None,
                                something during initialization of the build
                                environment (e.g. qemu aarch64 bug workaround)
     :param src: override source used to build the package with a local folder
+    :param record: build history record (see pmb.build.history.start())
     :returns: True when the build is necessary (otherwise False)
     """
-    # Build dependencies (package arch)
-    depends, built = build_depends(args, apkbuild, arch, strict)
-
-    # Check if build is necessary
-    if not is_necessary_warn_depends(args, apkbuild, arch, force, built):
+    (necessary, depends) = build_depends_necessary(args, apkbuild, arch,
+                                                   strict, force, record)
+    if not necessary:
         return False
 
-    # Install and configure abuild, ccache, gcc, dependencies
-    if not skip_init_buildenv:
-        pmb.build.init(args, suffix)
-        pmb.build.other.configure_abuild(args, suffix)
-        pmb.build.other.configure_ccache(args, suffix)
-    if not strict and len(depends):
-        pmb.chroot.apk.install(args, depends, suffix)
-    if src:
-        pmb.chroot.apk.install(args, ["rsync"], suffix)
+    init_buildenv_chroot(args, apkbuild, arch, depends, strict, cross, suffix,
+                         skip_init_buildenv, src, record=record)
+    return True
 
-    # Cross-compiler init
-    if cross:
-        pmb.chroot.apk.install(args, ["gcc-" + arch, "g++-" + arch,
-                                      "ccache-cross-symlinks"])
-    if cross == "distcc":
-        pmb.chroot.apk.install(args, ["distcc", "arch-bin-masquerade"],
-                               suffix=suffix)
-        pmb.chroot.distccd.start(args, arch)
 
-    # "native" cross-compile: build and install dependencies (#1061)
-    if cross == "native":
-        depends, built = build_depends(args, apkbuild, args.arch_native, strict)
+def init_buildenv_chroot(args, apkbuild, arch, depends, strict=False,
+                         cross=None, suffix="native", skip_init_buildenv=False,
+                         src=None, build_native_depends=True, record=None):
+    """
+    Setup the build environment for a package, of which the dependencies have
+    been built already (see init_buildenv()).
+
+    :param depends: return value of get_depends()
+    :param build_native_depends: build the dependencies for the native arch
+                                 when cross-compiling in the native chroot.
+                                 The build scheduler sets this to False,
+                                 because it builds them before.
+    :param record: build history record (see pmb.build.history.start())
+    """
+    # Install and configure abuild, ccache, gcc
+    with pmb.build.history.measure(record, "init_buildenv"):
+        if not skip_init_buildenv:
+            pmb.build.init(args, suffix)
+            pmb.build.other.configure_abuild(args, suffix)
+            pmb.build.other.configure_ccache(args, suffix)
+
+    # Install dependencies
+    with pmb.build.history.measure(record, "install_depends"):
         if not strict and len(depends):
-            pmb.chroot.apk.install(args, depends)
-
-    return True
+            pmb.chroot.apk.install(args, depends, suffix)
+        if src:
+            pmb.chroot.apk.install(args, ["rsync"], suffix)
+
+        # Cross-compiler init
+        if cross:
+            pmb.chroot.apk.install(args, ["gcc-" + arch, "g++-" + arch,
+                                          "ccache-cross-symlinks"])
+        if cross == "distcc":
+            pmb.chroot.apk.install(args, ["distcc", "arch-bin-masquerade"],
+                                   suffix=suffix)
+            pmb.chroot.distccd.start(args, arch)
+
+        # "native" cross-compile: build and install dependencies (#1061)
+        if cross == "native":
+            if build_native_depends:
+                build_depends(args, apkbuild, args.arch_native, strict)
+            if not strict and len(depends):
+                pmb.chroot.apk.install(args, depends)
 
 
 def get_gcc_version(args, arch):
@@ -308,19 +353,17 @@ def override_source(args, apkbuild, pkgver, src, suffix="native"):
     pmb.chroot.user(args, ["mv", append_path + "_", apkbuild_path], suffix)
 
 
-def run_abuild(args, apkbuild, arch, strict=False, force=False, cross=None,
-               suffix="native", src=None):
+def prepare_abuild(args, apkbuild, arch, strict=False, force=False,
+                   cross=None, suffix="native", src=None, repodest=None):
     """
     Set up all environment variables and construct the abuild command (all
-    depending on the cross-compiler method and target architecture), copy
-    the aport to the chroot and execute abuild.
+    depending on the cross-compiler method and target architecture), and copy
+    the aport to the chroot. See run_abuild() for the parameters.
 
-    :param cross: None, "native" or "distcc"
-    :param src: override source used to build the package with a local folder
-    :returns: (output, cmd, env), output is the destination apk path relative
-              to the package folder ("x86_64/hello-1-r2.apk"). cmd and env are
-              used by the test case, and they are the full abuild command and
-              the environment variables dict generated in this function.
+    :param repodest: folder inside the chroot, where abuild writes the
+                     packages and its APKINDEX to (default: the packages
+                     folder of pmbootstrap, see abuild's -P parameter)
+    :returns: (output, cmd, env), like run_abuild()
     """
     # Sanity check
     if cross == "native" and "!tracedeps" not in apkbuild["options"]:
@@ -358,10 +401,31 @@ def run_abuild(args, apkbuild, arch, strict=False, force=False, cross=None,
         cmd += ["-d"]  # do not install depends with abuild
     if force:
         cmd += ["-f"]
+    if repodest:
+        cmd += ["-P", repodest]
 
-    # Copy the aport to the chroot and build it
+    # Copy the aport to the chroot
     pmb.build.copy_to_buildpath(args, apkbuild["pkgname"], suffix)
     override_source(args, apkbuild, pkgver, src, suffix)
+    return (output, cmd, env)
+
+
+def run_abuild(args, apkbuild, arch, strict=False, force=False, cross=None,
+               suffix="native", src=None):
+    """
+    Set up all environment variables and construct the abuild command (all
+    depending on the cross-compiler method and target architecture), copy
+    the aport to the chroot and execute abuild.
+
+    :param cross: None, "native" or "distcc"
+    :param src: override source used to build the package with a local folder
+    :returns: (output, cmd, env), output is the destination apk path relative
+              to the package folder ("x86_64/hello-1-r2.apk"). cmd and env are
+              used by the test case, and they are the full abuild command and
+              the environment variables dict generated in this function.
+    """
+    (output, cmd, env) = prepare_abuild(args, apkbuild, arch, strict, force,
+                                        cross, suffix, src)
     pmb.chroot.user(args, cmd, suffix, "/home/pmos/build", env=env)
     return (output, cmd, env)
 
@@ -381,6 +445,9 @@ def finish(args, apkbuild, arch, output, strict=False, suffix="native"):
     pmb.parse.apkindex.clear_cache(args, args.work + "/packages/" +
                                    arch + "/APKINDEX.tar.gz")
 
+    # Record the fingerprint, so is_necessary() can detect changed aports
+    pmb.build.other.fingerprint_save(args, arch, apkbuild, suffix)
+
     # Uninstall build dependencies (strict mode)
     if strict:
         logging.info("(" + suffix + ") uninstall build dependencies")
@@ -420,12 +487,35 @@ def package(args, pkgname, arch=None, force=False, strict=False,
     check_arch(args, apkbuild, arch)
     suffix = pmb.build.autodetect.suffix(args, apkbuild, arch)
     cross = pmb.build.autodetect.crosscompile(args, apkbuild, arch, suffix)
-    if not init_buildenv(args, apkbuild, arch, strict, force, cross, suffix,
-                         skip_init_buildenv, src):
+    record = pmb.build.history.start(args, apkbuild, arch, suffix, cross)
+    (necessary, depends) = build_depends_necessary(args, apkbuild, arch,
+                                                   strict, force, record)
+    if not necessary:
         return
 
+    # Use the package from the binary cache, if it was built before with the
+    # same inputs (skips setting up the build environment)
+    cache_key = None
+    if args.binary_cache and not src:
+        with pmb.build.history.measure(record, "binary_cache"):
+            cache_key = pmb.build.binary_cache.key(args, apkbuild, arch,
+                                                   cross)
+            output = pmb.build.binary_cache.restore(args, apkbuild, arch,
+                                                    cache_key)
+        if output:
+            pmb.build.history.save(args, record, output, binary_cache=True)
+            return output
+
     # Build and finish up
-    (output, cmd, env) = run_abuild(args, apkbuild, arch, strict, force, cross,
-                                    suffix, src)
-    finish(args, apkbuild, arch, output, strict, suffix)
+    init_buildenv_chroot(args, apkbuild, arch, depends, strict, cross, suffix,
+                         skip_init_buildenv, src, record=record)
+    ccache = pmb.build.history.ccache_stats(args, suffix)
+    with pmb.build.history.measure(record, "run_abuild"):
+        (output, cmd, env) = run_abuild(args, apkbuild, arch, strict, force,
+                                        cross, suffix, src)
+    with pmb.build.history.measure(record, "finish"):
+        finish(args, apkbuild, arch, output, strict, suffix)
+    pmb.build.history.save(args, record, output, ccache)
+    if cache_key:
+        pmb.build.binary_cache.store(args, apkbuild, arch, cache_key)
     return output
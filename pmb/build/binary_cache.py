@@ -0,0 +1,286 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+
+Binary cache: packages, that have been built before, stored by a key derived
+from all inputs of the build. The cache is a plain folder with the following
+structure, which can also be served over HTTP (e.g. with
+"python3 -m http.server") to share it between multiple machines:
+
+    $ARCH/$KEY/files        (list of the apk files, one per line)
+    $ARCH/$KEY/$APK_FILE    (built package and subpackages)
+
+Packages from the binary cache only get used, when they are signed with one
+of the keys in $WORK/config_apk_keys (the keys, that apk trusts inside the
+chroots: the Alpine keys and the local package signing key). To use packages
+built on another machine, copy its public key from
+$WORK/config_abuild/*.rsa.pub there.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import urllib.error
+import urllib.request
+
+import pmb.build
+import pmb.build._package
+import pmb.build.other
+import pmb.config
+import pmb.helpers.http
+import pmb.helpers.run
+import pmb.parse.apk
+import pmb.parse.apkindex
+
+
+def is_url(args):
+    """
+    :returns: True when the binary cache is served over HTTP (read only)
+    """
+    return args.binary_cache.startswith(("http://", "https://"))
+
+
+def key(args, apkbuild, arch, cross=None):
+    """
+    Calculate the key of a package in the binary cache. It changes, when
+    anything changes, that could make a difference in the built package:
+    the aport folder and the aports of its dependencies (see
+    pmb.build.other.fingerprint()), the arch, the cross-compile method and the
+    versions of the dependencies from the binary repositories.
+
+    :param cross: None, "native" or "distcc"
+    :returns: hex string of the hash
+    """
+    ret = hashlib.sha256()
+    ret.update(("v" + pmb.config.binary_cache_version + "\0" + arch + "\0" +
+                str(cross) + "\0").encode())
+    ret.update(pmb.build.other.fingerprint(args, apkbuild).encode())
+    for depend in pmb.build._package.get_depends(args, apkbuild):
+        # Dependencies with aports are part of the fingerprint already
+        if pmb.build.other.find_aport(args, depend, False):
+            continue
+        version = "none"
+        index_data = pmb.parse.apkindex.package(args, depend, arch, False)
+        if index_data:
+            version = index_data["version"]
+        ret.update(("\0" + depend + "=" + version).encode())
+    return ret.hexdigest()
+
+
+def apk_files(args, apkbuild, arch):
+    """
+    :returns: file names of the package and its subpackages, that exist in
+              the local packages folder
+    """
+    ret = []
+    version = apkbuild["pkgver"] + "-r" + apkbuild["pkgrel"]
+    for pkgname in [apkbuild["pkgname"]] + list(apkbuild["subpackages"]):
+        name = pkgname + "-" + version + ".apk"
+        if os.path.exists(args.work + "/packages/" + arch + "/" + name):
+            ret.append(name)
+    return ret
+
+
+def files(args, arch, key):
+    """
+    Look up an entry in the binary cache.
+
+    :returns: list of the apk file names of the entry, or None if the entry
+              does not exist (or the binary cache is not reachable)
+    """
+    url = args.binary_cache + "/" + arch + "/" + key + "/files"
+    if is_url(args):
+        try:
+            with urllib.request.urlopen(
+                    url, timeout=pmb.config.binary_cache_timeout) as response:
+                content = response.read().decode()
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            logging.warning("WARNING: Binary cache not usable (" + url +
+                            "): " + str(e))
+            return None
+        except OSError as e:
+            # URLError, timeouts, connection resets
+            logging.warning("WARNING: Binary cache not reachable (" + url +
+                            "): " + str(e))
+            return None
+    else:
+        if not os.path.exists(url):
+            return None
+        with open(url) as handle:
+            content = handle.read()
+
+    # Only accept plain file names (the cache may be on another machine)
+    ret = content.split()
+    for name in ret:
+        if "/" in name or not name.endswith(".apk"):
+            raise RuntimeError("Invalid file name in binary cache entry " +
+                               url + ": " + name)
+    return ret
+
+
+def verify(args, path, name):
+    """
+    Make sure, that an apk file from the binary cache can be trusted: it must
+    be signed with one of the keys in $WORK/config_apk_keys, its data
+    segment must match the (signed) datahash and its .PKGINFO must match the
+    file name.
+
+    :param path: to the downloaded or cached apk file
+    :param name: file name of the apk in the binary cache entry
+    :raises RuntimeError: when the apk can't be trusted
+    """
+    apk = pmb.parse.apk.control(path)
+    pkginfo = apk["pkginfo"]
+    if (pkginfo.get("pkgname", "") + "-" + pkginfo.get("pkgver", "") +
+            ".apk" != name):
+        raise RuntimeError(name + ": .PKGINFO does not match the file name")
+
+    # Find the key (.SIGN.RSA256.<key>: sha256, .SIGN.RSA.<key>: sha1)
+    signature = apk["signature"]
+    if not signature:
+        raise RuntimeError(name + ": package is not signed")
+    for prefix, digest in [(".SIGN.RSA256.", "-sha256"),
+                           (".SIGN.RSA.", "-sha1")]:
+        if signature["name"].startswith(prefix):
+            key = signature["name"][len(prefix):]
+            break
+    else:
+        raise RuntimeError(name + ": unsupported signature " +
+                           signature["name"])
+    key_path = args.work + "/config_apk_keys/" + key
+    if "/" in key or not os.path.exists(key_path):
+        raise RuntimeError(name + ": signed with an untrusted key: " + key)
+
+    # Verify the signature of the control segment
+    (start, end) = apk["control_range"]
+    with tempfile.TemporaryDirectory(prefix="pmbootstrap") as temp:
+        with open(path, "rb") as handle:
+            handle.seek(start)
+            control = handle.read(end - start)
+        with open(temp + "/control", "wb") as handle:
+            handle.write(control)
+        with open(temp + "/signature", "wb") as handle:
+            handle.write(signature["data"])
+        try:
+            pmb.helpers.run.user(args, ["openssl", "dgst", digest, "-verify",
+                                        key_path, "-signature",
+                                        temp + "/signature",
+                                        temp + "/control"])
+        except RuntimeError:
+            raise RuntimeError(name + ": invalid signature (key: " + key +
+                               ")")
+
+    # Verify the data segment (the rest of the file)
+    if "datahash" not in pkginfo:
+        raise RuntimeError(name + ": .PKGINFO has no datahash")
+    datahash = hashlib.sha256()
+    with open(path, "rb") as handle:
+        handle.seek(end)
+        for block in iter(lambda: handle.read(65536), b""):
+            datahash.update(block)
+    if datahash.hexdigest() != pkginfo["datahash"]:
+        raise RuntimeError(name + ": data does not match the datahash")
+
+
+def restore(args, apkbuild, arch, key):
+    """
+    Copy a package from the binary cache to the local packages folder and
+    index the repository, instead of building it.
+
+    :returns: output path relative to the packages folder
+              ("armhf/ab-1-r2.apk"), or None if the package is not cached
+    """
+    names = files(args, arch, key)
+    output = (arch + "/" + apkbuild["pkgname"] + "-" + apkbuild["pkgver"] +
+              "-r" + apkbuild["pkgrel"] + ".apk")
+    if not names or os.path.basename(output) not in names:
+        logging.verbose(apkbuild["pkgname"] + ": not in binary cache (" +
+                        key + ")")
+        return None
+
+    # Get the files and check them, before using any of them
+    pmb.build.init(args)
+    paths = []
+    try:
+        for name in names:
+            url = args.binary_cache + "/" + arch + "/" + key + "/" + name
+            if is_url(args):
+                url = pmb.helpers.http.download(
+                    args, url, "binary_cache_" + name, loglevel=logging.DEBUG,
+                    timeout=pmb.config.binary_cache_timeout)
+            verify(args, url, name)
+            paths.append(url)
+    except (RuntimeError, OSError) as e:
+        logging.warning("WARNING: Not using " + output + " from the binary"
+                        " cache: " + str(e))
+        return None
+    logging.info("(binary cache) use " + output)
+
+    # Copy them to the packages folder (it belongs to the chroot user)
+    folder = args.work + "/packages/" + arch
+    uid = pmb.config.chroot_uid_user
+    commands = [["mkdir", "-p", folder]]
+    for path, name in zip(paths, names):
+        commands.append(["cp", path, folder + "/" + name])
+    commands.append(["chown", uid + ":" + uid, folder] +
+                    [folder + "/" + name for name in names])
+    pmb.helpers.run.root_batch(args, commands)
+    pmb.build.other.index_repo(args, arch)
+    pmb.build.other.fingerprint_save(args, arch, apkbuild)
+    return output
+
+
+def store(args, apkbuild, arch, key):
+    """
+    Add a package, that has just been built, to the binary cache. Nothing
+    happens when the binary cache is served over HTTP, or when the entry
+    exists already.
+    """
+    if is_url(args):
+        return
+    target = args.binary_cache + "/" + arch + "/" + key
+    if os.path.exists(target):
+        return
+    names = apk_files(args, apkbuild, arch)
+    if not names:
+        return
+    logging.verbose(apkbuild["pkgname"] + ": store in binary cache (" + key +
+                    ")")
+
+    # Write to a temporary folder first, so other pmbootstrap instances using
+    # the same cache never see incomplete entries. It has a unique name, so
+    # leftovers from an interrupted run don't get in the way.
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp = tempfile.mkdtemp(prefix=key + ".", dir=os.path.dirname(target))
+    try:
+        os.chmod(temp, 0o755)
+        for name in names:
+            shutil.copyfile(args.work + "/packages/" + arch + "/" + name,
+                            temp + "/" + name)
+        with open(temp + "/files", "w") as handle:
+            handle.write("\n".join(names) + "\n")
+        os.rename(temp, target)
+    except OSError:
+        # Another instance stored the same entry in the meantime, or writing
+        # failed (e.g. no space left): don't leave the temporary folder behind
+        shutil.rmtree(temp)
+        if not os.path.exists(target):
+            raise
@@ -0,0 +1,225 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import contextlib
+import json
+import logging
+import os
+import time
+
+import pmb.chroot
+
+# Phases of a build, in the order they run. "depends" is the time for
+# resolving and building the dependencies (the dependencies that were built
+# have their own records in the history). "binary_cache" is the time for
+# looking up (and on a hit restoring) the package from the binary cache.
+phases = ["depends", "binary_cache", "init_buildenv", "install_depends",
+          "run_abuild", "finish"]
+
+
+def path(args):
+    """
+    :returns: path to the build history, a JSON file with one build per line
+    """
+    return args.work + "/build_history.jsonl"
+
+
+def start(args, apkbuild, arch, suffix="native", cross=None):
+    """
+    Create a new record for the build history.
+
+    :param cross: None, "native" or "distcc"
+    :returns: the record, pass it to measure() and save()
+    """
+    return {"pkgname": apkbuild["pkgname"],
+            "version": apkbuild["pkgver"] + "-r" + apkbuild["pkgrel"],
+            "arch": arch,
+            "suffix": suffix,
+            "cross": cross,
+            "date": int(time.time()),
+            "time": {},
+            "monotonic": time.monotonic()}
+
+
+@contextlib.contextmanager
+def measure(record, phase):
+    """
+    Measure the wall time of a build phase (use with "with").
+
+    :param record: return value of start(), or None to measure nothing
+    :param phase: one of the phases listed at the top of this file
+    """
+    if record is None:
+        yield
+        return
+    begin = time.monotonic()
+    try:
+        yield
+    finally:
+        duration = time.monotonic() - begin
+        record["time"][phase] = round(record["time"].get(phase, 0) + duration,
+                                      3)
+
+
+def ccache_stats(args, suffix="native"):
+    """
+    Get the cache hits and misses from ccache in a chroot.
+
+    :returns: {"hits": ..., "misses": ...} or None, if ccache is not installed
+    """
+    if not os.path.exists(args.work + "/chroot_" + suffix + "/usr/bin/ccache"):
+        return None
+    output = pmb.chroot.user(args, ["ccache", "-s"], suffix,
+                             return_stdout=True, check=False)
+    if not output:
+        return None
+
+    ret = {"hits": 0, "misses": 0}
+    keys = {"cache hit (direct)": "hits",
+            "cache hit (preprocessed)": "hits",
+            "cache miss": "misses"}
+    for line in output.splitlines():
+        for prefix, key in keys.items():
+            if line.startswith(prefix):
+                value = line[len(prefix):].split()
+                if value and value[0].isdigit():
+                    ret[key] += int(value[0])
+    return ret
+
+
+def save(args, record, output, ccache_before=None, binary_cache=False):
+    """
+    Finish a record and append it to the build history.
+
+    :param record: return value of start()
+    :param output: path of the built package, relative to the packages folder
+    :param ccache_before: return value of ccache_stats() before running abuild
+    :param binary_cache: set to True when the package was not built, but
+                         restored from the binary cache
+    """
+    record["time"]["total"] = round(time.monotonic() -
+                                    record.pop("monotonic"), 3)
+    record["binary_cache"] = binary_cache
+    record["size"] = None
+    if os.path.exists(args.work + "/packages/" + output):
+        record["size"] = os.path.getsize(args.work + "/packages/" + output)
+    record["ccache"] = None
+    if ccache_before:
+        ccache_after = ccache_stats(args, record["suffix"])
+        if ccache_after:
+            record["ccache"] = {key: ccache_after[key] - ccache_before[key]
+                                for key in ccache_before}
+
+    # Append one line, so concurrent builds don't overwrite each other
+    if not os.path.exists(args.work):
+        return
+    with open(path(args), "a") as handle:
+        handle.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def load(args):
+    """
+    Read the build history.
+
+    :returns: list of records (see start() and save()), oldest first
+    """
+    ret = []
+    if not os.path.exists(path(args)):
+        return ret
+    with open(path(args)) as handle:
+        for i, line in enumerate(handle, 1):
+            try:
+                ret.append(json.loads(line))
+            except ValueError:
+                logging.verbose(path(args) + ":" + str(i) + ": ignoring"
+                                " invalid line")
+    return ret
+
+
+def build_time(record):
+    """
+    :returns: seconds spent on building the package itself (all phases except
+              for "depends", which includes building other packages)
+    """
+    return sum(record["time"].get(phase, 0) for phase in phases[1:])
+
+
+def table(records, limit=20):
+    """
+    Summarize the build history: the packages, that took the longest to
+    build the last time, and how their build time changed compared to the
+    average of the builds before. Packages restored from the binary cache are
+    only counted in the "cached" column, they don't affect the build times.
+
+    :param records: return value of load()
+    :param limit: maximum amount of packages to list
+    :returns: the table as string
+    """
+    builds = {}
+    for record in records:
+        key = (record["pkgname"], record["arch"])
+        builds.setdefault(key, []).append(record)
+    if not builds:
+        return "No builds recorded yet.\n"
+
+    rows = []
+    for (pkgname, arch), records_key in builds.items():
+        history = [record for record in records_key
+                   if not record.get("binary_cache")]
+        cached = str(len(records_key) - len(history))
+        if not history:
+            # Only restored from the binary cache so far
+            rows.append((0, [pkgname, arch, records_key[-1]["version"],
+                             records_key[-1]["cross"] or "-", "0", cached,
+                             "-", "-", "-", "-", "-"]))
+            continue
+
+        last = history[-1]
+        seconds = build_time(last)
+        trend = "-"
+        if len(history) > 1:
+            before = sum(build_time(record) for record in history[:-1])
+            before /= len(history) - 1
+            if before:
+                trend = "{:+.0f}%".format((seconds / before - 1) * 100)
+        ccache = "-"
+        if last.get("ccache"):
+            total = last["ccache"]["hits"] + last["ccache"]["misses"]
+            if total:
+                ccache = "{:.0f}%".format(last["ccache"]["hits"] * 100 /
+                                          total)
+        size = "-"
+        if last.get("size") is not None:
+            size = str(last["size"] // 1024) + " KiB"
+        rows.append((seconds, [pkgname, arch, records_key[-1]["version"],
+                               last["cross"] or "-", str(len(history)),
+                               cached, "{:.1f}s".format(seconds), trend,
+                               "{:.1f}s".format(last["time"].get(
+                                   "run_abuild", 0)),
+                               size, ccache]))
+    rows.sort(key=lambda row: row[0], reverse=True)
+
+    header = ["pkgname", "arch", "version", "cross", "builds", "cached",
+              "last", "trend", "abuild", "size", "ccache"]
+    lines = [header] + [row[1] for row in rows[:limit]]
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    ret = ""
+    for line in lines:
+        ret += "  ".join(value.ljust(width) for value, width in
+                         zip(line, widths)).rstrip() + "\n"
+    return ret
@@ -0,0 +1,210 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+
+Incremental indexer for the local package repositories in $WORK/packages.
+It creates the same APKINDEX as "apk index", but only reads the packages,
+that are new or changed since the last index was written.
+"""
+
+import base64
+import glob
+import io
+import logging
+import multiprocessing
+import os
+import tarfile
+
+import pmb.build
+import pmb.chroot
+import pmb.parse.apk
+import pmb.parse.apkindex
+
+# Keys of the .PKGINFO file, that get written to the APKINDEX, in the same
+# order as "apk index" writes them
+pkginfo_keys = [("pkgname", "P"), ("pkgver", "V"), ("arch", "A"),
+                ("filesize", "S"), ("size", "I"), ("pkgdesc", "T"),
+                ("url", "U"), ("license", "L"), ("origin", "o"),
+                ("maintainer", "m"), ("builddate", "t"), ("commit", "c"),
+                ("provider_priority", "k"), ("depend", "D"),
+                ("provides", "p"), ("install_if", "i")]
+
+
+def index_block(path, arch):
+    """
+    Create the APKINDEX block of an apk file.
+
+    :param path: to the .apk file
+    :param arch: the architecture of the repository ("apk index" rewrites
+                 the arch of noarch packages to it)
+    :returns: the block as string, ends with an empty line
+    """
+    apk = pmb.parse.apk.control(path)
+    values = {"arch": arch, "filesize": str(apk["filesize"])}
+    for key, value in apk["pkginfo"].items():
+        if key not in values:
+            values[key] = value
+
+    ret = "C:Q1" + base64.b64encode(apk["checksum"]).decode() + "\n"
+    for key, letter in pkginfo_keys:
+        value = values.get(key)
+        if isinstance(value, list):
+            value = " ".join(value)
+        if value:
+            ret += letter + ":" + value + "\n"
+    return ret + "\n"
+
+
+def index_block_worker(path_arch):
+    """
+    Wrapper around index_block() for multiprocessing.Pool.
+
+    :returns: (path, block or None, error message or None)
+    """
+    (path, arch) = path_arch
+    try:
+        return (path, index_block(path, arch), None)
+    except Exception as e:
+        return (path, None, str(e))
+
+
+def blocks_load(path):
+    """
+    Read the blocks of an existing APKINDEX.
+
+    :param path: to the APKINDEX.tar.gz
+    :returns: { apk file name: block as string, ... }
+    """
+    ret = {}
+    if not os.path.exists(path):
+        return ret
+    with pmb.parse.apkindex.open_apkindex(path) as handle:
+        block = b""
+        values = {}
+        for line in handle:
+            block += line
+            if line == b"\n":
+                if "P" in values and "V" in values:
+                    name = values["P"] + "-" + values["V"] + ".apk"
+                    ret[name] = block.decode()
+                block = b""
+                values = {}
+            elif line[1:2] == b":":
+                values[chr(line[0])] = line[2:-1].decode()
+    return ret
+
+
+def changes(args, arch):
+    """
+    Find out which packages of a local repository need to be read.
+
+    :returns: (blocks, todo, changed)
+              - blocks: { apk file name: block, ... } of the unchanged
+                packages
+              - todo: list of apk paths, that are new or changed
+              - changed: True when the APKINDEX needs to be written
+    """
+    folder = args.work + "/packages/" + arch
+    index = folder + "/APKINDEX.tar.gz"
+    blocks = blocks_load(index)
+    lastmod = os.stat(index).st_mtime_ns if os.path.exists(index) else 0
+
+    ret = {}
+    todo = []
+    for path in sorted(glob.glob(folder + "/*.apk")):
+        name = os.path.basename(path)
+        if name in blocks and os.stat(path).st_mtime_ns < lastmod:
+            ret[name] = blocks[name]
+        else:
+            todo.append(path)
+    changed = bool(todo) or len(ret) != len(blocks) or not lastmod
+    return (ret, todo, changed)
+
+
+def write(path, blocks):
+    """
+    Write an unsigned APKINDEX.tar.gz.
+
+    :param blocks: list of blocks as strings
+    """
+    content = "".join(blocks).encode()
+    with tarfile.open(path, "w:gz") as tar:
+        info = tarfile.TarInfo("APKINDEX")
+        info.size = len(content)
+        info.mode = 0o644
+        tar.addfile(info, io.BytesIO(content))
+    os.chmod(path, 0o644)
+
+
+def update(args, arches):
+    """
+    Update the APKINDEX files of multiple local repositories at once: read
+    all new and changed packages (concurrently with --parse-jobs), write the
+    indexes and sign all of them with one chroot command.
+
+    :param arches: list of architectures, that have a folder in
+                   $WORK/packages
+    """
+    # Find the packages, that need to be read
+    blocks = {}
+    todo = []
+    for arch in arches:
+        (blocks[arch], todo_arch, changed) = changes(args, arch)
+        if changed:
+            todo += [(path, arch) for path in todo_arch]
+        else:
+            logging.debug("(native) index " + arch + " repository: up to"
+                          " date")
+            del blocks[arch]
+    if not blocks:
+        return
+
+    # Read them
+    jobs = min(args.parse_jobs, len(todo))
+    if jobs > 1:
+        context = multiprocessing.get_context("fork")
+        with context.Pool(jobs) as pool:
+            results = pool.map(index_block_worker, todo)
+    else:
+        results = map(index_block_worker, todo)
+    for (path, block, error), (path_todo, arch) in zip(results, todo):
+        if error:
+            raise RuntimeError("Failed to index " + path + ": " + error)
+        blocks[arch][os.path.basename(path)] = block
+
+    # Write the indexes to /tmp of the native chroot, then copy them to the
+    # repositories and sign them as user (the repositories belong to the
+    # user, and only the user has access to the signing key)
+    pmb.build.init(args)
+    commands = []
+    for arch in sorted(blocks.keys()):
+        logging.debug("(native) index " + arch + " repository (" +
+                      str(len(blocks[arch])) + " packages)")
+        temp = "/tmp/APKINDEX_" + arch + ".tar.gz"
+        target = "/home/pmos/packages/pmos/" + arch + "/APKINDEX.tar.gz"
+        write(args.work + "/chroot_native" + temp,
+              [blocks[arch][name] for name in sorted(blocks[arch].keys())])
+        commands += [["cp", temp, target + "_"],
+                     ["abuild-sign", target + "_"],
+                     ["mv", target + "_", target]]
+    pmb.chroot.user_batch(args, commands)
+
+    for arch in blocks.keys():
+        os.remove(args.work + "/chroot_native/tmp/APKINDEX_" + arch +
+                  ".tar.gz")
+        pmb.parse.apkindex.clear_cache(args, args.work + "/packages/" +
+                                       arch + "/APKINDEX.tar.gz")
@@ -17,12 +17,17 @@ You should have received a copy of the GNU General Public License
 along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
 import glob
+import hashlib
 import logging
 import os
 import shlex
 
+import pmb.build._package
+import pmb.build.index
 import pmb.build.other
 import pmb.chroot
+import pmb.config
+import pmb.helpers.aports
 import pmb.helpers.file
 import pmb.helpers.git
 import pmb.helpers.run
@@ -47,22 +52,8 @@ def find_aport(args, package, must_exist=True):
         if "*" in package:
             raise RuntimeError("Invalid pkgname: " + package)
 
-        # Search in packages
-        paths = glob.glob(args.aports + "/*/" + package)
-        if len(paths) > 2:
-            raise RuntimeError("Package " + package + " found in multiple"
-                               " aports subfolders. Please put it only in one"
-                               " folder.")
-        elif len(paths) == 1:
-            ret = paths[0]
-        else:
-            # Search in subpackages
-            for path_current in glob.glob(args.aports + "/*/*/APKBUILD"):
-                apkbuild = pmb.parse.apkbuild(args, path_current)
-                if (package in apkbuild["subpackages"] or
-                        package in apkbuild["provides"]):
-                    ret = os.path.dirname(path_current)
-                    break
+        # Search in packages, subpackages and provides
+        ret = pmb.helpers.aports.find(args, package)
 
     # Crash when necessary
     if ret is None and must_exist:
@@ -74,31 +65,250 @@ def find_aport(args, package, must_exist=True):
     return ret
 
 
+def copy_to_buildpath_diff(aport, build):
+    """
+    Compare an aport folder with the build folder of a chroot, to find out
+    what needs to be updated when copying the aport to the build folder. Files
+    are considered equal when their size, mode and modification time match
+    (they get copied with "cp -p"), symlinks when their targets match.
+
+    Symlinks in the build folder are never followed (the chroot user can
+    create them), they get removed when the aport has something else at
+    their place. Symlinks in the aport folder (also the ones pointing to
+    folders) get copied as symlinks, like "cp -r" does it.
+
+    :param aport: full path to the aport folder
+    :param build: full path to the build folder (does not need to exist)
+    :returns: (remove, mkdir, copy): lists of paths relative to the folders.
+              remove: files and folders, that only exist in the build folder
+              (e.g. "src" and "pkg" from the previous build) or have a
+              different type; mkdir: missing folders; copy: new or changed
+              files and symlinks.
+    """
+    remove = []
+    mkdir = []
+    copy = []
+    for root, dirs, files in os.walk(aport):
+        relroot = os.path.relpath(root, aport)
+        relroot = "" if relroot == "." else relroot + "/"
+
+        # Only look inside real folders: subfolders were checked with
+        # is_dir(follow_symlinks=False) in their parent folder already, and
+        # the ones in mkdir get created from scratch
+        existing = {}
+        if relroot:
+            scan = relroot[:-1] not in mkdir
+        else:
+            scan = os.path.isdir(build) and not os.path.islink(build)
+        if scan:
+            for entry in os.scandir(build + "/" + relroot):
+                existing[entry.name] = entry
+
+        # Copy symlinks to folders instead of descending into them
+        links = [name for name in dirs if os.path.islink(root + "/" + name)]
+        dirs[:] = sorted(name for name in dirs if name not in links)
+
+        for name in dirs:
+            entry = existing.pop(name, None)
+            if entry and not entry.is_dir(follow_symlinks=False):
+                remove.append(relroot + name)
+                entry = None
+            if not entry:
+                mkdir.append(relroot + name)
+
+        for name in sorted(files + links):
+            entry = existing.pop(name, None)
+            path = root + "/" + name
+            if os.path.islink(path):
+                if entry and not (entry.is_symlink() and
+                                  os.readlink(entry.path) ==
+                                  os.readlink(path)):
+                    remove.append(relroot + name)
+                    entry = None
+            elif entry and not entry.is_file(follow_symlinks=False):
+                remove.append(relroot + name)
+                entry = None
+            elif entry:
+                stat = entry.stat(follow_symlinks=False)
+                stat_aport = os.stat(path)
+                if (stat.st_mode != stat_aport.st_mode or
+                        stat.st_size != stat_aport.st_size or
+                        stat.st_mtime_ns != stat_aport.st_mtime_ns):
+                    entry = None
+            if not entry:
+                copy.append(relroot + name)
+
+        remove += [relroot + name for name in sorted(existing.keys())]
+    return (remove, mkdir, copy)
+
+
 def copy_to_buildpath(args, package, suffix="native"):
+    """
+    Update /home/pmos/build in the chroot to have the same content as the
+    aport folder. Only changed files get copied, so this does not get slower
+    with big aports (like kernels with large config files and many patches).
+
+    The build folder belongs to the chroot user, so removing files, creating
+    folders and changing the owner happens inside the chroot (where symlinks
+    can't point outside of it). Only the copying runs on the host system, into
+    folders that have been checked to not be symlinks (see
+    copy_to_buildpath_diff()) or have just been created by root.
+    """
     # Sanity check
     aport = find_aport(args, package)
     if not os.path.exists(aport + "/APKBUILD"):
         raise ValueError("Path does not contain an APKBUILD file:" +
                          aport)
+    chroot = args.work + "/chroot_" + suffix
+    for path in ["/home", "/home/pmos"]:
+        if os.path.islink(chroot + path):
+            raise RuntimeError("Refusing to copy " + package + " to the build"
+                               " folder, because " + chroot + path + " is a"
+                               " symlink")
+
+    # Find out what changed
+    build = chroot + "/home/pmos/build"
+    (remove, mkdir, copy) = copy_to_buildpath_diff(aport, build)
+    if os.path.islink(build) or not os.path.isdir(build):
+        remove = ["."] if os.path.lexists(build) else []
+        mkdir.insert(0, ".")
+    if not remove and not mkdir and not copy:
+        logging.verbose(package + ": build folder is up to date")
+        return
+    logging.verbose(package + ": update build folder (remove: " +
+                    str(len(remove)) + ", mkdir: " + str(len(mkdir)) +
+                    ", copy: " + str(len(copy)) + ")")
+
+    # Remove and create inside the chroot
+    inside = "/home/pmos/build"
+    commands = []
+    if remove:
+        commands.append(["rm", "-rf"] + [os.path.normpath(inside + "/" + path)
+                                         for path in remove])
+    if mkdir:
+        commands.append(["mkdir"] + [os.path.normpath(inside + "/" + path)
+                                     for path in mkdir])
+    if commands:
+        pmb.chroot.root_batch(args, commands, suffix)
+
+    # Copy from the host system, then set the owner inside the chroot
+    if copy:
+        pmb.helpers.run.root_batch(args, [["cp", "-P", "-p",
+                                           aport + "/" + path,
+                                           build + "/" + path]
+                                          for path in copy])
+    if mkdir or copy:
+        uid = pmb.config.chroot_uid_user
+        pmb.chroot.root(args, ["chown", "-h", uid + ":" + uid] +
+                        [os.path.normpath(inside + "/" + path)
+                         for path in mkdir + copy], suffix)
+
+
+def fingerprint_aport(args, aport):
+    """
+    Calculate a hash of the contents of all files in an aport folder (APKBUILD,
+    patches, configs, ...). The result is cached for the current session, as
+    long as the modification times and sizes of the files don't change.
+
+    :param aport: full path to the aport folder
+    :returns: hex string of the hash
+    """
+    files = []
+    for root, dirs, filenames in os.walk(aport):
+        dirs.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(root, filename)
+            stat = os.stat(path)
+            files.append((os.path.relpath(path, aport), stat.st_mtime_ns,
+                          stat.st_size))
+
+    cache = args.cache["fingerprint"]
+    if aport in cache and cache[aport]["files"] == files:
+        return cache[aport]["hash"]
+
+    ret = hashlib.sha256()
+    for relpath, lastmod, size in files:
+        ret.update(relpath.encode() + b"\0" + str(size).encode() + b"\0")
+        with open(aport + "/" + relpath, "rb") as handle:
+            ret.update(handle.read())
+    cache[aport] = {"files": files, "hash": ret.hexdigest()}
+    return cache[aport]["hash"]
+
+
+def fingerprint(args, apkbuild, visited=None):
+    """
+    Calculate the fingerprint of a package: the hash of its aport folder and
+    the fingerprints of all its dependencies, that have an aport (and get
+    built by pmbootstrap). When anything in these aport folders changes, the
+    fingerprint changes as well.
 
-    # Clean up folder
-    build = args.work + "/chroot_" + suffix + "/home/pmos/build"
-    if os.path.exists(build):
-        pmb.chroot.root(args, ["rm", "-rf", "/home/pmos/build"],
-                        suffix=suffix)
+    :param apkbuild: from pmb.parse.apkbuild()
+    :param visited: set of aports, that are already part of the fingerprint
+                    (prevents endless recursion for circular dependencies)
+    :returns: hex string of the hash
+    """
+    aport = find_aport(args, apkbuild["pkgname"])
+    visited = visited or set()
+    visited.add(aport)
+
+    ret = hashlib.sha256(fingerprint_aport(args, aport).encode())
+    for depend in pmb.build._package.get_depends(args, apkbuild):
+        aport_depend = find_aport(args, depend, False)
+        if not aport_depend or aport_depend in visited:
+            continue
+        apkbuild_depend = pmb.parse.apkbuild(args, aport_depend + "/APKBUILD")
+        ret.update(depend.encode() + b"\0" +
+                   fingerprint(args, apkbuild_depend, visited).encode())
+    return ret.hexdigest()
+
+
+def fingerprint_path(args, arch, pkgname):
+    """
+    :returns: path to the recorded fingerprint of a package, that has been
+              built for a specific architecture
+    """
+    return args.work + "/packages/" + arch + "/fingerprints/" + pkgname
+
+
+def fingerprint_load(args, arch, pkgname):
+    """
+    Read the fingerprint, that was recorded when the package was built.
 
-    # Copy aport contents
-    pmb.helpers.run.root(args, ["cp", "-r", aport + "/", build])
-    pmb.chroot.root(args, ["chown", "-R", "pmos:pmos",
-                           "/home/pmos/build"], suffix=suffix)
+    :returns: (version, fingerprint) or None, when it was not recorded
+    """
+    path = fingerprint_path(args, arch, pkgname)
+    if not os.path.exists(path):
+        return None
+    with open(path) as handle:
+        ret = handle.read().split()
+    if len(ret) != 2:
+        logging.verbose("Ignoring invalid fingerprint file: " + path)
+        return None
+    return tuple(ret)
+
+
+def fingerprint_save(args, arch, apkbuild, suffix="native"):
+    """
+    Record the fingerprint of a package after it has been built. The packages
+    folder belongs to the pmos user, so the file gets written inside the
+    chroot.
+    """
+    version = apkbuild["pkgver"] + "-r" + apkbuild["pkgrel"]
+    folder = "/mnt/pmbootstrap-packages/" + arch + "/fingerprints"
+    path = folder + "/" + apkbuild["pkgname"]
+    content = version + " " + fingerprint(args, apkbuild)
+    pmb.chroot.user(args, ["sh", "-c", "mkdir -p " + shlex.quote(folder) +
+                           " && echo " + shlex.quote(content) + " > " +
+                           shlex.quote(path)], suffix)
 
 
 def is_necessary(args, arch, apkbuild, indexes=None):
     """
     Check if the package has already been built. Compared to abuild's check,
     this check also works for different architectures, and it recognizes
-    changed files in an aport folder, even if the pkgver and pkgrel did not
-    change.
+    changed files in an aport folder (and in the aport folders of its
+    dependencies), even if the pkgver and pkgrel did not change. See
+    fingerprint() for details.
 
     :param arch: package target architecture
     :param apkbuild: from pmb.parse.apkbuild()
@@ -132,42 +342,39 @@ def is_necessary(args, arch, apkbuild, indexes=None):
                       ", aport: " + version_new + ")")
         return True
 
+    # c) Aport or dependency aports changed since the package was built
+    recorded = fingerprint_load(args, arch, package) if arch else None
+    if recorded and recorded[0] == version_new:
+        if recorded[1] != fingerprint(args, apkbuild):
+            logging.debug(msg + "Files in the aport folder or in the aport"
+                          " folders of its dependencies have changed")
+            return True
+
     # Aports and binary repo have the same version.
     return False
 
 
 def index_repo(args, arch=None):
     """
-    Recreate the APKINDEX.tar.gz for a specific repo, and clear the parsing
+    Update the APKINDEX.tar.gz for a specific repo, and clear the parsing
     cache for that file for the current pmbootstrap session (to prevent
     rebuilding packages twice, in case the rebuild takes less than a second).
+    Only new and changed packages get read, see pmb.build.index.
 
     :param arch: when not defined, re-index all repos
     """
-    pmb.build.init(args)
-
     if arch:
         paths = [args.work + "/packages/" + arch]
     else:
         paths = glob.glob(args.work + "/packages/*")
 
+    arches = []
     for path in paths:
         if os.path.isdir(path):
-            path_arch = os.path.basename(path)
-            path_repo_chroot = "/home/pmos/packages/pmos/" + path_arch
-            logging.debug("(native) index " + path_arch + " repository")
-            commands = [
-                # Wrap the index command with sh so we can use '*.apk'
-                ["sh", "-c", "apk -q index --output APKINDEX.tar.gz_"
-                 " --rewrite-arch " + shlex.quote(path_arch) + " *.apk"],
-                ["abuild-sign", "APKINDEX.tar.gz_"],
-                ["mv", "APKINDEX.tar.gz_", "APKINDEX.tar.gz"]
-            ]
-            for command in commands:
-                pmb.chroot.user(args, command, working_dir=path_repo_chroot)
+            arches.append(os.path.basename(path))
         else:
             logging.debug("NOTE: Can't build index for: " + path)
-        pmb.parse.apkindex.clear_cache(args, path + "/APKINDEX.tar.gz")
+    pmb.build.index.update(args, arches)
 
 
 def configure_abuild(args, suffix, verify=False):
@@ -0,0 +1,351 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import concurrent.futures
+import logging
+import os
+import threading
+
+import pmb.build._package
+import pmb.build.binary_cache
+import pmb.build.history
+import pmb.build.autodetect
+import pmb.build.other
+import pmb.chroot
+import pmb.config
+import pmb.helpers.repo
+
+
+def plan_package(args, pkgname, arch, force, src, ret, visited):
+    """
+    Add the build jobs of one package and its dependencies to the plan. This
+    walks through the dependencies in the same order as pmb.build.package()
+    builds them.
+
+    :param ret: the plan, that is getting built right now (see plan())
+    :param visited: { (pkgname, arch): set of job keys, ... } for all
+                    packages, that have been looked at already
+    :returns: set of job keys (pkgname, arch), that need to be built before
+              packages depending on this one can be built
+    """
+    key = (pkgname, arch)
+    if key in visited:
+        return visited[key]
+    visited[key] = set()
+
+    # Only build when APKBUILD exists (only use the APKINDEX files, that have
+    # been downloaded already)
+    apkbuild = pmb.build._package.get_apkbuild(args, pkgname, arch, False)
+    if not apkbuild:
+        return visited[key]
+
+    # Dependencies (package arch)
+    pmb.build._package.check_arch(args, apkbuild, arch)
+    after = set()
+    depends = pmb.build._package.get_depends(args, apkbuild)
+    for depend in depends:
+        after |= plan_package(args, depend, arch, False, None, ret, visited)
+
+    # Packages, that are not built, pass on the jobs of their dependencies
+    job_key = (apkbuild["pkgname"], arch)
+    if job_key in ret:
+        visited[key] = {job_key}
+        return visited[key]
+    depends_built = sorted(job[0] for job in after)
+    if not pmb.build._package.is_necessary_warn_depends(args, apkbuild, arch,
+                                                        force, depends_built):
+        visited[key] = after
+        return after
+
+    # Dependencies (native arch, when cross-compiling in the native chroot)
+    suffix = pmb.build.autodetect.suffix(args, apkbuild, arch)
+    cross = pmb.build.autodetect.crosscompile(args, apkbuild, arch, suffix)
+    if cross == "native":
+        for depend in depends:
+            after |= plan_package(args, depend, args.arch_native, False, None,
+                                  ret, visited)
+
+    after.discard(job_key)
+    ret[job_key] = {"pkgname": apkbuild["pkgname"],
+                    "arch": arch,
+                    "suffix": suffix,
+                    "cross": cross,
+                    "force": force,
+                    "src": src,
+                    "apkbuild": apkbuild,
+                    "depends": depends,
+                    "after": after}
+    visited[key] = {job_key}
+    return visited[key]
+
+
+def plan(args, packages, force=False, src=None):
+    """
+    Calculate which packages need to be built, without building anything
+    (this only reads APKBUILDs and APKINDEX files, no chroot gets touched).
+    APKINDEX files are not downloaded or refreshed, use "pmbootstrap update"
+    for that.
+
+    :param packages: list of (pkgname, arch) tuples of the packages to build
+    :param force: build the given packages, even if it is not necessary
+                  (their dependencies only get built when necessary)
+    :param src: override source used to build the given packages with a local
+                folder
+    :returns: ordered dict of the jobs, in the order they would get built
+              one after another (dependencies first):
+              { (pkgname, arch): { "pkgname": ..., "arch": ...,
+                                   "suffix": "native" or "buildroot_...",
+                                   "cross": None, "native" or "distcc",
+                                   "force": ..., "src": ...,
+                                   "apkbuild": ..., "depends": [...],
+                                   "after": set of job keys, that need to be
+                                            built before this one }, ... }
+    """
+    for arch in sorted(set([arch for pkgname, arch in packages] +
+                           [args.arch_native])):
+        for path in pmb.helpers.repo.apkindex_files(args, arch)[1:]:
+            if not os.path.exists(path):
+                logging.warning("WARNING: APKINDEX file for " + arch + " has"
+                                " not been downloaded yet, packages from"
+                                " there are missing in the plan: " + path)
+
+    ret = collections.OrderedDict()
+    visited = {}
+    for pkgname, arch in packages:
+        plan_package(args, pkgname, arch, force, src, ret, visited)
+    return ret
+
+
+def plan_table(jobs):
+    """
+    Format a plan as table, one build per line in the order they would get
+    built one after another.
+
+    :param jobs: return value of plan()
+    :returns: the table as string, or a note if nothing needs to be built
+    """
+    if not jobs:
+        return "Nothing to build, all packages are up to date.\n"
+
+    rows = [["#", "pkgname", "version", "arch", "chroot", "cross", "after"]]
+    for i, job in enumerate(jobs.values(), 1):
+        apkbuild = job["apkbuild"]
+        after = sorted(pkgname + "/" + arch for pkgname, arch in job["after"])
+        rows.append([str(i), job["pkgname"],
+                     apkbuild["pkgver"] + "-r" + apkbuild["pkgrel"],
+                     job["arch"], job["suffix"], job["cross"] or "-",
+                     ",".join(after) or "-"])
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    ret = ""
+    for row in rows:
+        ret += "  ".join(value.ljust(width) for value, width in
+                         zip(row, widths)).rstrip() + "\n"
+    return ret
+
+
+def publish(args, arch, suffix):
+    """
+    Move the packages, that abuild has written to the private folder of a
+    chroot (pmb.config.build_scheduler_repodest), to $WORK/packages/<arch>
+    and update the APKINDEX there. Only call this with the lock held.
+    """
+    source = pmb.config.build_scheduler_repodest + "/pmos/" + arch
+    target = "/home/pmos/packages/pmos/" + arch
+    pmb.chroot.user(args, ["sh", "-c", "mkdir -p " + target + " && mv " +
+                           source + "/*.apk " + target + "/"], suffix)
+    pmb.build.other.index_repo(args, arch)
+
+
+def build_job(args, job, strict, lock):
+    """
+    Build one package of the plan. Everything runs with the lock held (the
+    chroot setup and pmbootstrap's caches are not thread-safe), except for
+    the abuild process itself.
+
+    :returns: output path relative to the packages folder
+    """
+    apkbuild = job["apkbuild"]
+    arch = job["arch"]
+    suffix = job["suffix"]
+    cross = job["cross"]
+    record = pmb.build.history.start(args, apkbuild, arch, suffix, cross)
+
+    # Use the package from the binary cache, if it was built before
+    cache_key = None
+    if args.binary_cache and not job["src"]:
+        with lock:
+            with pmb.build.history.measure(record, "binary_cache"):
+                cache_key = pmb.build.binary_cache.key(args, apkbuild, arch,
+                                                       cross)
+                output = pmb.build.binary_cache.restore(args, apkbuild, arch,
+                                                        cache_key)
+            if output:
+                pmb.build.history.save(args, record, output,
+                                       binary_cache=True)
+        if output:
+            return output
+
+    repodest = pmb.config.build_scheduler_repodest
+    with lock:
+        pmb.build._package.init_buildenv_chroot(args, apkbuild, arch,
+                                                job["depends"], strict, cross,
+                                                suffix, src=job["src"],
+                                                build_native_depends=False,
+                                                record=record)
+        ccache = pmb.build.history.ccache_stats(args, suffix)
+        with pmb.build.history.measure(record, "run_abuild"):
+            pmb.chroot.user(args, ["rm", "-rf", repodest], suffix)
+            (output, cmd, env) = pmb.build._package.prepare_abuild(
+                args, apkbuild, arch, strict, job["force"], cross, suffix,
+                job["src"], repodest)
+    with pmb.build.history.measure(record, "run_abuild"):
+        pmb.chroot.user(args, cmd, suffix, "/home/pmos/build",
+                        auto_init=False, env=env)
+    with lock:
+        with pmb.build.history.measure(record, "finish"):
+            publish(args, arch, suffix)
+            pmb.build._package.finish(args, apkbuild, arch, output, strict,
+                                      suffix)
+        pmb.build.history.save(args, record, output, ccache)
+        if cache_key:
+            pmb.build.binary_cache.store(args, apkbuild, arch, cache_key)
+    return output
+
+
+def resources(job):
+    """
+    Get the chroots, that a job uses. Jobs cross-compiling with distcc use
+    the native chroot as well: the cross-compiler gets installed there and
+    distccd runs there.
+
+    :param job: see plan()
+    :returns: set of chroot suffixes, e.g. {"buildroot_armhf", "native"}
+    """
+    ret = {job["suffix"]}
+    if job["cross"] == "distcc":
+        ret.add("native")
+    return ret
+
+
+def run(args, jobs, parallel=1, strict=False):
+    """
+    Build all jobs of a plan. Up to "parallel" jobs run at the same time, when
+    their dependencies are built already. Jobs using the same chroot never
+    run at the same time (see resources()). Jobs for the same arch in
+    different chroots do, but only one of them updates $WORK/packages/<arch>
+    at a time (see publish()).
+
+    Parsing with multiple processes (--parse-jobs) gets disabled while the
+    jobs run, because forking a process with multiple threads can deadlock.
+
+    :param jobs: return value of plan()
+    :param parallel: maximum amount of jobs running at the same time
+    :returns: list of output paths relative to the packages folder, in the
+              order the builds were finished
+    """
+    lock = threading.Lock()
+    todo = collections.OrderedDict(jobs)
+    logging.info("Build " + str(len(jobs)) + " package(s), up to " +
+                 str(parallel) + " at the same time")
+
+    parse_jobs = args.parse_jobs
+    args.parse_jobs = 1
+    try:
+        ret = run_jobs(args, todo, parallel, strict, lock)
+    finally:
+        args.parse_jobs = parse_jobs
+    return ret
+
+
+def run_jobs(args, todo, parallel, strict, lock):
+    """
+    Run the jobs of a plan in threads, see run().
+
+    :param todo: ordered dict of the jobs, that have not been started yet
+    :returns: see run()
+    """
+    done = set()
+    running = {}
+    ret = []
+    error = None
+    with concurrent.futures.ThreadPoolExecutor(max(parallel, 1)) as pool:
+        while (todo and not error) or running:
+            # Start all jobs, that can run now
+            busy = set()
+            for job in running.values():
+                busy |= resources(job)
+            for key, job in list(todo.items()):
+                if error or len(running) >= parallel:
+                    break
+                if not job["after"] <= done:
+                    continue
+                if resources(job) & busy:
+                    continue
+                del todo[key]
+                busy |= resources(job)
+                future = pool.submit(build_job, args, job, strict, lock)
+                running[future] = job
+
+            if not running:
+                raise RuntimeError("Could not schedule the remaining builds"
+                                   " (circular dependencies?): " +
+                                   ", ".join(job["pkgname"] for job in
+                                             todo.values()))
+
+            # Wait for at least one job to finish
+            finished = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)[0]
+            for future in finished:
+                job = running.pop(future)
+                try:
+                    ret.append(future.result())
+                    done.add((job["pkgname"], job["arch"]))
+                except Exception as e:
+                    logging.info("ERROR: Failed to build " + job["pkgname"] +
+                                 " for " + job["arch"] + ": " + str(e))
+                    error = error or e
+
+    if error:
+        raise error
+    return ret
+
+
+def package(args, packages, force=False, strict=False, src=None,
+            parallel=1):
+    """
+    Build packages and their dependencies with the build scheduler, instead
+    of one after another with pmb.build.package().
+
+    :param packages: list of (pkgname, arch) tuples
+    :param parallel: maximum amount of builds running at the same time
+    :returns: set of (pkgname, arch) of the given packages, that were built
+    """
+    jobs = plan(args, packages, force, src)
+    run(args, jobs, parallel, strict)
+
+    # Do not check the packages again in this session
+    ret = set()
+    for pkgname, arch in packages:
+        pmb.build._package.skip_already_built(args, pkgname, arch)
+    for key in jobs:
+        pmb.build._package.skip_already_built(args, key[0], key[1])
+        if key in packages:
+            ret.add(key)
+    return ret
@@ -18,8 +18,8 @@ along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
 from pmb.chroot.init import init
 from pmb.chroot.mount import mount
-from pmb.chroot.root import root
-from pmb.chroot.user import user
+from pmb.chroot.root import root, root_batch
+from pmb.chroot.user import user, user_batch
 from pmb.chroot.user import exists as user_exists
 from pmb.chroot.shutdown import shutdown
 from pmb.chroot.zap import zap
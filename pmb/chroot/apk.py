@@ -105,13 +105,18 @@ def check_min_version(args, suffix="native"):
     args.cache["apk_min_version_checked"].append(suffix)
 
 
-def install_is_necessary(args, build, arch, package, packages_installed):
+def install_is_necessary(args, build, arch, package, packages_installed,
+                         data_repo=None):
     """
     This function optionally builds an out of date package, and checks if the
     version installed inside a chroot is up to date.
     :param build: Set to true to build the package, if the binary packages are
                   out of date, and it is in the aports folder.
     :param packages_installed: Return value from installed().
+    :param data_repo: the package from the binary repositories, when it has
+                      been looked up already (return value of
+                      pmb.parse.apkindex.package()). Must not be set together
+                      with build, as building may change the repository.
     :returns: True if the package needs to be installed/updated, False otherwise.
     """
     # Build package
@@ -123,7 +128,8 @@ def install_is_necessary(args, build, arch, package, packages_installed):
         return True
 
     # Make sure, that we really have a binary package
-    data_repo = pmb.parse.apkindex.package(args, package, arch, False)
+    if not data_repo:
+        data_repo = pmb.parse.apkindex.package(args, package, arch, False)
     if not data_repo:
         logging.warning("WARNING: Internal error in pmbootstrap," +
                         " package '" + package + "' for " + arch +
@@ -194,12 +200,20 @@ def install(args, packages, suffix="native", build=True):
     arch = pmb.parse.arch.from_chroot_suffix(args, suffix)
     packages_with_depends = pmb.parse.depends.recurse(args, packages, suffix)
 
-    # Filter outdated packages (build them if required)
+    # Build outdated packages if required
+    if build:
+        for package in packages_with_depends:
+            pmb.build.package(args, package, arch)
+
+    # Filter outdated packages (look up all installed ones at once)
     packages_installed = installed(args, suffix)
+    packages_repo = pmb.parse.apkindex.package_many(
+        args, [package for package in packages_with_depends
+               if package in packages_installed], arch, False)
     packages_todo = []
     for package in packages_with_depends:
-        if install_is_necessary(
-                args, build, arch, package, packages_installed):
+        if install_is_necessary(args, False, arch, package, packages_installed,
+                                packages_repo.get(package)):
             packages_todo.append(package)
     if not len(packages_todo):
         return
@@ -251,13 +265,14 @@ def installed(args, suffix="native"):
     Read the list of installed packages (which has almost the same format, as
     an APKINDEX, but with more keys).
 
-    :returns: a dictionary with the following structure:
+    :returns: a dictionary with the following structure (the values are
+              pmb.parse.apkindex.Block objects, used like dictionaries):
               { "postmarketos-mkinitfs":
                 {
                   "pkgname": "postmarketos-mkinitfs"
                   "version": "0.0.4-r10",
-                  "depends": ["busybox-extras", "lddtree", ...],
-                  "provides": ["mkinitfs=0.0.1"]
+                  "depends": ("busybox-extras", "lddtree", ...),
+                  "provides": ("mkinitfs", )
                 }, ...
               }
     """
@@ -55,11 +55,12 @@ def extract(args, flavor, suffix, extra=False):
         inside = "/tmp/initfs-extra-extracted"
         flavor += "-extra"
     outside = args.work + "/chroot_" + suffix + inside
+    commands = []
     if os.path.exists(outside):
         if not pmb.helpers.cli.confirm(args, "Extraction folder " + outside +
                                        " already exists. Do you want to overwrite it?"):
             raise RuntimeError("Aborted!")
-        pmb.chroot.root(args, ["rm", "-r", inside], suffix)
+        commands.append(["rm", "-r", inside])
 
     # Extraction script (because passing a file to stdin is not allowed
     # in pmbootstrap's chroot/shell functions for security reasons)
@@ -69,15 +70,14 @@ def extract(args, flavor, suffix, extra=False):
             "cd " + inside + " && cpio -i < _initfs\n")
 
     # Extract
-    commands = [["mkdir", "-p", inside],
-                ["cp", "/boot/initramfs-" + flavor, inside + "/_initfs.gz"],
-                ["gzip", "-d", inside + "/_initfs.gz"],
-                ["cat", "/tmp/_extract.sh"],  # for the log
-                ["sh", "/tmp/_extract.sh"],
-                ["rm", "/tmp/_extract.sh", inside + "/_initfs"]
-                ]
-    for command in commands:
-        pmb.chroot.root(args, command, suffix)
+    commands += [["mkdir", "-p", inside],
+                 ["cp", "/boot/initramfs-" + flavor, inside + "/_initfs.gz"],
+                 ["gzip", "-d", inside + "/_initfs.gz"],
+                 ["cat", "/tmp/_extract.sh"],  # for the log
+                 ["sh", "/tmp/_extract.sh"],
+                 ["rm", "/tmp/_extract.sh", inside + "/_initfs"]
+                 ]
+    pmb.chroot.root_batch(args, commands, suffix)
 
     # Return outside path for logging
     return outside
@@ -88,6 +88,34 @@ def root(args, cmd, suffix="native", working_dir="/", log=True,
     executables = executables_absolute_path()
     cmd_chroot = [executables["chroot"], chroot, "/bin/sh", "-c",
                   pmb.helpers.run.flat_cmd(cmd, working_dir)]
+
+    # The persistent root helper does not need the host shell around it:
+    # cmd_env: ["env", "-i", "PATH=...", "/sbin/chroot", "/..._native", ...]
+    if pmb.helpers.run.use_helper(args, log):
+        cmd_env = ["env", "-i"]
+        for key, value in env_all.items():
+            cmd_env.append(key + "=" + value)
+        return pmb.helpers.run.core(args, cmd_env + cmd_chroot, msg, log,
+                                    return_stdout, check, helper=True)
     cmd_sudo = ["sudo", "env", "-i", executables["sh"], "-c",
                 pmb.helpers.run.flat_cmd(cmd_chroot, env=env_all)]
     return pmb.helpers.run.core(args, cmd_sudo, msg, log, return_stdout, check)
+
+
+def root_batch(args, cmds, suffix="native", working_dir="/", auto_init=True,
+               env={}):
+    """
+    Run a list of commands inside a chroot as root, entering the chroot only
+    once. They run in order and the first failing command raises a
+    RuntimeError, see pmb.helpers.run.batch().
+
+    :param cmds: list of commands, e.g. [["mkdir", "a"], ["touch", "a/b"]]
+    :param suffix: of the chroot to execute code in
+    :param working_dir: path inside chroot where the commands should run
+    :param auto_init: automatically initialize the chroot
+    :param env: dict of environment variables to be passed to the commands,
+                e.g. {"JOBS": "5"}
+    """
+    pmb.helpers.run.batch(cmds, lambda cmd: pmb.chroot.root(
+        args, cmd, suffix, working_dir, auto_init=auto_init, env=env),
+        "(" + suffix + ") % ")
@@ -46,6 +46,25 @@ def user(args, cmd, suffix="native", working_dir="/", log=True,
                            auto_init, return_stdout, check)
 
 
+def user_batch(args, cmds, suffix="native", working_dir="/", auto_init=True,
+               env={}):
+    """
+    Run a list of commands inside a chroot as "user", entering the chroot only
+    once. They run in order and the first failing command raises a
+    RuntimeError, see pmb.helpers.run.batch().
+
+    :param cmds: list of commands, e.g. [["mkdir", "a"], ["touch", "a/b"]]
+    :param suffix: of the chroot to execute code in
+    :param working_dir: path inside chroot where the commands should run
+    :param auto_init: automatically initialize the chroot
+    :param env: dict of environment variables to be passed to the commands,
+                e.g. {"JOBS": "5"}
+    """
+    pmb.helpers.run.batch(cmds, lambda cmd: pmb.chroot.user(
+        args, cmd, suffix, working_dir, auto_init=auto_init, env=env),
+        "(" + suffix + ") % ")
+
+
 def exists(args, username, suffix="native"):
     """
     Checks if username exists in the system
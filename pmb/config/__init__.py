@@ -45,9 +45,10 @@ apk_tools_static_min_version = "2.9.0-r0"
 work_version = "1"
 
 # Only save keys to the config file, which we ask for in 'pmbootstrap init'.
-config_keys = ["ccache_size", "device", "extra_packages", "hostname", "jobs",
-               "keymap", "nonfree_firmware", "nonfree_userland",
-               "qemu_native_mesa_driver", "timezone", "ui", "user", "work"]
+config_keys = ["binary_cache", "ccache_size", "device", "extra_packages",
+               "hostname", "jobs", "keymap", "nonfree_firmware",
+               "nonfree_userland", "qemu_native_mesa_driver", "timezone", "ui",
+               "user", "work"]
 
 # Config file/commandline default values
 # $WORK gets replaced with the actual value for args.work (which may be
@@ -55,6 +56,7 @@ config_keys = ["ccache_size", "device", "extra_packages", "hostname", "jobs",
 defaults = {
     "alpine_version": "edge",  # alternatively: latest-stable
     "aports": os.path.normpath(pmb_src + "/aports"),
+    "binary_cache": "",
     "ccache_size": "5G",
     # aes-xts-plain64 would be better, but this is not supported on LineageOS
     # kernel configs
@@ -106,6 +108,11 @@ chroot_path = ":".join([
 # for the chroot executable may not be in the PATH (Debian).
 chroot_host_path = os.environ["PATH"] + ":/usr/sbin/"
 
+# Maximum number of commands, that pmb.helpers.run.batch() runs with one shell.
+# The shell exits with the number of the failed command, so it must be lower
+# than the exit codes with special meanings (126 and above).
+batch_commands_max = 125
+
 # Folders, that get mounted inside the chroot
 # $WORK gets replaced with args.work
 # $ARCH gets replaced with the chroot architecture (eg. x86_64, armhf)
@@ -143,6 +150,28 @@ chroot_device_nodes = [
 # You can force-update them with 'pmbootstrap update'.
 apkindex_retention_time = 4
 
+# Parsed APKINDEX files get stored in $WORK/cache_apkindex_parsed, so they do
+# not need to be parsed again in the next pmbootstrap call. Increase this
+# number whenever the structure of the parsed data changes.
+apkindex_cache_version = "2"
+
+# Parsed APKBUILDs get stored in $WORK/cache_apkbuild_parsed.pickle, same
+# as above (increase when the structure of pmb.parse.apkbuild() changes).
+apkbuild_cache_version = "1"
+
+# Index of all pkgnames, subpackages and provides in the aports folder, stored
+# in $WORK/cache_aports_index (increase when its structure changes).
+aports_index_version = "1"
+
+# Version of the binary cache keys (see pmb/build/binary_cache.py). Increase
+# this number, whenever the way packages get built changes in a way, that
+# makes packages from the binary cache unusable.
+binary_cache_version = "1"
+
+# Seconds to wait for the binary cache, when it is served over HTTP. When it
+# does not answer in time, the package gets built locally instead.
+binary_cache_timeout = 10
+
 #
 # BUILD
 #
@@ -160,6 +189,12 @@ build_packages = ["abuild", "build-base", "ccache"]
 # the native chroot and a cross-compiler, without using distcc
 build_cross_native = ["linux-*", "arch-bin-masquerade"]
 
+# Folder inside the chroots, where abuild writes the packages to when running
+# with the build scheduler (pmb/build/scheduler.py). Builds for the same arch
+# run at the same time in different chroots, so they must not update the
+# APKINDEX of $WORK/packages/$ARCH themselves.
+build_scheduler_repodest = "/home/pmos/packages-scheduler"
+
 # Necessary kernel config options
 necessary_kconfig_options = {
     "all": {
@@ -86,15 +86,15 @@ def odin(args, flavor, folder):
                 ["sh", "/tmp/_odin.sh"],
                 ["rm", "/tmp/_odin.sh"]
                 ]
-    for command in commands:
-        pmb.chroot.root(args, command, suffix)
+    pmb.chroot.root_batch(args, commands, suffix)
 
     # Move Odin flashable tar to native chroot and cleanup temp folder
     pmb.chroot.user(args, ["mkdir", "-p", "/home/pmos/rootfs"])
-    pmb.chroot.root(args, ["mv", "/mnt/rootfs_" + args.device + temp_folder +
-                           "/" + odin_device_tar_md5, "/home/pmos/rootfs/"]),
-    pmb.chroot.root(args, ["chown", "pmos:pmos",
-                           "/home/pmos/rootfs/" + odin_device_tar_md5])
+    pmb.chroot.root_batch(args, [["mv", "/mnt/rootfs_" + args.device +
+                                  temp_folder + "/" + odin_device_tar_md5,
+                                  "/home/pmos/rootfs/"],
+                                 ["chown", "pmos:pmos", "/home/pmos/rootfs/" +
+                                  odin_device_tar_md5]])
     pmb.chroot.root(args, ["rmdir", temp_folder], suffix)
 
     # Create the symlink
@@ -0,0 +1,171 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import glob
+import hashlib
+import logging
+import os
+
+import pmb.config
+import pmb.helpers.cache
+import pmb.parse
+
+
+def index_path(args):
+    """
+    :returns: path to the persistent name index of the aports folder
+    """
+    key = hashlib.sha1(os.path.realpath(args.aports).encode()).hexdigest()
+    return args.work + "/cache_aports_index/" + key + ".pickle"
+
+
+def folders_lastmod(args):
+    """
+    Get the last modified timestamps of the aports subfolders (main, device,
+    ...). They change when an aport gets added or removed.
+
+    :returns: { folder: lastmod, ... }
+    """
+    ret = {}
+    for folder in glob.glob(args.aports + "/*"):
+        if os.path.isdir(folder):
+            ret[folder] = os.stat(folder).st_mtime_ns
+    return ret
+
+
+def index_load(args):
+    """
+    Load the persistent name index. Broken or missing index files result in
+    an empty index, that gets filled by index_update().
+
+    :returns: see index_update()
+    """
+    ret = pmb.helpers.cache.load(index_path(args),
+                                 pmb.config.aports_index_version)
+    return ret or {"aports": {}, "folders": {}, "pkgnames": {}, "names": {}}
+
+
+def index_save(args, index):
+    """
+    Write the persistent name index.
+    """
+    if not os.path.exists(args.work):
+        return
+    pmb.helpers.cache.save(index_path(args), pmb.config.aports_index_version,
+                           index)
+
+
+def index_update(args, index):
+    """
+    Parse the APKBUILDs of new and changed aports, remove deleted aports and
+    rebuild the lookup tables of the index.
+
+    :param index: return value of index_load()
+    :returns: True when the index was changed, False otherwise
+    """
+    aports = index["aports"]
+    found = set()
+    todo = {}
+    for path in sorted(glob.glob(args.aports + "/*/*/APKBUILD")):
+        aport = os.path.dirname(path)
+        lastmod = os.stat(path).st_mtime_ns
+        found.add(aport)
+        if aport not in aports or aports[aport]["lastmod"] != lastmod:
+            todo[path] = lastmod
+
+    # Broken APKBUILDs can still be found by their folder name
+    changed = bool(todo)
+    (apkbuilds, errors) = pmb.parse.apkbuild_all(args, list(todo))
+    for path, error in errors.items():
+        logging.warning("WARNING: Failed to parse " + path + ": " + error)
+    for path, lastmod in todo.items():
+        names = []
+        apkbuild = apkbuilds.get(path)
+        if apkbuild:
+            names = apkbuild["subpackages"] + apkbuild["provides"]
+        aports[os.path.dirname(path)] = {"lastmod": lastmod, "names": names}
+
+    for aport in list(aports.keys()):
+        if aport not in found:
+            del aports[aport]
+            changed = True
+
+    folders = folders_lastmod(args)
+    if not changed and index["folders"] == folders:
+        return False
+    index["folders"] = folders
+
+    # Lookup tables. The first aport (sorted by path) wins for subpackages
+    # and provides, just like the order of glob() did before.
+    index["pkgnames"] = {}
+    index["names"] = {}
+    for aport in sorted(aports.keys()):
+        pkgname = os.path.basename(aport)
+        index["pkgnames"].setdefault(pkgname, []).append(aport)
+        for name in aports[aport]["names"]:
+            index["names"].setdefault(name, aport)
+    return True
+
+
+def index(args):
+    """
+    Get the name index of the aports folder. It gets loaded and updated only
+    once per session (we assume, that the aports don't change in one
+    pmbootstrap call), except for added and removed aports (see find()).
+
+    :returns: { "aports": { aport: {"lastmod": ..., "names": [...]}, ... },
+                "folders": see folders_lastmod(),
+                "pkgnames": { pkgname: [aport, ...], ... },
+                "names": { subpackage_or_provide: aport, ... }}
+    """
+    cache = args.cache["aports_index"]
+    if args.aports not in cache:
+        ret = index_load(args)
+        if index_update(args, ret):
+            index_save(args, ret)
+        cache[args.aports] = ret
+    return cache[args.aports]
+
+
+def find(args, package):
+    """
+    Find the aport, that provides a certain package, subpackage or provides
+    entry in its APKBUILD.
+
+    :returns: the full path to the aport folder, or None when not found
+    """
+    ret = index(args)
+    for retry in [False, True]:
+        if retry:
+            # Update the index when aports were added or removed
+            if ret["folders"] == folders_lastmod(args):
+                break
+            logging.verbose("Aports were added or removed, updating index")
+            if index_update(args, ret):
+                index_save(args, ret)
+
+        aports = ret["pkgnames"].get(package)
+        if aports:
+            if len(aports) > 1:
+                raise RuntimeError("Package " + package + " found in multiple"
+                                   " aports subfolders. Please put it only in"
+                                   " one folder.")
+            return aports[0]
+        if package in ret["names"]:
+            return ret["names"][package]
+    return None
@@ -0,0 +1,72 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import logging
+import os
+import pickle
+import tempfile
+
+
+def load(path, version):
+    """
+    Load a persistent cache file, that has been written with save().
+
+    :param path: full path to the cache file
+    :param version: expected version of the cached data structure (from
+                    pmb.config, e.g. pmb.config.apkindex_cache_version)
+    :returns: the cached data, or None when the file does not exist, has been
+              written with another version or is broken (e.g. from a full
+              disk)
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as handle:
+            cache = pickle.load(handle)
+    except Exception as e:
+        logging.verbose("Failed to load cache file " + path + ": " + str(e))
+        return None
+    if not isinstance(cache, dict) or cache.get("version") != version:
+        logging.verbose("Cache file has a different version: " + path)
+        return None
+    return cache["data"]
+
+
+def save(path, version, data):
+    """
+    Write a persistent cache file. It gets written to a temporary file in the
+    same folder first and then renamed, so concurrent pmbootstrap calls (and
+    threads) never read half written cache files.
+
+    :param path: full path to the cache file, missing folders get created
+    :param version: version of the cached data structure, see load()
+    :param data: any object, that can be pickled
+    """
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    (handle, temp) = tempfile.mkstemp(prefix=os.path.basename(path) + ".",
+                                      dir=folder)
+    try:
+        with os.fdopen(handle, "wb") as handle:
+            pickle.dump({"version": version, "data": data}, handle,
+                        pickle.HIGHEST_PROTOCOL)
+        os.chmod(temp, 0o644)
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
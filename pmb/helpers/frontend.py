@@ -28,6 +28,8 @@ import sys
 import pmb.aportgen
 import pmb.build
 import pmb.build.autodetect
+import pmb.build.history
+import pmb.build.scheduler
 import pmb.config
 import pmb.chroot
 import pmb.chroot.initfs
@@ -40,6 +42,7 @@ import pmb.helpers.repo
 import pmb.helpers.run
 import pmb.install
 import pmb.parse
+import pmb.parse.depends
 import pmb.qemu
 
 
@@ -112,7 +115,7 @@ def aportgen(args):
 
 def build(args):
     # Strict mode: zap everything
-    if args.strict:
+    if args.strict and not args.plan:
         pmb.chroot.zap(args, False)
 
     # Detect old usage for device- packages
@@ -127,10 +130,29 @@ def build(args):
         raise RuntimeError("Invalid path specified for --src: " + src)
 
     # Build all packages
+    packages = []
     for package in args.packages:
         arch_package = args.arch or pmb.build.autodetect.arch(args, package)
-        if not pmb.build.package(args, package, arch_package, force,
+        packages.append((package, arch_package))
+    if args.plan:
+        jobs = pmb.build.scheduler.plan(args, packages, force, src)
+        print(pmb.build.scheduler.plan_table(jobs), end="")
+
+        # Don't write the "Done" message
+        pmb.helpers.logging.disable()
+        return
+    if args.parallel > 1:
+        built = pmb.build.scheduler.package(args, packages, force, args.strict,
+                                            src, args.parallel)
+    else:
+        built = set()
+        for package, arch_package in packages:
+            if pmb.build.package(args, package, arch_package, force,
                                  args.strict, src=src):
+                built.add((package, arch_package))
+
+    for package, arch_package in packages:
+        if (package, arch_package) not in built:
             logging.info("NOTE: Package '" + package + "' is up to date. Use"
                          " 'pmbootstrap build " + package + " --force'"
                          " if needed.")
@@ -305,7 +327,21 @@ def apkindex_parse(args):
             raise RuntimeError("Package not found in the APKINDEX: " +
                                args.package)
         result = result[args.package]
-    print(json.dumps(result, indent=4))
+    print(json.dumps(result, indent=4, default=dict))
+
+
+def deptree(args):
+    suffix = "native"
+    if args.arch != args.arch_native:
+        suffix = "buildroot_" + args.arch
+    graph = pmb.parse.depends.graph(args, args.packages, suffix)
+    if args.format == "dot":
+        print(pmb.parse.depends.graph_dot(graph), end="")
+    else:
+        print(json.dumps(graph, indent=4, default=dict))
+
+    # Don't write the "Done" message
+    pmb.helpers.logging.disable()
 
 
 def pkgrel_bump(args):
@@ -335,6 +371,15 @@ def shutdown(args):
 
 
 def stats(args):
+    # Build history
+    if args.view == "builds":
+        records = pmb.build.history.load(args)
+        print(pmb.build.history.table(records, args.limit), end="")
+
+        # Don't write the "Done" message
+        pmb.helpers.logging.disable()
+        return
+
     # Chroot suffix
     suffix = "native"
     if args.arch != args.arch_native:
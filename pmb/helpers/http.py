@@ -24,9 +24,12 @@ import urllib.request
 import pmb.helpers.run
 
 
-def download(args, url, prefix, cache=True, loglevel=logging.INFO):
+def download(args, url, prefix, cache=True, loglevel=logging.INFO,
+             timeout=None):
     """
     Download a file to disk.
+
+    :param timeout: seconds to wait for the server (default: no timeout)
     """
     # Create cache folder
     if not os.path.exists(args.work + "/cache_http"):
@@ -43,7 +46,13 @@ def download(args, url, prefix, cache=True, loglevel=logging.INFO):
 
     # Download the file
     logging.log(loglevel, "Download " + url)
-    with urllib.request.urlopen(url) as response:
-        with open(path, "wb") as handle:
-            shutil.copyfileobj(response, handle)
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            with open(path, "wb") as handle:
+                shutil.copyfileobj(response, handle)
+    except OSError:
+        # Don't keep incomplete downloads in the cache
+        if os.path.exists(path):
+            os.remove(path)
+        raise
     return path
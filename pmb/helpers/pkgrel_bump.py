@@ -16,7 +16,6 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
-import glob
 import logging
 import os
 
@@ -52,7 +51,7 @@ def package(args, pkgname, reason="", dry=False):
     pmb.helpers.file.replace(path, old, new)
 
     # Verify
-    del(args.cache["apkbuild"][path])
+    pmb.parse._apkbuild.clear_cache(args, path)
     apkbuild = pmb.parse.apkbuild(args, path)
     if int(apkbuild["pkgrel"]) != pkgrel_new:
         raise RuntimeError("Failed to bump pkgrel for package '" + pkgname +
@@ -84,25 +83,21 @@ def auto_apkindex_files(args):
     return ret
 
 
-def auto_apkindex_package(args, pkgname, aport_version, apkindex, arch,
-                          dry=False):
+def auto_apkindex_package(args, pkgname, aport_version, binary, apkindex,
+                          arch, dry=False):
     """
     Bump the pkgrel of a specific package if it is outdated in the given
     APKINDEX.
 
     :param pkgname: name of the package
     :param aport_version: combination of pkgver and pkgrel (e.g. "1.23-r1")
+    :param binary: the package from the APKINDEX (return value of
+                   pmb.parse.apkindex.package())
     :param apkindex: path to the APKINDEX.tar.gz file
     :param arch: the architecture, e.g. "armhf"
     :param dry: don't modify the APKBUILD, just print the message
     :returns: True when there was an APKBUILD that needed to be changed.
     """
-    # Binary package
-    binary = pmb.parse.apkindex.package(args, pkgname, must_exist=False,
-                                        indexes=[apkindex])
-    if not binary:
-        return
-
     # Skip when aport version != binary package version
     compare = pmb.parse.version.compare(aport_version,
                                         binary["version"])
@@ -123,9 +118,9 @@ def auto_apkindex_package(args, pkgname, aport_version, apkindex, arch,
     logging.verbose(pkgname + ": checking depends: " +
                     ",".join(binary["depends"]))
     missing = []
-    for depend in binary["depends"]:
-        providers = pmb.parse.apkindex.providers(args, depend, arch,
-                                                 must_exist=False)
+    depends_providers = pmb.parse.apkindex.providers_many(
+        args, binary["depends"], arch, must_exist=False)
+    for depend, providers in depends_providers.items():
         if providers == {}:
             # We're only interested in missing depends starting with "so:"
             # (which means dynamic libraries that the package was linked
@@ -148,16 +143,27 @@ def auto(args, dry=False):
     # Get APKINDEX files
     arch_apkindexes = auto_apkindex_files(args)
 
-    # Iterate over aports
+    # Versions of all aports
+    aport_versions = {}
+    (apkbuilds, errors) = pmb.parse.apkbuild_all(args)
+    for path, error in sorted(errors.items()):
+        logging.warning("WARNING: Skipping " + path + ": " + error)
+    for path, apkbuild in apkbuilds.items():
+        pkgname = os.path.basename(os.path.dirname(path))
+        aport_versions[pkgname] = (apkbuild["pkgver"] + "-r" +
+                                   apkbuild["pkgrel"])
+
+    # Look up all aports in each APKINDEX at once
     ret = False
-    for aport in glob.glob(args.aports + "/*/*"):
-        pkgname = os.path.basename(aport)
-        aport = pmb.parse.apkbuild(args, aport + "/APKBUILD")
-        aport_version = aport["pkgver"] + "-r" + aport["pkgrel"]
-
-        for arch, apkindexes in arch_apkindexes.items():
-            for apkindex in apkindexes:
-                if auto_apkindex_package(args, pkgname, aport_version, apkindex,
-                                         arch, dry):
+    for arch, apkindexes in arch_apkindexes.items():
+        for apkindex in apkindexes:
+            binaries = pmb.parse.apkindex.package_many(
+                args, list(aport_versions), must_exist=False,
+                indexes=[apkindex])
+            for pkgname, aport_version in aport_versions.items():
+                binary = binaries[pkgname]
+                if binary and auto_apkindex_package(args, pkgname,
+                                                    aport_version, binary,
+                                                    apkindex, arch, dry):
                     ret = True
     return ret
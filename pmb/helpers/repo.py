@@ -21,6 +21,7 @@ import hashlib
 import logging
 import pmb.helpers.http
 import pmb.helpers.run
+import pmb.parse.apkindex
 
 
 def hash(url, length=8):
@@ -168,6 +169,7 @@ def update(args, arch=None, force=False, existing_only=False):
         if not os.path.exists(target_folder):
             pmb.helpers.run.root(args, ["mkdir", "-p", target_folder])
         pmb.helpers.run.root(args, ["cp", temp, target])
+        pmb.parse.apkindex.clear_cache(args, target)
 
     return True
 
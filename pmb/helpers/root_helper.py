@@ -0,0 +1,166 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+
+Persistent root helper (opt-in with --root-helper): instead of running every
+command as root with its own sudo call, start this file once with sudo and
+send it the commands over a pipe. Each request and response is one JSON line:
+
+    request:  {"cmd": [...], "cwd": "/path", "stdout": true}
+    response: {"code": 0, "stdout": "<base64>"}
+
+The stdout of the commands gets returned in the response when requested,
+otherwise it goes to the stderr of the helper, which is the pmbootstrap log
+file. The helper exits when its stdin gets closed: stop() does that at the
+end of pmbootstrap's main(), and checks the exit code. When pmbootstrap
+crashes instead, stdin gets closed as pmbootstrap exits.
+
+This file only imports modules from the Python standard library, because it
+gets executed as root in isolated mode, where pmb is not in sys.path.
+"""
+
+import base64
+import json
+import logging
+import os
+import subprocess
+import sys
+
+
+def serve(stdin, stdout):
+    """
+    Run the commands of all requests (helper side of the protocol).
+
+    :param stdin: binary file object to read the requests from
+    :param stdout: binary file object to write the responses to
+    """
+    stdout.write(b'{"ready": true}\n')
+    stdout.flush()
+    for line in stdin:
+        request = json.loads(line.decode())
+        try:
+            process = subprocess.run(request["cmd"], cwd=request["cwd"],
+                                     stdin=subprocess.DEVNULL,
+                                     stdout=(subprocess.PIPE if
+                                             request["stdout"] else 2),
+                                     stderr=2)
+            (code, output) = (process.returncode, process.stdout or b"")
+        except OSError as e:
+            # Same as a shell would do, e.g. when the command does not exist
+            sys.stderr.write("root helper: " + str(e) + "\n")
+            sys.stderr.flush()
+            (code, output) = (127, b"")
+        response = {"code": code,
+                    "stdout": base64.b64encode(output).decode()}
+        stdout.write(json.dumps(response).encode() + b"\n")
+        stdout.flush()
+
+
+def start_cmd():
+    """
+    :returns: the command to start a new helper process
+    """
+    return ["sudo", sys.executable, "-I", os.path.realpath(__file__)]
+
+
+def start(args):
+    """
+    Start a new helper process. sudo may ask for the password here, like it
+    would do for the first command run as root without the helper.
+
+    :returns: process handler
+    """
+    args.logfd.flush()
+    process = subprocess.Popen(start_cmd(), stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=args.logfd)
+    if process.stdout.readline() != b'{"ready": true}\n':
+        process.wait()
+        raise RuntimeError("Failed to start the root helper process (exit"
+                           " code: " + str(process.returncode) + ")")
+    logging.debug("Started root helper process with PID " + str(process.pid))
+    return process
+
+
+def run(args, cmd, return_stdout=False):
+    """
+    Run a command as root with a helper process. Multiple threads can run
+    commands at the same time, each one gets its own helper process (they are
+    reused, and only started when all existing ones are busy).
+
+    :param cmd: command as list, e.g. ["echo", "string with spaces"]
+    :param return_stdout: return the stdout of the command, instead of
+                          writing it to the log
+    :returns: stdout as bytes when return_stdout is True, None otherwise
+    :raises subprocess.CalledProcessError: when the command fails (just like
+                                           subprocess.check_call() would do)
+    """
+    idle = args.cache["root_helper"]
+    try:
+        process = idle.pop()
+    except IndexError:
+        process = start(args)
+
+    # Send the request, the output of the command gets appended to the log
+    request = {"cmd": cmd, "cwd": os.getcwd(), "stdout": return_stdout}
+    args.logfd.flush()
+    try:
+        process.stdin.write(json.dumps(request).encode() + b"\n")
+        process.stdin.flush()
+        line = process.stdout.readline()
+    except BrokenPipeError:
+        line = b""
+    if not line:
+        process.wait()
+        raise RuntimeError("The root helper process (PID " +
+                           str(process.pid) + ") exited unexpectedly")
+    idle.append(process)
+
+    response = json.loads(line.decode())
+    output = base64.b64decode(response["stdout"])
+    if response["code"]:
+        raise subprocess.CalledProcessError(response["code"], cmd, output)
+    return output if return_stdout else None
+
+
+def stop(args):
+    """
+    Stop all idle helper processes of this session.
+
+    :raises RuntimeError: when a helper process did not exit cleanly
+    """
+    idle = args.cache["root_helper"]
+    failed = []
+    while idle:
+        process = idle.pop()
+        process.stdin.close()
+        process.wait()
+        process.stdout.close()
+        logging.debug("Root helper process with PID " + str(process.pid) +
+                      " exited with code " + str(process.returncode))
+        if process.returncode:
+            failed.append(process)
+    if failed:
+        raise RuntimeError("The root helper process (PID " +
+                           str(failed[0].pid) + ") exited with code " +
+                           str(failed[0].returncode))
+
+
+if __name__ == "__main__":
+    try:
+        serve(sys.stdin.buffer, sys.stdout.buffer)
+    except KeyboardInterrupt:
+        pass
@@ -21,9 +21,12 @@ import subprocess
 import logging
 import os
 
+import pmb.config
+import pmb.helpers.root_helper
+
 
 def core(args, cmd, log_message, log, return_stdout, check=True,
-         working_dir=None, background=False):
+         working_dir=None, background=False, helper=False):
     """
     Run the command and write the output to the log.
 
@@ -40,6 +43,9 @@ def core(args, cmd, log_message, log, return_stdout, check=True,
     :param working_dir: path in host system where the command should run
     :param background: run the process in the background and return the process
                        handler
+    :param helper: run the command as root with the persistent root helper
+                   (see pmb/helpers/root_helper.py), only works with log=True
+                   and background=False
     :returns: * stdout when return_stdout is True
               * process handler when background is True
               * None otherwise
@@ -60,7 +66,13 @@ def core(args, cmd, log_message, log, return_stdout, check=True,
         logging.debug("Started process in background with PID " + str(ret.pid))
     else:
         try:
-            if log:
+            if helper:
+                ret = pmb.helpers.root_helper.run(args, cmd, return_stdout)
+                if return_stdout:
+                    ret = ret.decode("utf-8")
+                    args.logfd.write(ret)
+                args.logfd.flush()
+            elif log:
                 if return_stdout:
                     ret = subprocess.check_output(cmd).decode("utf-8")
                     args.logfd.write(ret)
@@ -117,6 +129,66 @@ def flat_cmd(cmd, working_dir=None, env={}):
     return ret
 
 
+def use_helper(args, log=True, background=False):
+    """
+    Check if a command should run as root with the persistent root helper.
+    Commands, that write to pmbootstrap's stdout (log=False, e.g. because
+    they are interactive) and background processes always run with sudo.
+
+    :returns: True when enabled with --root-helper and the command can use it
+    """
+    return args.root_helper and log and not background
+
+
+def flat_batch(cmds):
+    """
+    Convert a list of commands into one shell script, that runs them in order
+    and stops at the first failing one. Each command gets written to the
+    output (the log) before it runs, and the exit code of a failing command
+    gets written after it.
+
+    :param cmds: list of commands, e.g. [["mkdir", "a"], ["touch", "a/b"]]
+    :returns: the script as string. It exits with the number of the failed
+              command (starting at 1), or with 0 when all commands were
+              successful.
+    """
+    ret = []
+    for i, cmd in enumerate(cmds):
+        ret.append("echo " + shlex.quote("% " + " ".join(cmd)) + " && " +
+                   flat_cmd(cmd) + " || { echo \"Exit code: $?\"; exit " +
+                   str(i + 1) + "; }")
+    return "; ".join(ret)
+
+
+def batch(cmds, func, log_prefix="% "):
+    """
+    Run a list of commands with one shell, instead of one process (with sudo
+    and entering the chroot) per command. Large lists get split up, see
+    pmb.config.batch_commands_max.
+
+    :param cmds: list of commands, e.g. [["mkdir", "a"], ["touch", "a/b"]]
+    :param func: function, that runs the shell, e.g.
+                 lambda cmd: root(args, cmd). It gets called with
+                 ["sh", "-c", script] and must raise a RuntimeError from the
+                 subprocess.CalledProcessError, when the shell fails (like
+                 core() does).
+    :param log_prefix: prefix of the failed command in the error message,
+                       e.g. "(native) % "
+    """
+    size = pmb.config.batch_commands_max
+    for start in range(0, len(cmds), size):
+        chunk = cmds[start:start + size]
+        try:
+            func(["sh", "-c", flat_batch(chunk)])
+        except RuntimeError as e:
+            # Name the failed command instead of the whole batch
+            code = getattr(e.__cause__, "returncode", 0)
+            if not 0 < code <= len(chunk):
+                raise
+            raise RuntimeError("Command failed: " + log_prefix +
+                               " ".join(chunk[code - 1])) from e.__cause__
+
+
 def user(args, cmd, log=True, working_dir=None, return_stdout=False,
          check=True, background=False, env={}):
     """
@@ -154,11 +226,35 @@ def user(args, cmd, log=True, working_dir=None, return_stdout=False,
 def root(args, cmd, log=True, working_dir=None, return_stdout=False,
          check=True, background=False, env={}):
     """
-    Run a command on the host system as root, with sudo.
+    Run a command on the host system as root, with sudo (or with the
+    persistent root helper, if enabled with --root-helper).
 
     NOTE: See user() above for parameter descriptions.
     """
     if env:
         cmd = ["sh", "-c", flat_cmd(cmd, env=env)]
     cmd = ["sudo"] + cmd
+    if use_helper(args, log, background):
+        # Same log message as user() would write
+        msg = "% "
+        if working_dir:
+            msg += "cd " + working_dir + "; "
+        msg += " ".join(cmd)
+        return core(args, cmd[1:], msg, log, return_stdout, check,
+                    working_dir, helper=True)
     return user(args, cmd, log, working_dir, return_stdout, check, background)
+
+
+def root_batch(args, cmds, working_dir=None, env={}):
+    """
+    Run a list of commands on the host system as root, with only one sudo
+    call (or root helper request). They run in order and the first failing
+    command raises a RuntimeError. See batch() for details.
+
+    :param cmds: list of commands, e.g. [["mkdir", "a"], ["touch", "a/b"]]
+    :param working_dir: path in host system where the commands should run
+    :param env: dict of environment variables to be passed to the commands,
+                e.g. {"JOBS": "5"}
+    """
+    batch(cmds, lambda cmd: root(args, cmd, working_dir=working_dir,
+                                 env=env))
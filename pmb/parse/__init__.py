@@ -17,7 +17,7 @@ You should have received a copy of the GNU General Public License
 along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
 from pmb.parse.arguments import arguments
-from pmb.parse._apkbuild import apkbuild
+from pmb.parse._apkbuild import apkbuild, apkbuild_all
 from pmb.parse.binfmt_info import binfmt_info
 from pmb.parse.deviceinfo import deviceinfo
 from pmb.parse.kconfig import check
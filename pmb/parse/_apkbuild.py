@@ -16,9 +16,13 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
+import glob
 import os
 import logging
+import multiprocessing
+import pickle
 import pmb.config
+import pmb.helpers.cache
 import pmb.parse.version
 
 
@@ -81,63 +85,145 @@ def cut_off_function_names(apkbuild):
     return apkbuild
 
 
-def apkbuild(args, path, check_pkgver=True, check_pkgname=True):
+def cache_path(args):
     """
-    Parse relevant information out of the APKBUILD file. This is not meant
-    to be perfect and catch every edge case (for that, a full shell parser
-    would be necessary!). Instead, it should just work with the use-cases
-    covered by pmbootstrap and not take too long.
+    :returns: path to the persistent cache of parsed APKBUILDs
+    """
+    return args.work + "/cache_apkbuild_parsed.pickle"
 
-    :param path: full path to the APKBUILD
-    :param check_pkgver: verify that the pkgver is valid.
-    :param check_pkgname: the pkgname must match the name of the aport folder
-    :returns: relevant variables from the APKBUILD. Arrays get returned as
-              arrays.
+
+def cache_entries(args):
     """
-    # Try to get a cached result first (we assume, that the aports don't change
-    # in one pmbootstrap call)
+    Load the persistent cache of parsed APKBUILDs (only once per session).
+
+    :returns: { path: {"lastmod": ..., "size": ..., "data": pickled}, ... }
+              data is the pickled result of parse_file(), so every cache hit
+              returns a fresh dict (callers may modify the returned dict).
+    """
+    cache = args.cache["apkbuild_persistent"]
+    if "entries" in cache:
+        return cache["entries"]
+
+    cache["entries"] = pmb.helpers.cache.load(
+        cache_path(args), pmb.config.apkbuild_cache_version) or {}
+    cache["changed"] = False
+    return cache["entries"]
+
+
+def cache_save(args):
+    """
+    Write the persistent cache of parsed APKBUILDs, if APKBUILDs were parsed
+    in this session. Entries of APKBUILDs, that do not exist anymore, get
+    removed.
+    """
+    cache = args.cache["apkbuild_persistent"]
+    if not cache.get("changed") or not os.path.exists(args.work):
+        return
+
+    entries = cache["entries"]
+    for path in list(entries.keys()):
+        if not os.path.exists(path):
+            del entries[path]
+
+    pmb.helpers.cache.save(cache_path(args),
+                           pmb.config.apkbuild_cache_version, entries)
+    cache["changed"] = False
+
+
+def cache_get(args, path, stat):
+    """
+    Get a parsed APKBUILD from the persistent cache.
+
+    :param stat: os.stat() result of the APKBUILD
+    :returns: the cached result of parse_file(), or None when the APKBUILD is
+              not in the cache or has been changed
+    """
+    entry = cache_entries(args).get(path)
+    if (entry and entry["lastmod"] == stat.st_mtime_ns and
+            entry["size"] == stat.st_size):
+        return pickle.loads(entry["data"])
+    return None
+
+
+def cache_add(args, path, stat, data):
+    """
+    Add a parsed APKBUILD to the persistent cache (it gets written to disk
+    with cache_save()).
+
+    :param stat: os.stat() result of the APKBUILD, from before parsing it
+    :param data: return value of parse_file()
+    """
+    cache_entries(args)[path] = {"lastmod": stat.st_mtime_ns,
+                                 "size": stat.st_size,
+                                 "data": pickle.dumps(data,
+                                                      pickle.HIGHEST_PROTOCOL)}
+    args.cache["apkbuild_persistent"]["changed"] = True
+
+
+def clear_cache(args, path):
+    """
+    Remove one APKBUILD from the session cache and the persistent cache, so
+    it gets parsed again (e.g. after modifying it). Cached dependencies
+    (see pmb.parse.depends.recurse()) get removed as well.
+    """
+    args.cache["depends"] = {}
     if path in args.cache["apkbuild"]:
-        return args.cache["apkbuild"][path]
+        del args.cache["apkbuild"][path]
+    entries = cache_entries(args)
+    if path in entries:
+        del entries[path]
+        args.cache["apkbuild_persistent"]["changed"] = True
+
 
+def parse_file(path):
+    """
+    Read an APKBUILD and parse the attributes from
+    pmb.config.apkbuild_attributes (see apkbuild() below).
+
+    :returns: relevant variables from the APKBUILD, without sanity checks
+    """
     # Read the file and check line endings
     with open(path, encoding="utf-8") as handle:
         lines = handle.readlines()
         if handle.newlines != '\n':
             raise RuntimeError("Wrong line endings in APKBUILD: " + path)
 
-    # Parse all attributes from the config
+    # Parse all attributes from the config (look up the name in front of the
+    # first "=" of each line, instead of checking each attribute)
+    attributes = pmb.config.apkbuild_attributes
     ret = {}
     for i in range(len(lines)):
-        for attribute, options in pmb.config.apkbuild_attributes.items():
-            if not lines[i].startswith(attribute + "="):
-                continue
-
-            # Extend the line value until we reach the ending quote sign
-            line_value = lines[i][len(attribute + "="):-1]
-            end_char = None
-            if line_value.startswith("\""):
-                end_char = "\""
-            value = ""
-            first_line = i
-            while i < len(lines) - 1:
-                value += line_value.replace("\"", "").strip()
-                if not end_char:
+        (attribute, equals, rest) = lines[i].partition("=")
+        options = attributes.get(attribute)
+        if not options or not equals:
+            continue
+
+        # Extend the line value until we reach the ending quote sign
+        line_value = lines[i][len(attribute) + 1:-1]
+        end_char = None
+        if line_value.startswith("\""):
+            end_char = "\""
+        value = ""
+        first_line = i
+        while i < len(lines) - 1:
+            value += line_value.replace("\"", "").strip()
+            if not end_char:
+                break
+            elif line_value.endswith(end_char):
+                # This check is needed to allow line break directly after opening quote
+                if i != first_line or line_value.count(end_char) > 1:
                     break
-                elif line_value.endswith(end_char):
-                    # This check is needed to allow line break directly after opening quote
-                    if i != first_line or line_value.count(end_char) > 1:
-                        break
-                value += " "
-                i += 1
-                line_value = lines[i][:-1]
-
-            # Split up arrays, delete empty strings inside the list
-            if options["array"]:
-                if value:
-                    value = list(filter(None, value.split(" ")))
-                else:
-                    value = []
-            ret[attribute] = value
+            value += " "
+            i += 1
+            line_value = lines[i][:-1]
+
+        # Split up arrays, delete empty strings inside the list
+        if options["array"]:
+            if value:
+                value = list(filter(None, value.split(" ")))
+            else:
+                value = []
+        ret[attribute] = value
 
     # Add missing keys
     for attribute, options in pmb.config.apkbuild_attributes.items():
@@ -150,6 +236,34 @@ def apkbuild(args, path, check_pkgver=True, check_pkgname=True):
     # Properly format values
     ret = replace_variables(ret)
     ret = cut_off_function_names(ret)
+    return ret
+
+
+def apkbuild(args, path, check_pkgver=True, check_pkgname=True):
+    """
+    Parse relevant information out of the APKBUILD file. This is not meant
+    to be perfect and catch every edge case (for that, a full shell parser
+    would be necessary!). Instead, it should just work with the use-cases
+    covered by pmbootstrap and not take too long.
+
+    :param path: full path to the APKBUILD
+    :param check_pkgver: verify that the pkgver is valid.
+    :param check_pkgname: the pkgname must match the name of the aport folder
+    :returns: relevant variables from the APKBUILD. Arrays get returned as
+              arrays.
+    """
+    # Try to get a cached result first (we assume, that the aports don't change
+    # in one pmbootstrap call)
+    if path in args.cache["apkbuild"]:
+        return args.cache["apkbuild"][path]
+
+    # Use the persistent cache, if the APKBUILD did not change since it was
+    # parsed in a previous pmbootstrap call
+    stat = os.stat(path)
+    ret = cache_get(args, path, stat)
+    if ret is None:
+        ret = parse_file(path)
+        cache_add(args, path, stat, ret)
 
     # Sanity check: pkgname
     suffix = "/" + ret["pkgname"] + "/APKBUILD"
@@ -177,6 +291,69 @@ def apkbuild(args, path, check_pkgver=True, check_pkgname=True):
     return ret
 
 
+def parse_worker(path):
+    """
+    Parse one APKBUILD in a worker process of apkbuild_all().
+
+    :returns: (path, result of parse_file() or None when it failed)
+    """
+    try:
+        return (path, parse_file(path))
+    except Exception:
+        # apkbuild_all() parses it again in the main process, to get the error
+        return (path, None)
+
+
+def apkbuild_all(args, paths=None):
+    """
+    Parse multiple APKBUILDs at once. APKBUILDs, that are not in the cache
+    yet, get parsed in a process pool when --parse-jobs is set to more than
+    one job. Errors do not abort parsing the other APKBUILDs, they get
+    returned instead. All results are stored in the cache, so calling
+    apkbuild() for them afterwards does not parse them again.
+
+    :param paths: list of APKBUILD paths, defaults to all APKBUILDs in the
+                  aports folder
+    :returns: (apkbuilds, errors)
+              - apkbuilds: { path: apkbuild, ... } (see apkbuild())
+              - errors: { path: error message, ... }
+    """
+    if paths is None:
+        paths = sorted(glob.glob(args.aports + "/*/*/APKBUILD"))
+
+    # Find APKBUILDs that need to be parsed
+    todo = {}
+    for path in paths:
+        if path in args.cache["apkbuild"]:
+            continue
+        stat = os.stat(path)
+        if cache_get(args, path, stat) is None:
+            todo[path] = stat
+
+    # Parse them concurrently
+    jobs = min(args.parse_jobs, len(todo))
+    if jobs > 1:
+        logging.debug("Parse " + str(len(todo)) + " APKBUILDs with " +
+                      str(jobs) + " processes")
+        context = multiprocessing.get_context("fork")
+        with context.Pool(jobs) as pool:
+            for path, data in pool.imap_unordered(parse_worker, todo,
+                                                  chunksize=16):
+                if data is not None:
+                    cache_add(args, path, todo[path], data)
+
+    # Fill the cache of the current session (and run the sanity checks)
+    apkbuilds = {}
+    errors = {}
+    for path in paths:
+        try:
+            apkbuilds[path] = apkbuild(args, path)
+        except Exception as e:
+            logging.debug("Failed to parse " + path + ": " + str(e))
+            errors[path] = str(e)
+    return (apkbuilds, errors)
+
+
 def subpkgdesc(path, function):
     """
     Get the pkgdesc of a subpackage in an APKBUILD.
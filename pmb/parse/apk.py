@@ -0,0 +1,163 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+
+Read the metadata of .apk files without apk-tools. An apk file consists of
+concatenated gzip streams ("segments"), each containing a tar archive
+without end of archive blocks:
+
+    1. signature (.SIGN.RSA.<key name>), missing in unsigned packages
+    2. control (.PKGINFO, install scripts)
+    3. data (the files of the package)
+
+Only the first two segments get decompressed here.
+"""
+
+import hashlib
+import io
+import os
+import tarfile
+import zlib
+
+# Keys, that may appear multiple times in a .PKGINFO file
+pkginfo_lists = ["depend", "provides", "install_if", "replaces", "triggers"]
+
+
+def read_segment(path, handle, chunk_size=65536):
+    """
+    Read and decompress one segment of an apk file. The handle gets
+    positioned right after the segment, so the next segment can be read
+    afterwards (or skipped, by not reading it).
+
+    :param path: to the apk file (for error messages)
+    :param handle: binary file handle of the apk file
+    :returns: (data, checksum): the decompressed tar archive as bytes and the
+              SHA1 checksum of the compressed segment, or None at the end of
+              the file
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    checksum = hashlib.sha1()
+    data = []
+    first = True
+    while not decompressor.eof:
+        chunk = handle.read(chunk_size)
+        if not chunk:
+            if first:
+                return None
+            raise RuntimeError("Unexpected end of file: " + path)
+        first = False
+        try:
+            data.append(decompressor.decompress(chunk))
+        except zlib.error as e:
+            raise RuntimeError("Invalid gzip stream in " + path + ": " +
+                               str(e))
+        checksum.update(chunk[:len(chunk) - len(decompressor.unused_data)])
+
+    # Go back to the start of the next segment
+    handle.seek(-len(decompressor.unused_data), os.SEEK_CUR)
+    return (b"".join(data), checksum.digest())
+
+
+def tar_files(data):
+    """
+    :param data: decompressed segment (tar archive)
+    :returns: { name: content as bytes, ... } of all regular files
+    """
+    ret = {}
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        for member in tar:
+            if member.isfile():
+                ret[member.name] = tar.extractfile(member).read()
+    return ret
+
+
+def parse_pkginfo(content):
+    """
+    Parse a .PKGINFO file.
+
+    :param content: the .PKGINFO file as string
+    :returns: { key: value, ... }, the values of the keys listed in
+              pkginfo_lists are lists
+    """
+    ret = {key: [] for key in pkginfo_lists}
+    for line in content.splitlines():
+        if line.startswith("#") or " = " not in line:
+            continue
+        (key, value) = line.split(" = ", 1)
+        if key in pkginfo_lists:
+            ret[key].append(value)
+        else:
+            ret[key] = value
+    return ret
+
+
+def control(path):
+    """
+    Read the metadata of an apk file from its signature and control segment.
+
+    :param path: to the apk file
+    :returns: { "pkginfo": return value of parse_pkginfo(),
+                "signature": { "name": ".SIGN.RSA.<key name>",
+                               "data": signature as bytes } or None,
+                "checksum": SHA1 checksum of the compressed control
+                            segment (apk index writes it as C:Q1<base64>),
+                "files": { name: content, ... } of the control segment
+                         (.PKGINFO, .post-install, ...),
+                "control_range": (start, end) offsets of the compressed
+                                 control segment in the file (the signature
+                                 is made over these bytes),
+                "filesize": size of the apk file }
+    """
+    ret = {"signature": None, "filesize": os.path.getsize(path)}
+    with open(path, "rb") as handle:
+        for i in range(2):
+            start = handle.tell()
+            segment = read_segment(path, handle)
+            if not segment:
+                break
+            (data, checksum) = segment
+            files = tar_files(data)
+
+            # Signature
+            if i == 0 and ".PKGINFO" not in files:
+                for name, content in files.items():
+                    if name.startswith(".SIGN."):
+                        ret["signature"] = {"name": name, "data": content}
+                continue
+
+            # Control segment
+            if ".PKGINFO" in files:
+                ret["pkginfo"] = parse_pkginfo(files[".PKGINFO"].decode())
+                ret["checksum"] = checksum
+                ret["files"] = files
+                ret["control_range"] = (start, handle.tell())
+                return ret
+            break
+    raise RuntimeError("Could not find .PKGINFO in " + path)
+
+
+def sonames(pkginfo):
+    """
+    :param pkginfo: return value of parse_pkginfo()
+    :returns: list of the shared libraries, that the package provides (e.g.
+              ["libc.musl-x86_64.so.1"])
+    """
+    ret = []
+    for provide in pkginfo["provides"]:
+        if provide.startswith("so:"):
+            ret.append(provide[3:].split("=", 1)[0])
+    return ret
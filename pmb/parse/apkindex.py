@@ -16,15 +16,195 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
+import argparse
 import collections
+import contextlib
+import hashlib
 import logging
+import multiprocessing
 import os
+import sys
 import tarfile
 import pmb.chroot.apk
+import pmb.config
+import pmb.helpers.cache
 import pmb.helpers.repo
 import pmb.parse.version
 
 
+# Keys of APKINDEX blocks, that get parsed. The lines are dispatched on their
+# first byte, e.g. "P:postmarketos-mkinitfs" is the pkgname.
+block_keys = {
+    ord("A"): "arch",
+    ord("D"): "depends",
+    ord("o"): "origin",
+    ord("P"): "pkgname",
+    ord("p"): "provides",
+    ord("t"): "timestamp",
+    ord("V"): "version",
+}
+
+
+class Block:
+    """
+    One package of an APKINDEX, see parse_next_block() for the keys. It can
+    be used like a read-only dict, but takes a lot less memory than one: the
+    values are stored in slots, pkgname, arch and origin are interned, and the
+    depends and provides tuples are shared between packages with the same
+    lists (as well as all names inside them).
+    """
+    __slots__ = ("arch", "depends", "origin", "pkgname", "provides",
+                 "timestamp", "version")
+    interned = ("arch", "origin", "pkgname")
+
+    def __init__(self, values):
+        for key, value in values.items():
+            if key in self.interned:
+                value = sys.intern(value)
+            setattr(self, key, value)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (Block, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __getstate__(self):
+        return dict(self.items())
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return [key for key in self.__slots__ if hasattr(self, key)]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+
+def format_list(value):
+    """
+    Split up the value of a "depends" or "provides" line.
+
+    :param value: e.g. "so:libc.musl-x86_64.so.1 cmd:curl=7.57.0-r0 !test"
+    :returns: tuple of the interned names without operators and versions, e.g.
+              ("so:libc.musl-x86_64.so.1", "cmd:curl")
+    """
+    # Ignore all operators for now
+    values = []
+    for value in value.split(" "):
+        if value.startswith("!"):
+            continue
+        for operator in [">", "=", "<"]:
+            if operator in value:
+                value = value.split(operator)[0]
+                break
+        values.append(sys.intern(value))
+    return tuple(values)
+
+
+def format_block(path, ret, shared_lists=None):
+    """
+    Check the required keys of a block and split up the optional lists.
+
+    :param path: to the APKINDEX.tar.gz (for error messages)
+    :param ret: block with the raw values from read_blocks()
+    :param shared_lists: dict of already formatted "depends" and "provides"
+                         values, so equal lists get shared between blocks.
+                         Format: {raw_value: formatted_value, ...}
+    :returns: the formatted block, see parse_next_block()
+    """
+    # Check for required keys
+    for key in ["arch", "pkgname", "version"]:
+        if key not in ret:
+            raise RuntimeError("Missing required key '" + key +
+                               "' in block " + str(ret) + ", file: " + path)
+
+    # Format optional lists
+    if shared_lists is None:
+        shared_lists = {}
+    for key in ["provides", "depends"]:
+        value = ret.get(key, "")
+        if value not in shared_lists:
+            shared_lists[value] = format_list(value) if value else ()
+        ret[key] = shared_lists[value]
+    return Block(ret)
+
+
+def read_blocks(path, handle):
+    """
+    Read all blocks of an APKINDEX in a single pass. The lines are read one
+    by one from the handle, so the whole file never needs to be in memory.
+
+    :param path: to the APKINDEX.tar.gz (for error messages)
+    :param handle: iterable of lines as bytes, e.g. a file opened with "rb"
+    :returns: generator of blocks, see parse_next_block()
+    """
+    keys = block_keys
+    shared_lists = {}
+    ret = {}
+    for line in handle:
+        # End of the block
+        if line == b"\n":
+            yield format_block(path, ret, shared_lists)
+            ret = {}
+            continue
+
+        # Parse keys from the mapping
+        key = keys.get(line[0])
+        if key is None or line[1:2] != b":":
+            continue
+        if key in ret:
+            raise RuntimeError(
+                "Key " + key + " (" + chr(line[0]) + ":) specified twice"
+                " in block: " + str(ret) + ", file: " + path)
+        ret[key] = line[2:-1].decode()
+
+    # No more blocks
+    if ret != {}:
+        raise RuntimeError("Last block in " + path + " does not end"
+                           " with a new line! Delete the file and"
+                           " try again. Last block: " + str(ret))
+
+
+@contextlib.contextmanager
+def open_apkindex(path):
+    """
+    Open the APKINDEX file inside an APKINDEX.tar.gz, or an uncompressed apk
+    package database, for reading with read_blocks().
+
+    :param path: path to an APKINDEX.tar.gz file or apk package database
+    :returns: file handle, that returns the lines as bytes
+    """
+    if tarfile.is_tarfile(path):
+        with tarfile.open(path, "r:gz") as tar:
+            with tar.extractfile(tar.getmember("APKINDEX")) as handle:
+                yield handle
+    else:
+        with open(path, "rb") as handle:
+            yield handle
+
+
 def parse_next_block(args, path, lines, start):
     """
     Parse the next block in an APKINDEX.
@@ -34,85 +214,32 @@ def parse_next_block(args, path, lines, start):
                   function. Wrapped into a list, so it can be modified
                   "by reference". Example: [5]
     :param lines: all lines from the "APKINDEX" file inside the archive
-    :returns: a dictionary with the following structure:
+    :returns: a Block (used like a dictionary) with the following structure:
               { "arch": "noarch",
-                "depends": ["busybox-extras", "lddtree", ... ],
+                "depends": ("busybox-extras", "lddtree", ... ),
                 "origin": "postmarketos-mkinitfs",
                 "pkgname": "postmarketos-mkinitfs",
-                "provides": ["mkinitfs=0.0.1"],
+                "provides": ("mkinitfs", ),
                 "timestamp": "1500000000",
                 "version": "0.0.4-r10" }
-              NOTE: "depends" is not set for packages without any dependencies,
-                    e.g. musl.
+              NOTE: "depends" is an empty tuple for packages without any
+                    dependencies, e.g. musl.
               NOTE: "timestamp" and "origin" are not set for virtual packages
                     (#1273). We use that information to skip these virtual
                     packages in parse().
     :returns: None, when there are no more blocks
-    """
-
-    # Parse until we hit an empty line or end of file
-    ret = {}
-    mapping = {
-        "A": "arch",
-        "D": "depends",
-        "o": "origin",
-        "P": "pkgname",
-        "p": "provides",
-        "t": "timestamp",
-        "V": "version",
-    }
-    end_of_block_found = False
-    for i in range(start[0], len(lines)):
-        # Check for empty line
-        start[0] = i + 1
-        line = lines[i]
-        if not isinstance(line, str):
-            line = line.decode()
-        if line == "\n":
-            end_of_block_found = True
-            break
 
-        # Parse keys from the mapping
-        for letter, key in mapping.items():
-            if line.startswith(letter + ":"):
-                if key in ret:
-                    raise RuntimeError(
-                        "Key " + key + " (" + letter + ":) specified twice"
-                        " in block: " + str(ret) + ", file: " + path)
-                ret[key] = line[2:-1]
-
-    # Format and return the block
-    if end_of_block_found:
-        # Check for required keys
-        for key in ["arch", "pkgname", "version"]:
-            if key not in ret:
-                raise RuntimeError("Missing required key '" + key +
-                                   "' in block " + str(ret) + ", file: " + path)
-
-        # Format optional lists
-        for key in ["provides", "depends"]:
-            if key in ret and ret[key] != "":
-                # Ignore all operators for now
-                values = ret[key].split(" ")
-                ret[key] = []
-                for value in values:
-                    if value.startswith("!"):
-                        continue
-                    for operator in [">", "=", "<"]:
-                        if operator in value:
-                            value = value.split(operator)[0]
-                            break
-                    ret[key].append(value)
-            else:
-                ret[key] = []
-        return ret
-
-    # No more blocks
-    elif ret != {}:
-        raise RuntimeError("Last block in " + path + " does not end"
-                           " with a new line! Delete the file and"
-                           " try again. Last block: " + str(ret))
-    return None
+    NOTE: parse() and parse_blocks() use read_blocks() directly, which does
+          not need all lines in memory.
+    """
+    def lines_from_start():
+        for i in range(start[0], len(lines)):
+            start[0] = i + 1
+            line = lines[i]
+            if isinstance(line, str):
+                line = line.encode()
+            yield line
+    return next(read_blocks(path, lines_from_start()), None)
 
 
 def parse_add_block(ret, block, alias=None, multiple_providers=True):
@@ -157,6 +284,51 @@ def parse_add_block(ret, block, alias=None, multiple_providers=True):
         ret[alias] = block
 
 
+def cache_path(args, path, cache_key):
+    """
+    Get the location of the persistent cache file for a parsed APKINDEX.
+
+    :param path: path to the APKINDEX.tar.gz file (or apk package database)
+    :param cache_key: "multiple" or "single", see parse()
+    :returns: full path to the cache file inside $WORK/cache_apkindex_parsed
+    """
+    path_hash = hashlib.sha1(path.encode("utf-8")).hexdigest()
+    return (args.work + "/cache_apkindex_parsed/" + path_hash + "_" +
+            cache_key + ".pickle")
+
+
+def cache_load(args, path, cache_key, lastmod, size):
+    """
+    Load a parsed APKINDEX from the persistent cache.
+
+    :param lastmod: last modified timestamp of the APKINDEX file
+    :param size: size of the APKINDEX file in bytes
+    :returns: the cached return value of parse(), or None when the cache file
+              does not exist or is outdated
+    """
+    cache_file = cache_path(args, path, cache_key)
+    cache = pmb.helpers.cache.load(cache_file,
+                                   pmb.config.apkindex_cache_version)
+    if not cache:
+        return None
+    if (cache["path"] != path or cache["lastmod"] != lastmod or
+            cache["size"] != size):
+        logging.verbose("APKINDEX cache is outdated: " + cache_file)
+        return None
+    return cache["data"]
+
+
+def cache_save(args, path, cache_key, lastmod, size, data):
+    """
+    Write a parsed APKINDEX to the persistent cache.
+
+    :param data: return value of parse()
+    """
+    cache = {"path": path, "lastmod": lastmod, "size": size, "data": data}
+    pmb.helpers.cache.save(cache_path(args, path, cache_key),
+                           pmb.config.apkindex_cache_version, cache)
+
+
 def parse(args, path, multiple_providers=True):
     """
     Parse an APKINDEX.tar.gz file, and return its content as dictionary.
@@ -191,50 +363,103 @@ def parse(args, path, multiple_providers=True):
                         " exist for that architecture: " + path)
         return {}
 
-    # Try to get a cached result first
-    lastmod = os.path.getmtime(path)
+    # Try to get a cached result first (from this session, or from the
+    # persistent cache written by a previous pmbootstrap call)
+    stat = os.stat(path)
+    lastmod = stat.st_mtime
     cache_key = "multiple" if multiple_providers else "single"
     if path in args.cache["apkindex"]:
         cache = args.cache["apkindex"][path]
         if cache["lastmod"] == lastmod and cache_key in cache:
             return cache[cache_key]
-
-    # Read all lines
-    if tarfile.is_tarfile(path):
-        with tarfile.open(path, "r:gz") as tar:
-            with tar.extractfile(tar.getmember("APKINDEX")) as handle:
-                lines = handle.readlines()
-    else:
-        with open(path, "r", encoding="utf-8") as handle:
-            lines = handle.readlines()
+    ret = cache_load(args, path, cache_key, lastmod, stat.st_size)
+    if ret is not None:
+        parse_cache_update(args, path, cache_key, lastmod, ret)
+        return ret
 
     # Parse the whole APKINDEX file
     ret = collections.OrderedDict()
-    start = [0]
-    while True:
-        block = parse_next_block(args, path, lines, start)
-        if not block:
-            break
-
-        # Skip virtual packages
-        if "timestamp" not in block:
-            logging.verbose("Skipped virtual package " + str(block) + " in"
-                            " file: " + path)
-            continue
-
-        # Add the next package and all aliases
-        parse_add_block(ret, block, None, multiple_providers)
-        if "provides" in block:
+    with open_apkindex(path) as handle:
+        for block in read_blocks(path, handle):
+            # Skip virtual packages
+            if "timestamp" not in block:
+                logging.verbose("Skipped virtual package " + str(block) +
+                                " in file: " + path)
+                continue
+
+            # Add the next package and all aliases
+            parse_add_block(ret, block, None, multiple_providers)
             for alias in block["provides"]:
                 parse_add_block(ret, block, alias, multiple_providers)
 
-    # Update the cache
-    if path not in args.cache["apkindex"]:
-        args.cache["apkindex"][path] = {"lastmod": lastmod}
-    args.cache["apkindex"][path][cache_key] = ret
+    # Update the caches
+    parse_cache_update(args, path, cache_key, lastmod, ret)
+    cache_save(args, path, cache_key, lastmod, stat.st_size, ret)
     return ret
 
 
+def parse_worker(work, path):
+    """
+    Parse one APKINDEX in a worker process of parse_many(). The result gets
+    passed back to the main process through the persistent cache (loading it
+    is much faster than parsing the file).
+
+    :param work: the work folder (args.work)
+    """
+    args = argparse.Namespace(work=work, cache={"apkindex": {}})
+    parse(args, path)
+
+
+def parse_many(args, paths):
+    """
+    Parse multiple APKINDEX files. With --parse-jobs set to more than one
+    job, the files that are neither in the cache of the current session nor
+    in the persistent cache get parsed concurrently in a process pool first.
+
+    :param paths: list of paths to APKINDEX.tar.gz files
+    :returns: list of the parse() results (with multiple_providers), in the
+              same order as paths
+    """
+    # Find files that need to be parsed
+    cache_key = "multiple"
+    todo = []
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        lastmod = os.path.getmtime(path)
+        cache = args.cache["apkindex"].get(path)
+        if cache and cache["lastmod"] == lastmod and cache_key in cache:
+            continue
+        cache_file = cache_path(args, path, cache_key)
+        if (os.path.exists(cache_file) and
+                os.path.getmtime(cache_file) >= lastmod):
+            continue
+        todo.append(path)
+
+    # Parse them concurrently
+    jobs = min(args.parse_jobs, len(todo))
+    if jobs > 1:
+        logging.debug("Parse " + str(len(todo)) + " APKINDEX files with " +
+                      str(jobs) + " processes")
+        context = multiprocessing.get_context("fork")
+        with context.Pool(jobs) as pool:
+            pool.starmap(parse_worker, [(args.work, path) for path in todo])
+
+    # Fill the cache of the current session
+    return [parse(args, path) for path in paths]
+
+
+def parse_cache_update(args, path, cache_key, lastmod, ret):
+    """
+    Store the result of parse() in the cache of the current session.
+    """
+    cache = args.cache["apkindex"].get(path)
+    if not cache or cache["lastmod"] != lastmod:
+        cache = {"lastmod": lastmod}
+        args.cache["apkindex"][path] = cache
+    cache[cache_key] = ret
+
+
 def parse_blocks(args, path):
     """
     Read all blocks from an APKINDEX.tar.gz into a list.
@@ -247,28 +472,23 @@ def parse_blocks(args, path):
 
     NOTE: "block" is the return value from parse_next_block() above.
     """
-    # Parse all lines
-    with tarfile.open(path, "r:gz") as tar:
-        with tar.extractfile(tar.getmember("APKINDEX")) as handle:
-            lines = handle.readlines()
-
-    # Parse lines into blocks
-    ret = []
-    start = [0]
-    while True:
-        block = pmb.parse.apkindex.parse_next_block(args, path, lines, start)
-        if not block:
-            return ret
-        ret.append(block)
+    with open_apkindex(path) as handle:
+        return list(read_blocks(path, handle))
 
 
 def clear_cache(args, path):
     """
-    Clear the APKINDEX parsing cache.
+    Clear the APKINDEX parsing cache of the current session and the
+    persistent cache files of that APKINDEX.
 
-    :returns: True on successful deletion, False otherwise
+    :returns: True on successful deletion from the session cache, False
+              otherwise
     """
     logging.verbose("Clear APKINDEX cache for: " + path)
+    for cache_key in ["multiple", "single"]:
+        cache_file = cache_path(args, path, cache_key)
+        if os.path.exists(cache_file):
+            os.remove(cache_file)
     if path in args.cache["apkindex"]:
         del args.cache["apkindex"][path]
         return True
@@ -278,77 +498,122 @@ def clear_cache(args, path):
         return False
 
 
-def providers(args, package, arch=None, must_exist=True, indexes=None):
+def merge(args, indexes):
     """
-    Get all packages, which provide one package.
+    Merge multiple parsed APKINDEX files into one provider index, that only
+    contains the highest version of each provider. When the same version of a
+    provider is in multiple files, the one from the last file wins.
 
-    :param package: of which you want to have the providers
+    The result is cached for the current session, and it gets merged again
+    when one of the APKINDEX files has been parsed again (because it changed,
+    or because clear_cache() was called for it).
+
+    :param indexes: list of APKINDEX.tar.gz paths
+    :returns: same format as parse() with multiple_providers=True:
+              { provide: { pkgname: block, ... }, ... }
+    """
+    # Return the cached result, if it was merged from the same parsed files
+    # (empty dicts are returned for files that don't exist)
+    key = tuple(indexes)
+    parsed = parse_many(args, indexes)
+    cache = args.cache["apkindex_merged"].get(key)
+    if cache:
+        for old, new in zip(cache["parsed"], parsed):
+            if old is not new and (old or new):
+                break
+        else:
+            return cache["providers"]
+
+    # Merge the files. The provider dicts are only copied, when more than one
+    # file provides the same name.
+    logging.verbose("Merge APKINDEX files: " + ", ".join(indexes))
+    ret = {}
+    duplicates = {}
+    for index in parsed:
+        for provide, index_providers in index.items():
+            if provide not in ret:
+                ret[provide] = index_providers
+            elif provide in duplicates:
+                duplicates[provide].append(index_providers)
+            else:
+                duplicates[provide] = [ret[provide], index_providers]
+
+    # Pick the highest version of each provider from all files at once, so
+    # the result does not depend on the order of the files (see
+    # pmb.parse.version.max()). Reversed, so the last file wins.
+    for provide, all_providers in duplicates.items():
+        candidates = {}
+        for index_providers in all_providers:
+            for provider_pkgname, provider in index_providers.items():
+                candidates.setdefault(provider_pkgname, []).append(provider)
+        ret[provide] = {provider_pkgname: pmb.parse.version.max(
+                        reversed(blocks), lambda block: block["version"])
+                        for provider_pkgname, blocks in candidates.items()}
+
+    args.cache["apkindex_merged"][key] = {"parsed": parsed, "providers": ret}
+    return ret
+
+
+def providers_many(args, packages, arch=None, must_exist=True,
+                   indexes=None):
+    """
+    Get the providers of multiple packages at once. This is faster than
+    calling providers() for each package, because the APKINDEX files only get
+    checked for changes once.
+
+    :param packages: list of packages, of which you want to have the providers
     :param arch: defaults to native arch, only relevant for indexes=None
-    :param must_exist: When set to true, raise an exception when the package is
-                       not provided at all.
+    :param must_exist: When set to true, raise an exception when one of the
+                       packages is not provided at all.
     :param indexes: list of APKINDEX.tar.gz paths, defaults to all index files
                     (depending on arch)
-    :returns: list of parsed packages. Example for package="so:libGL.so.1":
-                  {"mesa-egl": block, "libhybris": block}
-              block is the return value from parse_next_block() above.
+    :returns: dict of the providers() return values for each package:
+              { package: { provider_pkgname: block, ... }, ... }
     """
-
     if not indexes:
         arch = arch or args.arch_native
         indexes = pmb.helpers.repo.apkindex_files(args, arch)
 
+    merged = merge(args, indexes)
     ret = {}
-    for path in indexes:
-        # Skip indexes not providing the package
-        index_packages = parse(args, path)
-        if package not in index_packages:
-            continue
-
-        # Iterate over found providers
-        for provider_pkgname, provider in index_packages[package].items():
-            # Skip lower versions of providers we already found
-            version = provider["version"]
-            if provider_pkgname in ret:
-                version_last = ret[provider_pkgname]["version"]
-                if pmb.parse.version.compare(version, version_last) == -1:
-                    logging.verbose(package + ": provided by: " +
-                                    provider_pkgname + "-" + version + " in " +
-                                    path + " (but " + version_last + " is"
-                                    " higher)")
-                    continue
-
-            # Add the provier to ret
-            logging.verbose(package + ": provided by: " + provider_pkgname +
-                            "-" + version + " in " + path)
-            ret[provider_pkgname] = provider
-
-    if ret == {} and must_exist:
-        logging.debug("Searched in APKINDEX files: " + ", ".join(indexes))
-        raise RuntimeError("Could not find package '" + package + "'!")
-
+    for package in packages:
+        ret[package] = dict(merged.get(package, {}))
+        if ret[package] == {} and must_exist:
+            logging.debug("Searched in APKINDEX files: " + ", ".join(indexes))
+            raise RuntimeError("Could not find package '" + package + "'!")
     return ret
 
 
-def package(args, package, arch=None, must_exist=True, indexes=None):
+def providers(args, package, arch=None, must_exist=True, indexes=None):
     """
-    Get a specific package's data from an apkindex.
+    Get all packages, which provide one package.
 
-    :param package: of which you want to have the apkindex data
+    :param package: of which you want to have the providers
     :param arch: defaults to native arch, only relevant for indexes=None
     :param must_exist: When set to true, raise an exception when the package is
                        not provided at all.
     :param indexes: list of APKINDEX.tar.gz paths, defaults to all index files
                     (depending on arch)
-    :returns: a dictionary with the following structure:
-              { "arch": "noarch",
-                "depends": ["busybox-extras", "lddtree", ... ],
-                "pkgname": "postmarketos-mkinitfs",
-                "provides": ["mkinitfs=0.0.1"],
-                "version": "0.0.4-r10" }
-              or None when the package was not found.
+    :returns: list of parsed packages. Example for package="so:libGL.so.1":
+                  {"mesa-egl": block, "libhybris": block}
+              block is the return value from parse_next_block() above.
+    """
+    ret = providers_many(args, [package], arch, must_exist, indexes)[package]
+    if ret:
+        logging.verbose(package + ": provided by: " +
+                        ", ".join(provider_pkgname + "-" + provider["version"]
+                                  for provider_pkgname, provider in
+                                  ret.items()))
+    return ret
+
+
+def package_from_providers(package, package_providers, must_exist=True):
+    """
+    Pick the package's data from its providers (see package()).
+
+    :param package_providers: return value of providers()
     """
     # Provider with the same package
-    package_providers = providers(args, package, arch, must_exist, indexes)
     if package in package_providers:
         return package_providers[package]
 
@@ -366,3 +631,42 @@ def package(args, package, arch=None, must_exist=True, indexes=None):
         raise RuntimeError("Package '" + package + "' not found in any"
                            " APKINDEX.")
     return None
+
+
+def package(args, package, arch=None, must_exist=True, indexes=None):
+    """
+    Get a specific package's data from an apkindex.
+
+    :param package: of which you want to have the apkindex data
+    :param arch: defaults to native arch, only relevant for indexes=None
+    :param must_exist: When set to true, raise an exception when the package is
+                       not provided at all.
+    :param indexes: list of APKINDEX.tar.gz paths, defaults to all index files
+                    (depending on arch)
+    :returns: a block with the following structure:
+              { "arch": "noarch",
+                "depends": ("busybox-extras", "lddtree", ... ),
+                "pkgname": "postmarketos-mkinitfs",
+                "provides": ("mkinitfs", ),
+                "version": "0.0.4-r10" }
+              or None when the package was not found.
+    """
+    package_providers = providers(args, package, arch, must_exist, indexes)
+    return package_from_providers(package, package_providers, must_exist)
+
+
+def package_many(args, packages, arch=None, must_exist=True, indexes=None):
+    """
+    Get the data of multiple packages at once, see package() and
+    providers_many().
+
+    :param packages: list of packages, of which you want to have the data
+    :returns: { package: block_or_None, ... }
+    """
+    ret = {}
+    for package, package_providers in providers_many(args, packages, arch,
+                                                     must_exist,
+                                                     indexes).items():
+        ret[package] = package_from_providers(package, package_providers,
+                                              must_exist)
+    return ret
@@ -202,8 +202,23 @@ def arguments():
     parser.add_argument("-mp", "--mirror-pmOS", dest="mirror_postmarketos")
     parser.add_argument("-m", "--mirror-alpine", dest="mirror_alpine")
     parser.add_argument("-j", "--jobs", help="parallel jobs when compiling")
+    parser.add_argument("--parse-jobs", dest="parse_jobs", type=int,
+                        default=1, help="parse APKINDEX files and APKBUILDs"
+                        " with multiple processes (default: 1)")
     parser.add_argument("-p", "--aports",
                         help="postmarketos aports paths")
+    parser.add_argument("--binary-cache", dest="binary_cache",
+                        help="folder or http(s) URL of a binary cache: use"
+                        " packages from there, if they were built before"
+                        " with the same inputs, and add newly built packages"
+                        " (folders only). Packages from there must be signed"
+                        " with a key from $WORK/config_apk_keys. Can be set"
+                        " permanently with 'pmbootstrap config binary_cache"
+                        " ...'")
+    parser.add_argument("--root-helper", dest="root_helper",
+                        action="store_true", help="run commands as root with"
+                        " one long-lived helper process, instead of calling"
+                        " sudo for each command (faster)")
     parser.add_argument("-s", "--skip-initfs", dest="skip_initfs",
                         help="do not re-generate the initramfs",
                         action="store_true")
@@ -278,8 +293,16 @@ def arguments():
                      " (that have been downloaded to the apk cache)")
 
     # Action: stats
-    stats = sub.add_parser("stats", help="show ccache stats")
+    stats = sub.add_parser("stats", help="show ccache stats or the build"
+                           " history")
     stats.add_argument("--arch", default=arch_native, choices=arch_choices)
+    stats.add_argument("--limit", type=int, default=20, help="amount of"
+                       " packages to list in the build history (default: 20)")
+    stats.add_argument("view", nargs="?", default="ccache",
+                       choices=["ccache", "builds"], help="ccache: show"
+                       " ccache stats of the chroot for --arch (default),"
+                       " builds: list the slowest builds and how their build"
+                       " time changed")
 
     # Action: update
     update = sub.add_parser("update", help="update all existing APKINDEX"
@@ -375,6 +398,15 @@ def arguments():
                        " you don't need to build and install the kernel. But it"
                        " is incompatible with how Alpine's abuild handles it.",
                        dest="ignore_depends")
+    build.add_argument("--parallel", type=int, default=1, metavar="N",
+                       help="build up to N packages at the same time, in"
+                       " different build chroots (default: 1)")
+    build.add_argument("--plan", action="store_true",
+                       help="only print which packages would be built, in"
+                       " which order and how (arch, chroot, cross-compile"
+                       " method), without building anything. The APKINDEX"
+                       " files are used as they are, run 'pmbootstrap update'"
+                       " first to refresh them")
     for action in [checksum, build, aportgen]:
         action.add_argument("packages", nargs="+")
 
@@ -386,6 +418,14 @@ def arguments():
     for action in [kconfig_check, apkbuild_parse]:
         action.add_argument("packages", nargs="*")
 
+    # Action: deptree
+    deptree = sub.add_parser("deptree", help="show how the dependencies of"
+                             " packages get resolved")
+    deptree.add_argument("--arch", default=arch_native, choices=arch_choices)
+    deptree.add_argument("--format", default="json", choices=["json", "dot"],
+                         help="output format (default: json)")
+    deptree.add_argument("packages", nargs="+")
+
     # Action: apkindex_parse
     apkindex_parse = sub.add_parser("apkindex_parse")
     apkindex_parse.add_argument("apkindex_path")
@@ -419,11 +459,17 @@ def arguments():
 
     # Add a caching dict (caches parsing of files etc. for the current session)
     setattr(args, "cache", {"apkindex": {},
+                            "apkindex_merged": {},
                             "apkbuild": {},
+                            "apkbuild_persistent": {},
+                            "aports_index": {},
+                            "depends": {},
                             "apk_min_version_checked": [],
                             "apk_repository_list_updated": [],
                             "built": {},
-                            "find_aport": {}})
+                            "find_aport": {},
+                            "fingerprint": {},
+                            "root_helper": []})
 
     # Add and verify the deviceinfo (only after initialization)
     if args.action not in ("init", "config", "bootimg_analyze"):
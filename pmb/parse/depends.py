@@ -16,9 +16,13 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
+import collections
 import logging
+import os
+import time
 import pmb.chroot
 import pmb.chroot.apk
+import pmb.helpers.repo
 import pmb.parse.apkindex
 import pmb.parse.arch
 
@@ -46,30 +50,57 @@ def package_from_aports(args, pkgname_depend):
             "version": version}
 
 
-def package_provider(args, pkgname, pkgnames_install, suffix="native"):
+# Rules for choosing a binary package provider in package_provider_rule()
+provider_rules = {
+    0: "no binary package provider",
+    1: "only provider",
+    2: "provider with the same name",
+    3: "provider will be installed anyway",
+    4: "provider is installed in the chroot already",
+    5: "first of multiple providers",
+}
+
+
+def package_provider(args, pkgname, pkgnames_install, suffix="native",
+                     providers=None):
     """
     :param pkgnames_install: packages to be installed
+    :param providers: all providers of pkgname, when they have been looked up
+                      already (return value of pmb.parse.apkindex.providers())
     :returns: a block from the apkindex: {"pkgname": "...", ...}
               or None (no provider found)
     """
+    return package_provider_rule(args, pkgname, pkgnames_install, suffix,
+                                 providers)[0]
+
+
+def package_provider_rule(args, pkgname, pkgnames_install, suffix="native",
+                          providers=None):
+    """
+    Choose the provider of a package, see package_provider().
+
+    :returns: (provider, rule) with rule being the number of the rule, that
+              was used to choose the provider (see provider_rules).
+    """
     # Get all providers
-    arch = pmb.parse.arch.from_chroot_suffix(args, suffix)
-    providers = pmb.parse.apkindex.providers(args, pkgname, arch, False)
+    if providers is None:
+        arch = pmb.parse.arch.from_chroot_suffix(args, suffix)
+        providers = pmb.parse.apkindex.providers(args, pkgname, arch, False)
 
     # 0. No provider
     if len(providers) == 0:
-        return None
+        return (None, 0)
 
     # 1. Only one provider
     logging.verbose(pkgname + ": provided by: " + ", ".join(providers))
     if len(providers) == 1:
-        return list(providers.values())[0]
+        return (list(providers.values())[0], 1)
 
     # 2. Provider with the same package name
     if pkgname in providers:
         logging.verbose(pkgname + ": choosing package of the same name as"
                         " provider")
-        return providers[pkgname]
+        return (providers[pkgname], 2)
 
     # 3. Pick a package that will be installed anyway
     for provider_pkgname, provider in providers.items():
@@ -77,7 +108,7 @@ def package_provider(args, pkgname, pkgnames_install, suffix="native"):
             logging.verbose(pkgname + ": choosing provider '" +
                             provider_pkgname + "', because it will be"
                             " installed anyway")
-            return provider
+            return (provider, 3)
 
     # 4. Pick a package that is already installed
     installed = pmb.chroot.apk.installed(args, suffix)
@@ -86,24 +117,26 @@ def package_provider(args, pkgname, pkgnames_install, suffix="native"):
             logging.verbose(pkgname + ": choosing provider '" +
                             provider_pkgname + "', because it is installed in"
                             " the '" + suffix + "' chroot already")
-            return provider
+            return (provider, 4)
 
     # 5. Pick the first one
     provider_pkgname = list(providers.keys())[0]
     logging.debug(pkgname + " has multiple providers (" +
                   ", ".join(providers) + "), picked: " + provider_pkgname)
-    return providers[provider_pkgname]
+    return (providers[provider_pkgname], 5)
 
 
 def package_from_index(args, pkgname_depend, pkgnames_install, package_aport,
-                       suffix="native"):
+                       suffix="native", providers=None):
     """
+    :param providers: see package_provider()
     :returns: None when there is no aport and no binary package, or a dict with
               the keys pkgname, depends, version from either the aport or the
               binary package provider.
     """
     # No binary package
-    provider = package_provider(args, pkgname_depend, pkgnames_install, suffix)
+    provider = package_provider(args, pkgname_depend, pkgnames_install, suffix,
+                                providers)
     if not provider:
         return package_aport
 
@@ -121,9 +154,34 @@ def package_from_index(args, pkgname_depend, pkgnames_install, package_aport,
     return provider
 
 
+def recurse_cache_key(args, pkgnames, arch, suffix):
+    """
+    Get the key for caching the result of recurse(). Besides the pkgnames
+    and the arch, the result depends on the APKINDEX files of the arch and the
+    installed packages in the chroot (see package_provider()). The aports are
+    assumed not to change in one pmbootstrap call, like in the APKBUILD cache.
+
+    :returns: (pkgnames, arch, apkindex_state, installed) with apkindex_state
+              being a tuple of (path, lastmod, size) for each APKINDEX file,
+              and installed being a frozenset of the names installed in the
+              chroot. Chroots of the same arch with the same installed names
+              share the cached results.
+    """
+    apkindex_state = []
+    for path in pmb.helpers.repo.apkindex_files(args, arch):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            apkindex_state.append((path, stat.st_mtime_ns, stat.st_size))
+        else:
+            apkindex_state.append((path, None, None))
+    installed = frozenset(pmb.chroot.apk.installed(args, suffix))
+    return (tuple(pkgnames), arch, tuple(apkindex_state), installed)
+
+
 def recurse(args, pkgnames, suffix="native"):
     """
-    Find all dependencies of the given pkgnames.
+    Find all dependencies of the given pkgnames. The result gets cached for
+    the current session (see recurse_cache_key()).
 
     :param suffix: the chroot suffix to resolve dependencies for. If a package
                    has multiple providers, we look at the installed packages in
@@ -131,23 +189,66 @@ def recurse(args, pkgnames, suffix="native"):
     :returns: list of pkgnames: consists of the initial pkgnames plus all
               depends
     """
+    arch = pmb.parse.arch.from_chroot_suffix(args, suffix)
+    key = recurse_cache_key(args, pkgnames, arch, suffix)
+    if key in args.cache["depends"]:
+        logging.verbose("(" + suffix + ") depends of " + ", ".join(pkgnames) +
+                        " have been calculated already")
+        return list(args.cache["depends"][key])
+
     logging.debug("(" + suffix + ") calculate depends of " +
                   ", ".join(pkgnames) + " (pmbootstrap -v for details)")
+    ret = recurse_uncached(args, pkgnames, arch, suffix)
+    args.cache["depends"][key] = ret
+    return list(ret)
+
+
+def recurse_uncached(args, pkgnames, arch, suffix, nodes=None):
+    """
+    Find all dependencies of the given pkgnames, see recurse().
 
-    # Iterate over todo-list until is is empty
-    todo = list(pkgnames)
-    ret = []
+    :param nodes: when set to a dict, add one node for each resolved pkgname
+                  or depend to it (see graph())
+    """
+    # Iterate over todo-list until is is empty. The queued pkgnames get
+    # counted, so "will be installed anyway" (see package_provider()) can be
+    # checked without building a list of ret and todo in each iteration.
+    todo = collections.deque(pkgnames)
+    queued = collections.Counter(pkgnames)
+    ret = collections.OrderedDict()
+    pkgnames_install = collections.ChainMap(ret, queued)
+    providers = {}
+    providers_todo = list(pkgnames)
     while len(todo):
         # Skip already passed entries
-        pkgname_depend = todo.pop(0)
+        pkgname_depend = todo.popleft()
+        start = time.time()
+        queued[pkgname_depend] -= 1
+        if not queued[pkgname_depend]:
+            del queued[pkgname_depend]
         if pkgname_depend in ret:
             continue
 
+        # Look up the binary providers of all queued packages at once
+        if pkgname_depend not in providers:
+            lookup = [pkgname for pkgname in providers_todo
+                      if pkgname not in providers]
+            providers.update(pmb.parse.apkindex.providers_many(
+                args, list(collections.OrderedDict.fromkeys(lookup)), arch,
+                False))
+            providers_todo = []
+
         # Get depends and pkgname from aports
-        pkgnames_install = list(ret) + todo
-        package = package_from_aports(args, pkgname_depend)
+        package_aport = package_from_aports(args, pkgname_depend)
         package = package_from_index(args, pkgname_depend, pkgnames_install,
-                                     package, suffix)
+                                     package_aport, suffix,
+                                     providers[pkgname_depend])
+        if nodes is not None and package:
+            nodes[pkgname_depend] = graph_node(args, pkgname_depend,
+                                               pkgnames_install, suffix,
+                                               providers[pkgname_depend],
+                                               package, package_aport,
+                                               time.time() - start)
 
         # Nothing found
         if not package:
@@ -166,6 +267,82 @@ def recurse(args, pkgnames, suffix="native"):
             depends = package["depends"]
             logging.verbose(pkgname + ": depends on: " + ",".join(depends))
             if depends:
-                todo += depends
-            ret.append(pkgname)
+                todo.extend(depends)
+                queued.update(depends)
+                providers_todo.extend(depends)
+            ret[pkgname] = True
+    return list(ret)
+
+
+def graph_node(args, pkgname_depend, pkgnames_install, suffix, providers,
+               package, package_aport, seconds):
+    """
+    Describe how one depend was resolved in recurse_uncached().
+
+    :param providers: binary package providers of pkgname_depend
+    :param package: return value of package_from_index()
+    :param package_aport: return value of package_from_aports()
+    :param seconds: time it took to resolve the depend
+    :returns: { "pkgname": "...", "version": "...", "origin": "aport" or
+                "binary", "depends": [...], "providers": [...],
+                "rule": "...", "seconds": ... }
+    """
+    rule = package_provider_rule(args, pkgname_depend, pkgnames_install,
+                                 suffix, providers)[1]
+    origin = "binary"
+    reason = provider_rules[rule]
+    if package is package_aport:
+        origin = "aport"
+        if rule:
+            reason = "binary package is outdated"
+    return {"pkgname": package["pkgname"],
+            "version": package["version"],
+            "origin": origin,
+            "depends": list(package["depends"]),
+            "providers": list(providers),
+            "rule": reason,
+            "seconds": seconds}
+
+
+def graph(args, pkgnames, suffix="native"):
+    """
+    Resolve the dependencies of the given pkgnames like recurse() (without
+    using its cache), and describe how each depend was resolved.
+
+    :returns: { "pkgnames": [...], "arch": "...", "suffix": "...",
+                "resolved": return value of recurse(),
+                "seconds": total time,
+                "nodes": { pkgname_depend: see graph_node(), ... }}
+    """
+    arch = pmb.parse.arch.from_chroot_suffix(args, suffix)
+    nodes = collections.OrderedDict()
+    start = time.time()
+    resolved = recurse_uncached(args, pkgnames, arch, suffix, nodes)
+    return {"pkgnames": list(pkgnames),
+            "arch": arch,
+            "suffix": suffix,
+            "resolved": resolved,
+            "seconds": time.time() - start,
+            "nodes": nodes}
+
+
+def graph_dot(graph):
+    """
+    Format the return value of graph() for graphviz' dot.
+
+    :returns: the graph as string
+    """
+    ret = "digraph deptree {\n"
+    ret += "\tnode [shape=box];\n"
+    for pkgname_depend, node in graph["nodes"].items():
+        label = pkgname_depend
+        if node["pkgname"] != pkgname_depend:
+            label += "\\n=> " + node["pkgname"]
+        label += ("\\n" + node["version"] + " (" + node["origin"] + ")\\n" +
+                  node["rule"] + "\\n" +
+                  "{:.1f} ms".format(node["seconds"] * 1000))
+        ret += "\t\"" + pkgname_depend + "\" [label=\"" + label + "\"];\n"
+        for depend in collections.OrderedDict.fromkeys(node["depends"]):
+            ret += "\t\"" + pkgname_depend + "\" -> \"" + depend + "\";\n"
+    ret += "}\n"
     return ret
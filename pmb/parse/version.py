@@ -23,6 +23,7 @@ is heavily based on:
 
 https://git.alpinelinux.org/cgit/apk-tools/tree/src/version.c
 """
+import functools
 
 
 def token_value(string):
@@ -50,6 +51,10 @@ def token_value(string):
     return order[string]
 
 
+# Values of the tokens, after which a version string ends
+token_values_last = (token_value("end"), token_value("invalid"))
+
+
 def next_token(previous, rest):
     """
     Parse the next token in the rest of the version string, we're
@@ -217,6 +222,28 @@ def validate(version):
     return True
 
 
+@functools.lru_cache(maxsize=16384)
+def version_key(version):
+    """
+    Tokenize a version string once, so it can be compared to other version
+    strings without parsing it again. The result is cached, because the
+    same versions get compared over and over again (providers, duplicate
+    APKINDEX blocks, installed packages).
+
+    :param version: full version string
+    :returns: tuple of (value, token) tuples, one for each get_token() call
+              (token is the token_value() of the next token). The last
+              token is always "end" or "invalid".
+    """
+    ret = []
+    current = "digit"
+    rest = version
+    while current not in ["end", "invalid"]:
+        (current, value, rest) = get_token(current, rest)
+        ret.append((value, token_value(current)))
+    return tuple(ret)
+
+
 def compare(a_version, b_version, fuzzy=False):
     """
     Compare two versions A and B to find out which one is higher, or if
@@ -234,21 +261,22 @@ def compare(a_version, b_version, fuzzy=False):
 
     C equivalent: apk_version_compare_blob_fuzzy()
     """
+    return compare_keys(version_key(a_version), version_key(b_version), fuzzy)
+
 
-    # Defaults
-    a_token = "digit"
-    b_token = "digit"
-    a_value = 0
-    b_value = 0
-    a_rest = a_version
-    b_rest = b_version
-
-    # Parse A and B one token at a time, until one string ends, or the
-    # current token has a different type/value
-    while (a_token == b_token and a_token not in ["end", "invalid"] and
-           a_value == b_value):
-        (a_token, a_value, a_rest) = get_token(a_token, a_rest)
-        (b_token, b_value, b_rest) = get_token(b_token, b_rest)
+def compare_keys(a_key, b_key, fuzzy=False):
+    """
+    Same as compare(), but with the return values of version_key() instead
+    of the version strings.
+    """
+    # Walk through the tokens of A and B, until one string ends, or the
+    # current token has a different type/value (the last token of each
+    # key is "end" or "invalid", so this always stops inside both keys)
+    for i, (a_token, b_token) in enumerate(zip(a_key, b_key)):
+        if a_token != b_token or a_token[1] in token_values_last:
+            break
+    (a_value, a_token) = a_token
+    (b_value, b_token) = b_token
 
     # Compare the values inside the last tokens
     if a_value < b_value:
@@ -264,21 +292,51 @@ def compare(a_version, b_version, fuzzy=False):
     # Leading version components and their values are equal, now the
     # non-terminating version is greater unless it's a suffix
     # indicating pre-release
-    if a_token == "suffix":
-        (a_token, a_value, a_rest) = get_token(a_token, a_rest)
+    suffix = token_value("suffix")
+    if a_token == suffix:
+        (a_value, a_token) = a_key[i + 1]
         if a_value < 0:
             return -1
-    if b_token == "suffix":
-        (b_token, b_value, b_rest) = get_token(b_token, b_rest)
+    if b_token == suffix:
+        (b_value, b_token) = b_key[i + 1]
         if b_value < 0:
             return 1
 
     # Compare the token value (e.g. digit < letter)
-    if token_value(a_token) > token_value(b_token):
+    if a_token > b_token:
         return -1
-    if token_value(a_token) < token_value(b_token):
+    if a_token < b_token:
         return 1
 
     # The tokens are not the same, but previous checks revealed that it
     # is equal anyway (e.g. "1.0" == "1").
     return 0
+
+
+def max(versions, key=None):
+    """
+    Find the highest version, tokenizing each version only once.
+
+    compare() is not transitive for versions, that are equal without being
+    the same (e.g. "1_p-r1" is equal to both "1-r1" and "1-r2", but "1-r1" is
+    lower than "1-r2"). So the result is not the highest version seen so far
+    (which would depend on the order), but the first one of all versions,
+    that no other version is higher than: "1-r1" never wins over "1-r2".
+    For the same reason, there is no function to sort versions.
+
+    :param versions: list of version strings (or other items, see key)
+    :param key: function, that returns the version string of an item (e.g.
+                lambda block: block["version"] for APKINDEX blocks)
+    :returns: the highest version (the first one, if multiple versions are
+              equal), or None if versions is empty
+    """
+    highest = []
+    for item in versions:
+        item_key = version_key(key(item) if key else item)
+        if any(compare_keys(other_key, item_key) == 1 for other_key, other in
+               highest):
+            continue
+        highest = [(other_key, other) for other_key, other in highest
+                   if compare_keys(item_key, other_key) != 1]
+        highest.append((item_key, item))
+    return highest[0][1] if highest else None
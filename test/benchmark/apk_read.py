@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Compare reading the metadata of apk files with pmb.parse.apk.control()
+against opening them with tarfile, like pmb.chroot.apk_static.extract() does
+(which decompresses the whole file, including the data segment).
+
+usage: test/benchmark/apk_read.py [DIR] [COUNT]
+
+Without DIR, COUNT synthetic apk files get generated in a temporary folder.
+"""
+
+import glob
+import os
+import sys
+import tarfile
+import tempfile
+import timeit
+
+# Import from parent directory
+sys.path.append(os.path.dirname(__file__))
+import synthetic
+import pmb.parse.apk
+
+
+def legacy_control(path):
+    with tarfile.open(path, "r:gz") as tar:
+        members = tar.getmembers()
+        for member in members:
+            if member.name == ".PKGINFO":
+                content = tar.extractfile(member).read().decode()
+                return pmb.parse.apk.parse_pkginfo(content)
+    raise RuntimeError("Could not find .PKGINFO in " + path)
+
+
+def streaming_control(path):
+    return pmb.parse.apk.control(path)["pkginfo"]
+
+
+def benchmark(paths):
+    size = sum(os.path.getsize(path) for path in paths)
+    print(str(len(paths)) + " apk files, " + str(size // 1024 // 1024) +
+          " MiB")
+
+    # Both implementations must return the same metadata
+    for path in paths:
+        assert legacy_control(path) == streaming_control(path)
+
+    results = []
+    for name, func in [("tarfile", legacy_control),
+                       ("streaming", streaming_control)]:
+        seconds = min(timeit.repeat(lambda: [func(path) for path in paths],
+                                    number=1, repeat=3))
+        results.append(seconds)
+        print("{:<10} {:8.3f} s {:10.1f} files/s {:10.1f} MiB/s".format(
+              name, seconds, len(paths) / seconds,
+              size / 1024 / 1024 / seconds))
+    print("speedup:   {:8.2f}x".format(results[0] / results[1]))
+
+
+def main():
+    folder = sys.argv[1] if len(sys.argv) > 1 else None
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    if folder:
+        paths = sorted(glob.glob(folder + "/*.apk"))[:count]
+        if not paths:
+            print("ERROR: no apk files found in " + folder)
+            sys.exit(1)
+        benchmark(paths)
+        return
+
+    with tempfile.TemporaryDirectory() as work:
+        paths = []
+        for i in range(count):
+            paths.append(synthetic.apk(work + "/" + synthetic.pkgname(i) +
+                                       ".apk", synthetic.pkgname(i), "1-r0",
+                                       depends=["musl"],
+                                       data_size=512 * 1024, seed=i))
+        benchmark(paths)
+
+
+if __name__ == "__main__":
+    main()
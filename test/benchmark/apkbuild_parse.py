@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Compare the single-pass APKBUILD attribute parser with the previous
+implementation, which checked every line against every attribute, by parsing
+all APKBUILDs in aports/.
+
+usage: test/benchmark/apkbuild_parse.py
+"""
+
+import glob
+import os
+import sys
+import timeit
+
+# Import from parent directory
+sys.path.append(os.path.dirname(__file__))
+import synthetic
+import pmb.config
+import pmb.parse._apkbuild
+
+
+def legacy_parse_file(path):
+    """
+    pmb.parse._apkbuild.parse_file() as it was before the single-pass parser.
+    """
+    with open(path, encoding="utf-8") as handle:
+        lines = handle.readlines()
+        if handle.newlines != '\n':
+            raise RuntimeError("Wrong line endings in APKBUILD: " + path)
+
+    ret = {}
+    for i in range(len(lines)):
+        for attribute, options in pmb.config.apkbuild_attributes.items():
+            if not lines[i].startswith(attribute + "="):
+                continue
+
+            line_value = lines[i][len(attribute + "="):-1]
+            end_char = None
+            if line_value.startswith("\""):
+                end_char = "\""
+            value = ""
+            first_line = i
+            while i < len(lines) - 1:
+                value += line_value.replace("\"", "").strip()
+                if not end_char:
+                    break
+                elif line_value.endswith(end_char):
+                    if i != first_line or line_value.count(end_char) > 1:
+                        break
+                value += " "
+                i += 1
+                line_value = lines[i][:-1]
+
+            if options["array"]:
+                if value:
+                    value = list(filter(None, value.split(" ")))
+                else:
+                    value = []
+            ret[attribute] = value
+
+    for attribute, options in pmb.config.apkbuild_attributes.items():
+        if attribute not in ret:
+            if options["array"]:
+                ret[attribute] = []
+            else:
+                ret[attribute] = ""
+
+    ret = pmb.parse._apkbuild.replace_variables(ret)
+    ret = pmb.parse._apkbuild.cut_off_function_names(ret)
+    return ret
+
+
+def parse_all(func, paths):
+    ret = {}
+    for path in paths:
+        try:
+            ret[path] = func(path)
+        except Exception as e:
+            ret[path] = str(e)
+    return ret
+
+
+def main():
+    paths = sorted(glob.glob(synthetic.pmb_src + "/aports/*/*/APKBUILD"))
+    repeat = 5
+    print("APKBUILDs: " + str(len(paths)))
+
+    # Both implementations must return the same result
+    assert (parse_all(legacy_parse_file, paths) ==
+            parse_all(pmb.parse._apkbuild.parse_file, paths))
+
+    results = []
+    for name, func in [("legacy", legacy_parse_file),
+                       ("single-pass", pmb.parse._apkbuild.parse_file)]:
+        seconds = min(timeit.repeat(lambda: parse_all(func, paths), number=1,
+                                    repeat=repeat))
+        results.append(seconds)
+        print("{:<12} {:8.3f} s".format(name, seconds))
+    print("speedup:     {:8.2f}x".format(results[0] / results[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Measure the peak RSS after parsing the APKINDEX files of three repositories
+for all four build architectures, with blocks stored as plain dicts (like
+before pmb.parse.apkindex.Block existed) and as Block objects. Each variant
+runs in its own process, so the peak RSS values do not influence each other.
+
+usage: test/benchmark/apkindex_memory.py [COUNT]
+"""
+
+import collections
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+# Import from parent directory
+sys.path.append(os.path.dirname(__file__))
+import synthetic
+import apkindex_parse
+import pmb.config
+import pmb.parse.apkindex
+
+repos = ["main", "community", "testing"]
+
+
+def paths(work):
+    ret = []
+    for arch in pmb.config.build_device_architectures:
+        for repo in repos:
+            ret.append(work + "/APKINDEX." + arch + "." + repo + ".tar.gz")
+    return ret
+
+
+def parse_all(work, mode):
+    """
+    Parse all synthetic APKINDEX files and keep the result in memory.
+
+    :param mode: "dict" or "block"
+    :returns: peak RSS in KiB
+    """
+    indexes = []
+    for path in paths(work):
+        if mode == "dict":
+            blocks = apkindex_parse.legacy_parse_blocks(path)
+        else:
+            blocks = pmb.parse.apkindex.parse_blocks(None, path)
+
+        ret = collections.OrderedDict()
+        for block in blocks:
+            pmb.parse.apkindex.parse_add_block(ret, block)
+            for alias in block["provides"]:
+                pmb.parse.apkindex.parse_add_block(ret, block, alias)
+        indexes.append(ret)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main():
+    # Child process
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        print(parse_all(sys.argv[2], sys.argv[3]))
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    with tempfile.TemporaryDirectory() as work:
+        for i, path in enumerate(paths(work)):
+            arch = os.path.basename(path).split(".")[1]
+            synthetic.apkindex(path, count, arch, i)
+        print("Synthetic APKINDEX files: " + str(len(paths(work))) + " x " +
+              str(count) + " packages")
+
+        results = {}
+        for mode in ["dict", "block"]:
+            output = subprocess.check_output([sys.executable, __file__,
+                                              "--child", work, mode])
+            results[mode] = int(output)
+            print("{:<6} peak RSS: {:8.1f} MiB".format(
+                  mode, results[mode] / 1024))
+        print("saved:  {:8.1f} %".format(100 - 100 * results["block"] /
+                                         results["dict"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Compare the streaming APKINDEX parser with the previous implementation, which
+read all lines into memory and checked every line against every key. Also
+measure parsing multiple files with and without a process pool.
+
+usage: test/benchmark/apkindex_parse.py [COUNT]
+"""
+
+import os
+import sys
+import tarfile
+import tempfile
+import timeit
+
+# Import from parent directory
+sys.path.append(os.path.dirname(__file__))
+import synthetic
+import pmb.config
+import pmb.parse.apkindex
+
+
+def legacy_parse_next_block(path, lines, start):
+    """
+    parse_next_block() as it was before the streaming parser (without the
+    checks for required keys, they are the same in both implementations).
+    """
+    ret = {}
+    mapping = {"A": "arch", "D": "depends", "o": "origin", "P": "pkgname",
+               "p": "provides", "t": "timestamp", "V": "version"}
+    end_of_block_found = False
+    for i in range(start[0], len(lines)):
+        start[0] = i + 1
+        line = lines[i]
+        if not isinstance(line, str):
+            line = line.decode()
+        if line == "\n":
+            end_of_block_found = True
+            break
+        for letter, key in mapping.items():
+            if line.startswith(letter + ":"):
+                ret[key] = line[2:-1]
+
+    if not end_of_block_found:
+        return None
+    for key in ["provides", "depends"]:
+        if key in ret and ret[key] != "":
+            values = ret[key].split(" ")
+            ret[key] = []
+            for value in values:
+                if value.startswith("!"):
+                    continue
+                for operator in [">", "=", "<"]:
+                    if operator in value:
+                        value = value.split(operator)[0]
+                        break
+                ret[key].append(value)
+        else:
+            ret[key] = []
+    return ret
+
+
+def legacy_parse_blocks(path):
+    with tarfile.open(path, "r:gz") as tar:
+        with tar.extractfile(tar.getmember("APKINDEX")) as handle:
+            lines = handle.readlines()
+    ret = []
+    start = [0]
+    while True:
+        block = legacy_parse_next_block(path, lines, start)
+        if not block:
+            return ret
+        ret.append(block)
+
+
+def streaming_parse_blocks(path):
+    with pmb.parse.apkindex.open_apkindex(path) as handle:
+        return list(pmb.parse.apkindex.read_blocks(path, handle))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    repeat = 3
+
+    with tempfile.TemporaryDirectory() as work:
+        path = synthetic.apkindex(work + "/APKINDEX.tar.gz", count)
+        print("Synthetic APKINDEX: " + str(count) + " packages, " +
+              str(os.path.getsize(path) // 1024) + " KiB compressed")
+
+        # Both implementations must return the same blocks
+        for legacy, block in zip(legacy_parse_blocks(path),
+                                 streaming_parse_blocks(path)):
+            for key in ["depends", "provides"]:
+                legacy[key] = tuple(legacy[key])
+            assert block == legacy
+
+        results = []
+        for name, func in [("legacy", legacy_parse_blocks),
+                           ("streaming", streaming_parse_blocks)]:
+            seconds = min(timeit.repeat(lambda: func(path), number=1,
+                                        repeat=repeat))
+            results.append(seconds)
+            print("{:<10} {:8.3f} s".format(name, seconds))
+        print("speedup:   {:8.2f}x".format(results[0] / results[1]))
+
+        # Full parse() with and without the persistent cache
+        def parse_cold():
+            args = synthetic.args(work)
+            pmb.parse.apkindex.clear_cache(args, path)
+            pmb.parse.apkindex.parse(args, path)
+
+        def parse_warm():
+            pmb.parse.apkindex.parse(synthetic.args(work), path)
+
+        for name, func in [("parse() without persistent cache", parse_cold),
+                           ("parse() with persistent cache", parse_warm)]:
+            seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+            print("{:<34} {:8.3f} s".format(name, seconds))
+
+        # parse_many() of one file per build architecture, without the
+        # persistent cache
+        paths = []
+        for i, arch in enumerate(pmb.config.build_device_architectures):
+            paths.append(synthetic.apkindex(work + "/APKINDEX." + arch +
+                                            ".tar.gz", count, arch, i))
+        for jobs in [1, len(paths)]:
+            def parse_many_cold():
+                args = synthetic.args(work)
+                args.parse_jobs = jobs
+                for path in paths:
+                    pmb.parse.apkindex.clear_cache(args, path)
+                pmb.parse.apkindex.parse_many(args, paths)
+
+            seconds = min(timeit.repeat(parse_many_cold, number=1,
+                                        repeat=repeat))
+            print("{:<34} {:8.3f} s".format("parse_many() of " +
+                                            str(len(paths)) + " files, " +
+                                            str(jobs) + " jobs", seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Compare pmb.parse.depends.recurse() with the previous implementation (list
+based todo queue and result, rebuilding the list of packages to be installed
+in every iteration) on a synthetic APKINDEX. The packages get resolved with
+increasingly large dependency graphs, up to all packages in the APKINDEX.
+
+usage: test/benchmark/depends_recurse.py [COUNT]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import timeit
+
+# Import from parent directory
+sys.path.append(os.path.dirname(__file__))
+import synthetic
+import pmb.parse.apkindex
+import pmb.parse.depends
+
+
+def legacy_recurse(args, pkgnames, suffix="native"):
+    """
+    pmb.parse.depends.recurse() as it was before the rewrite (without the
+    verbose logging).
+    """
+    arch = pmb.parse.arch.from_chroot_suffix(args, suffix)
+    todo = list(pkgnames)
+    ret = []
+    providers = {}
+    while len(todo):
+        pkgname_depend = todo.pop(0)
+        if pkgname_depend in ret:
+            continue
+
+        if pkgname_depend not in providers:
+            queued = [pkgname_depend] + [pkgname for pkgname in todo
+                                         if pkgname not in providers]
+            providers.update(pmb.parse.apkindex.providers_many(args, queued,
+                                                               arch, False))
+
+        pkgnames_install = list(ret) + todo
+        package = pmb.parse.depends.package_from_aports(args, pkgname_depend)
+        package = pmb.parse.depends.package_from_index(
+            args, pkgname_depend, pkgnames_install, package, suffix,
+            providers[pkgname_depend])
+        if not package:
+            raise RuntimeError("Could not find package '" + pkgname_depend +
+                               "' in any aports folder or APKINDEX.")
+
+        pkgname = package["pkgname"]
+        if pkgname not in ret:
+            if package["depends"]:
+                todo += package["depends"]
+            ret.append(pkgname)
+    return ret
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeat = 3
+
+    with tempfile.TemporaryDirectory() as work:
+        # Synthetic local repository, empty aports folder, no other repos
+        args = synthetic.args(work)
+        args.aports = work + "/aports"
+        args.mirror_postmarketos = ""
+        args.mirror_alpine = "http://localhost/alpine/"
+        args.alpine_version = "edge"
+        os.makedirs(args.aports + "/main")
+        os.makedirs(work + "/packages/x86_64")
+        synthetic.apkindex(work + "/packages/x86_64/APKINDEX.tar.gz", count)
+        logging.getLogger().setLevel(logging.WARNING)
+
+        step = max(count // 5, 1)
+        for size in list(range(step, count, step)) + [count]:
+            pkgnames = [synthetic.pkgname(i) for i in range(size)]
+
+            # Both implementations must return the same packages
+            ret = pmb.parse.depends.recurse(args, pkgnames)
+            assert ret == legacy_recurse(args, pkgnames)
+
+            results = []
+            for func in [legacy_recurse, pmb.parse.depends.recurse]:
+                results.append(min(timeit.repeat(lambda: func(args, pkgnames),
+                                                 number=1, repeat=repeat)))
+            print("{:>6} packages ({:>6} resolved): legacy {:7.3f} s, new"
+                  " {:7.3f} s, speedup {:6.2f}x".format(
+                      size, len(ret), results[0], results[1],
+                      results[0] / results[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Run trivial commands as root (on the host system and in the native chroot),
+once with sudo for each command and once with the persistent root helper
+(--root-helper). Unlike the other benchmarks, this one needs a working
+pmbootstrap installation (config, work folder, sudo).
+
+usage: test/benchmark/root_commands.py [COUNT]
+"""
+
+import os
+import sys
+import time
+
+# Import from parent directory
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__) +
+                                              "/../..")))
+import pmb.chroot
+import pmb.helpers.logging
+import pmb.helpers.root_helper
+import pmb.helpers.run
+import pmb.parse
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    sys.argv = ["pmbootstrap.py", "chroot"]
+    args = pmb.parse.arguments()
+    pmb.helpers.logging.init(args)
+
+    # Initialize the chroot and let sudo ask for the password (if necessary)
+    # before measuring
+    pmb.chroot.init(args)
+    pmb.helpers.run.root(args, ["true"])
+
+    print(str(count) + " commands each")
+    for name, func in [("host", pmb.helpers.run.root),
+                       ("chroot", pmb.chroot.root)]:
+        results = []
+        for root_helper in [False, True]:
+            args.root_helper = root_helper
+            if root_helper:
+                # Start the helper process before measuring
+                func(args, ["true"])
+            begin = time.perf_counter()
+            for i in range(count):
+                func(args, ["true"])
+            seconds = time.perf_counter() - begin
+            results.append(seconds)
+            print("{:<8} {:<12} {:8.3f} s {:8.2f} ms/command".format(
+                  name, "root helper" if root_helper else "sudo", seconds,
+                  seconds * 1000 / count))
+        print("{:<8} {:<12} {:8.2f}x".format(name, "speedup",
+                                             results[0] / results[1]))
+    pmb.helpers.root_helper.stop(args)
+    args.logfd.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Generate synthetic input data for the benchmark scripts in this folder.
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import os
+import random
+import subprocess
+import sys
+import tarfile
+
+# Import from parent directory
+pmb_src = os.path.realpath(os.path.join(os.path.dirname(__file__) + "/../.."))
+sys.path.append(pmb_src)
+import pmb.helpers.logging
+
+
+def args(work):
+    """
+    Minimal args object, that is enough for the pmb.parse functions used in
+    the benchmarks (instead of parsing the pmbootstrap config).
+
+    :param work: temporary work folder
+    """
+    pmb.helpers.logging.add_verbose_log_level()
+    return argparse.Namespace(work=work,
+                              arch_native="x86_64",
+                              parse_jobs=1,
+                              cache={"apkindex": {},
+                                     "apkindex_merged": {},
+                                     "apkbuild": {},
+                                     "apkbuild_persistent": {},
+                                     "aports_index": {},
+                                     "depends": {},
+                                     "find_aport": {},
+                                     "fingerprint": {}})
+
+
+def pkgname(i):
+    return "pkg" + str(i)
+
+
+def version(rand):
+    ret = ".".join(str(rand.randint(0, 20)) for i in range(rand.randint(1, 4)))
+    if rand.random() < 0.2:
+        ret += rand.choice(["_alpha", "_beta", "_rc", "_git", "_p"])
+        ret += str(rand.randint(1, 20180101))
+    return ret + "-r" + str(rand.randint(0, 12))
+
+
+def blocks(count, arch="x86_64", seed=1):
+    """
+    Generate APKINDEX blocks, similar to the ones in Alpine's repositories.
+    Each package depends on a few packages with a lower number, provides a
+    command and every fifth package provides a shared library.
+
+    :param count: amount of packages
+    :returns: generator of the blocks as text
+    """
+    rand = random.Random(seed)
+    for i in range(count):
+        depends = []
+        for j in range(rand.randint(0, 8) if i else 0):
+            depend = rand.randint(0, i - 1)
+            if depend % 5 == 0 and rand.random() < 0.5:
+                depends.append("so:lib" + pkgname(depend) + ".so.1")
+            else:
+                depends.append(pkgname(depend))
+        provides = ["cmd:" + pkgname(i) + "=" + str(i)]
+        if i % 5 == 0:
+            provides.append("so:lib" + pkgname(i) + ".so.1=1.0.0")
+
+        yield ("C:Q1" + "%027x" % rand.getrandbits(108) + "=\n"
+               "P:" + pkgname(i) + "\n"
+               "V:" + version(rand) + "\n"
+               "A:" + arch + "\n"
+               "S:" + str(rand.randint(1000, 10000000)) + "\n"
+               "I:" + str(rand.randint(1000, 50000000)) + "\n"
+               "T:Synthetic benchmark package " + str(i) + "\n"
+               "U:https://postmarketos.org\n"
+               "L:GPL-3.0-or-later\n"
+               "o:" + pkgname(i - i % 3) + "\n"
+               "m:postmarketOS <info@postmarketos.org>\n"
+               "t:" + str(1500000000 + i) + "\n"
+               "c:" + "%040x" % rand.getrandbits(160) + "\n"
+               "D:" + " ".join(depends) + "\n"
+               "p:" + " ".join(provides) + "\n"
+               "\n")
+
+
+def apkindex(path, count, arch="x86_64", seed=1):
+    """
+    Write a synthetic APKINDEX.tar.gz.
+
+    :param path: output file
+    :param count: amount of packages
+    """
+    content = "".join(blocks(count, arch, seed)).encode("utf-8")
+    with tarfile.open(path, "w:gz") as tar:
+        for name, data in [("DESCRIPTION", b"synthetic"),
+                           ("APKINDEX", content)]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return path
+
+
+def tar_segment(files):
+    """
+    Create one gzip compressed segment of an apk file: a tar archive without
+    the end of archive blocks, just like abuild creates them.
+
+    :param files: list of (name, content as bytes)
+    """
+    buffer = io.BytesIO()
+    tar = tarfile.open(fileobj=buffer, mode="w", format=tarfile.PAX_FORMAT)
+    for name, data in files:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = 1500000000
+        tar.addfile(info, io.BytesIO(data))
+    offset = tar.offset
+    tar.close()
+    return gzip.compress(buffer.getvalue()[:offset], 9)
+
+
+def apk(path, pkgname, version, arch="x86_64", depends=[], provides=[],
+        data_size=4096, signed=True, seed=1, key=None):
+    """
+    Write a synthetic .apk file (signature, control and data segment).
+
+    :param data_size: size of the (random, incompressible) file in the data
+                      segment
+    :param key: path to a private key like abuild creates them
+                ("name.rsa", the public key is "name.rsa.pub"). When set, the
+                package gets a real signature made with openssl instead of a
+                random one.
+    :returns: path
+    """
+    rand = random.Random(seed)
+    pkginfo = ("# Generated by abuild 3.2.0-r0\n"
+               "# using fakeroot version 1.22\n"
+               "pkgname = " + pkgname + "\n"
+               "pkgver = " + version + "\n"
+               "pkgdesc = Synthetic benchmark package\n"
+               "url = https://postmarketos.org\n"
+               "builddate = 1500000000\n"
+               "packager = postmarketOS <info@postmarketos.org>\n"
+               "size = " + str(data_size) + "\n"
+               "arch = " + arch + "\n"
+               "origin = " + pkgname + "\n"
+               "commit = " + "%040x" % rand.getrandbits(160) + "\n"
+               "maintainer = postmarketOS <info@postmarketos.org>\n"
+               "license = GPL-3.0-or-later\n")
+    for depend in depends:
+        pkginfo += "depend = " + depend + "\n"
+    for provide in provides:
+        pkginfo += "provides = " + provide + "\n"
+
+    data = rand.getrandbits(8 * data_size).to_bytes(data_size, "little")
+    data = tar_segment([("usr/bin/" + pkgname, data)])
+    pkginfo += "datahash = " + hashlib.sha256(data).hexdigest() + "\n"
+    control = tar_segment([(".PKGINFO", pkginfo.encode())])
+    with open(path, "wb") as handle:
+        if key:
+            signature = subprocess.run(["openssl", "dgst", "-sha1", "-sign",
+                                        key], input=control, check=True,
+                                       stdout=subprocess.PIPE).stdout
+            handle.write(tar_segment([(".SIGN.RSA." + os.path.basename(key) +
+                                       ".pub", signature)]))
+        elif signed:
+            signature = rand.getrandbits(8 * 256).to_bytes(256, "little")
+            handle.write(tar_segment([(".SIGN.RSA.synthetic.rsa.pub",
+                                       signature)]))
+        handle.write(control)
+        handle.write(data)
+    return path
@@ -68,3 +68,15 @@ def test_aports_device(args):
                                    " depends of " + path + ". These go into"
                                    " subpackages now, see"
                                    " <https://postmarketos.org/devicepkg>.")
+
+
+def test_aports_apkbuild_all(args):
+    """
+    Parse all APKBUILDs at once, in two worker processes.
+    """
+    args.parse_jobs = 2
+    apkbuilds, errors = pmb.parse.apkbuild_all(args)
+    assert errors == {}
+    assert len(apkbuilds) == len(glob.glob(args.aports + "/*/*/APKBUILD"))
+    for path, apkbuild in apkbuilds.items():
+        assert pmb.parse.apkbuild(args, path) is apkbuild
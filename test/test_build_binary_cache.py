@@ -0,0 +1,267 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+This file tests all functions from pmb.build.binary_cache.
+"""
+
+import functools
+import http.server
+import os
+import pytest
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+
+# Import from parent directory
+sys.path.append(os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+sys.path.append(os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/benchmark")))
+import synthetic
+import pmb.build
+import pmb.build.binary_cache
+import pmb.build.other
+import pmb.config
+import pmb.helpers.logging
+import pmb.helpers.run
+import pmb.parse.apkindex
+
+
+@pytest.fixture
+def args(request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap.py", "build", "hello-world"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    return args
+
+
+def return_none(*args, **kwargs):
+    return None
+
+
+@pytest.fixture
+def aport(args, monkeypatch, tmpdir):
+    """
+    Copy of the hello-world aport, with a work folder in tmpdir.
+
+    :returns: apkbuild of the copied aport
+    """
+    tmpdir = str(tmpdir)
+    aport = tmpdir + "/aports/hello-world"
+    shutil.copytree(pmb.build.other.find_aport(args, "hello-world"), aport)
+    args.cache["find_aport"]["hello-world"] = aport
+    args.work = tmpdir + "/work"
+    args.binary_cache = tmpdir + "/binary_cache"
+    os.makedirs(args.work + "/packages/x86_64")
+
+    # Trusted package signing key
+    args.key = tmpdir + "/work/config_abuild/test.rsa"
+    os.makedirs(os.path.dirname(args.key))
+    os.makedirs(args.work + "/config_apk_keys")
+    subprocess.run(["openssl", "genrsa", "-out", args.key, "2048"],
+                   check=True, stderr=subprocess.DEVNULL)
+    subprocess.run(["openssl", "rsa", "-in", args.key, "-pubout", "-out",
+                    args.work + "/config_apk_keys/test.rsa.pub"], check=True,
+                   stderr=subprocess.DEVNULL)
+
+    # Copy without sudo, don't run anything in chroots
+    monkeypatch.setattr(pmb.helpers.run, "root",
+                        lambda args, cmd, **kwargs:
+                        pmb.helpers.run.user(args, cmd, **kwargs))
+    monkeypatch.setattr(pmb.config, "chroot_uid_user", str(os.getuid()))
+    monkeypatch.setattr(pmb.build, "init", return_none)
+    monkeypatch.setattr(pmb.build.other, "index_repo", return_none)
+    monkeypatch.setattr(pmb.build.other, "fingerprint_save", return_none)
+    monkeypatch.setattr(pmb.parse.apkindex, "package", return_none)
+    return pmb.parse.apkbuild(args, aport + "/APKBUILD")
+
+
+def apk_name(apkbuild):
+    return (apkbuild["pkgname"] + "-" + apkbuild["pkgver"] + "-r" +
+            apkbuild["pkgrel"] + ".apk")
+
+
+def write_apk(args, apkbuild, path, key=True):
+    """
+    Write a synthetic package for the apkbuild, signed with the trusted key.
+
+    :returns: content of the package
+    """
+    synthetic.apk(path, apkbuild["pkgname"], apkbuild["pkgver"] + "-r" +
+                  apkbuild["pkgrel"], key=args.key if key else None)
+    with open(path, "rb") as handle:
+        return handle.read()
+
+
+def test_key(args, aport):
+    func = pmb.build.binary_cache.key
+    key = func(args, aport, "x86_64")
+    assert func(args, aport, "x86_64") == key
+    assert func(args, aport, "armhf") != key
+    assert func(args, aport, "x86_64", "native") != key
+
+    # Dependency versions from the binary repositories
+    aport["makedepends"] = ["upstream-package"]
+    key_depend = func(args, aport, "x86_64")
+    assert key_depend != key
+    assert func(args, aport, "x86_64") == key_depend
+
+    # Changed aport folder
+    with open(args.cache["find_aport"]["hello-world"] + "/main.c", "a") as h:
+        h.write("/* changed */\n")
+    assert func(args, aport, "x86_64") != key_depend
+
+
+def test_store_restore(args, aport):
+    key = pmb.build.binary_cache.key(args, aport, "x86_64")
+    name = apk_name(aport)
+    path = args.work + "/packages/x86_64/" + name
+
+    # Nothing to store, not cached
+    pmb.build.binary_cache.store(args, aport, "x86_64", key)
+    assert pmb.build.binary_cache.files(args, "x86_64", key) is None
+    assert pmb.build.binary_cache.restore(args, aport, "x86_64", key) is None
+
+    # Store (leftover temporary folder from an interrupted run)
+    os.makedirs(args.binary_cache + "/x86_64/" + key + "." + str(os.getpid()))
+    content = write_apk(args, aport, path)
+    pmb.build.binary_cache.store(args, aport, "x86_64", key)
+    assert pmb.build.binary_cache.files(args, "x86_64", key) == [name]
+    mode = os.stat(args.binary_cache + "/x86_64/" + key).st_mode
+    assert mode & 0o777 == 0o755
+
+    # Restore in a fresh work folder
+    os.remove(path)
+    assert (pmb.build.binary_cache.restore(args, aport, "x86_64", key) ==
+            "x86_64/" + name)
+    with open(path, "rb") as handle:
+        assert handle.read() == content
+
+
+def test_restore_untrusted(args, aport):
+    key = pmb.build.binary_cache.key(args, aport, "x86_64")
+    name = apk_name(aport)
+    path = args.work + "/packages/x86_64/" + name
+    entry = args.binary_cache + "/x86_64/" + key + "/" + name
+
+    # Signed with an unknown key
+    write_apk(args, aport, path, False)
+    pmb.build.binary_cache.store(args, aport, "x86_64", key)
+    os.remove(path)
+    assert pmb.build.binary_cache.restore(args, aport, "x86_64", key) is None
+    assert not os.path.exists(path)
+
+    # Signed with a different key of the same name as the trusted key
+    evil = os.path.dirname(args.work) + "/evil/test.rsa"
+    os.makedirs(os.path.dirname(evil))
+    subprocess.run(["openssl", "genrsa", "-out", evil, "2048"], check=True,
+                   stderr=subprocess.DEVNULL)
+    synthetic.apk(entry, aport["pkgname"], aport["pkgver"] + "-r" +
+                  aport["pkgrel"], key=evil)
+    with pytest.raises(RuntimeError) as e:
+        pmb.build.binary_cache.verify(args, entry, name)
+    assert "invalid signature" in str(e.value)
+    assert pmb.build.binary_cache.restore(args, aport, "x86_64", key) is None
+    assert not os.path.exists(path)
+
+    # Data segment does not match the datahash
+    write_apk(args, aport, entry)
+    with open(entry, "r+b") as handle:
+        handle.seek(-1, os.SEEK_END)
+        last = handle.read(1)
+        handle.seek(-1, os.SEEK_END)
+        handle.write(bytes([last[0] ^ 1]))
+    with pytest.raises(RuntimeError) as e:
+        pmb.build.binary_cache.verify(args, entry, name)
+    assert "data does not match the datahash" in str(e.value)
+    assert pmb.build.binary_cache.restore(args, aport, "x86_64", key) is None
+    assert not os.path.exists(path)
+
+    # File name does not match the .PKGINFO
+    write_apk(args, aport, entry)
+    with pytest.raises(RuntimeError) as e:
+        pmb.build.binary_cache.verify(args, entry, "other-1-r0.apk")
+    assert "does not match the file name" in str(e.value)
+    pmb.build.binary_cache.verify(args, entry, name)
+
+
+def test_files_invalid(args, aport):
+    os.makedirs(args.binary_cache + "/x86_64/key")
+    with open(args.binary_cache + "/x86_64/key/files", "w") as handle:
+        handle.write("../../../etc/passwd\n")
+    with pytest.raises(RuntimeError) as e:
+        pmb.build.binary_cache.files(args, "x86_64", "key")
+    assert "Invalid file name" in str(e.value)
+
+
+def test_restore_http(args, aport):
+    # Fill a binary cache folder and serve it over HTTP
+    key = pmb.build.binary_cache.key(args, aport, "x86_64")
+    name = apk_name(aport)
+    path = args.work + "/packages/x86_64/" + name
+    content = write_apk(args, aport, path)
+    pmb.build.binary_cache.store(args, aport, "x86_64", key)
+    os.remove(path)
+
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler,
+                                directory=args.binary_cache)
+    handler.log_message = return_none
+    server = http.server.HTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        args.binary_cache = "http://127.0.0.1:" + str(server.server_port)
+        assert pmb.build.binary_cache.files(args, "x86_64", "missing") is None
+        assert (pmb.build.binary_cache.restore(args, aport, "x86_64", key) ==
+                "x86_64/" + name)
+
+        # Read only
+        pmb.build.binary_cache.store(args, aport, "x86_64", "other")
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+    with open(path, "rb") as handle:
+        assert handle.read() == content
+
+
+def test_restore_http_unreachable(args, aport, monkeypatch):
+    key = pmb.build.binary_cache.key(args, aport, "x86_64")
+    monkeypatch.setattr(pmb.config, "binary_cache_timeout", 0.1)
+
+    # Server accepts the connection, but never answers
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(1)
+    port = sock.getsockname()[1]
+    try:
+        args.binary_cache = "http://127.0.0.1:" + str(port)
+        assert pmb.build.binary_cache.restore(args, aport, "x86_64",
+                                              key) is None
+    finally:
+        sock.close()
+
+    # Connection refused
+    assert pmb.build.binary_cache.restore(args, aport, "x86_64", key) is None
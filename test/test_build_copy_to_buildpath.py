@@ -0,0 +1,168 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import pytest
+import shutil
+import sys
+
+# Import from parent directory
+sys.path.append(os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.build.other
+import pmb.chroot
+import pmb.config
+import pmb.helpers.logging
+import pmb.helpers.run
+
+
+@pytest.fixture
+def args(request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap.py", "build", "hello-world"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    return args
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as handle:
+        handle.write(content)
+
+
+def test_copy_to_buildpath_diff(tmpdir):
+    aport = str(tmpdir) + "/aport"
+    build = str(tmpdir) + "/build"
+    write(aport + "/APKBUILD", "pkgname=test\n")
+    write(aport + "/config-test.armhf", "CONFIG_TEST=y\n")
+    write(aport + "/patches/0001-fix.patch", "patch\n")
+    func = pmb.build.other.copy_to_buildpath_diff
+
+    # Build folder does not exist
+    assert func(aport, build) == ([], ["patches"], [
+        "APKBUILD", "config-test.armhf", "patches/0001-fix.patch"])
+
+    # Up to date ("cp -p" preserves the modification time)
+    shutil.copytree(aport, build, copy_function=shutil.copy2)
+    assert func(aport, build) == ([], [], [])
+
+    # Changed files, leftovers from the previous build, type changes
+    write(aport + "/config-test.armhf", "CONFIG_TEST=m\n")
+    write(build + "/src/test-1.0/main.c", "int main() {}\n")
+    write(build + "/pkg/test/usr/bin/test", "")
+    shutil.rmtree(build + "/patches")
+    write(build + "/patches", "")
+    assert func(aport, build) == (["patches", "pkg", "src"], ["patches"], [
+        "config-test.armhf", "patches/0001-fix.patch"])
+
+
+def test_copy_to_buildpath_diff_symlinks(tmpdir):
+    aport = str(tmpdir) + "/aport"
+    build = str(tmpdir) + "/build"
+    outside = str(tmpdir) + "/outside"
+    write(aport + "/APKBUILD", "pkgname=test\n")
+    write(aport + "/patches/0001-fix.patch", "patch\n")
+    write(aport + "/files/config", "\n")
+    os.symlink("files", aport + "/files-link")
+    os.symlink("APKBUILD", aport + "/APKBUILD-link")
+    write(outside + "/0001-fix.patch", "patch\n")
+    write(outside + "/important", "do not touch\n")
+    func = pmb.build.other.copy_to_buildpath_diff
+
+    # Symlinks in the aport get copied, not created as folders
+    assert func(aport, build) == ([], ["files", "patches"], [
+        "APKBUILD", "APKBUILD-link", "files-link", "files/config",
+        "patches/0001-fix.patch"])
+
+    # Symlinks in the build folder are not followed
+    os.symlink(outside, build)
+    assert func(aport, build) == ([], ["files", "patches"], [
+        "APKBUILD", "APKBUILD-link", "files-link", "files/config",
+        "patches/0001-fix.patch"])
+    os.remove(build)
+    shutil.copytree(aport, build, symlinks=True,
+                    copy_function=shutil.copy2)
+    assert func(aport, build) == ([], [], [])
+    shutil.rmtree(build + "/patches")
+    os.symlink(outside, build + "/patches")
+    os.remove(build + "/files-link")
+    os.symlink("patches", build + "/files-link")
+    assert func(aport, build) == (["patches", "files-link"], ["patches"], [
+        "files-link", "patches/0001-fix.patch"])
+
+
+def test_copy_to_buildpath(args, monkeypatch, tmpdir):
+    aport = str(tmpdir) + "/hello-world"
+    write(aport + "/APKBUILD", "pkgname=hello-world\n")
+    os.symlink("APKBUILD", aport + "/APKBUILD-link")
+    args.cache["find_aport"]["hello-world"] = aport
+    args.work = str(tmpdir)
+    build = args.work + "/chroot_native/home/pmos/build"
+    os.makedirs(os.path.dirname(build))
+
+    # Run the commands without sudo and chroot, remember them
+    commands = []
+
+    def run_root(args, cmd, *args_root, **kwargs):
+        commands.append(("host", cmd))
+        return pmb.helpers.run.user(args, cmd)
+
+    def chroot_root(args, cmd, suffix="native", *args_root, **kwargs):
+        commands.append(("chroot", cmd))
+        cmd = [arg.replace("/home/pmos/build", build) for arg in cmd]
+        return pmb.helpers.run.user(args, cmd)
+    monkeypatch.setattr(pmb.helpers.run, "root", run_root)
+    monkeypatch.setattr(pmb.chroot, "root", chroot_root)
+    monkeypatch.setattr(pmb.config, "chroot_uid_user", str(os.getuid()))
+    func = pmb.build.other.copy_to_buildpath
+
+    # Initial copy: only the copying runs on the host system
+    func(args, "hello-world")
+    assert os.path.exists(build + "/APKBUILD")
+    assert os.readlink(build + "/APKBUILD-link") == "APKBUILD"
+    assert [where for where, cmd in commands] == ["chroot", "host", "chroot"]
+
+    # Changed file, leftover symlink pointing outside of the build folder
+    outside = str(tmpdir) + "/outside"
+    write(outside + "/important", "do not touch\n")
+    os.symlink(outside, build + "/src")
+    write(aport + "/APKBUILD", "pkgname=hello-world\npkgver=1\n")
+    commands.clear()
+    func(args, "hello-world")
+    assert len(commands) == 3
+    assert not os.path.lexists(build + "/src")
+    assert os.path.exists(outside + "/important")
+    with open(build + "/APKBUILD") as handle:
+        assert handle.read() == "pkgname=hello-world\npkgver=1\n"
+
+    # Nothing changed
+    commands.clear()
+    func(args, "hello-world")
+    assert commands == []
+
+    # Symlinked home folder
+    shutil.rmtree(args.work + "/chroot_native/home/pmos")
+    os.symlink(outside, args.work + "/chroot_native/home/pmos")
+    with pytest.raises(RuntimeError) as e:
+        func(args, "hello-world")
+    assert "is a symlink" in str(e.value)
+    assert commands == []
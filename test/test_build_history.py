@@ -0,0 +1,155 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+This file tests all functions from pmb.build.history.
+"""
+
+import os
+import pytest
+import sys
+
+# Import from parent directory
+sys.path.append(os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.build.history
+import pmb.chroot
+import pmb.helpers.logging
+import pmb.helpers.run
+
+
+@pytest.fixture
+def args(request, tmpdir):
+    import pmb.parse
+    sys.argv = ["pmbootstrap.py", "stats", "builds"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    args.work = str(tmpdir)
+    return args
+
+
+def fake_record(args, pkgname, seconds, ccache=None, binary_cache=False):
+    apkbuild = {"pkgname": pkgname, "pkgver": "1.0", "pkgrel": "2"}
+    record = pmb.build.history.start(args, apkbuild, "armhf",
+                                     "buildroot_armhf")
+    record["time"]["run_abuild"] = seconds
+    record["size"] = None
+    record["ccache"] = ccache
+    record["binary_cache"] = binary_cache
+    return record
+
+
+def test_ccache_stats(args, monkeypatch):
+    func = pmb.build.history.ccache_stats
+    assert func(args) is None
+
+    output = ("cache directory                     /home/pmos/.ccache\n"
+              "cache hit (direct)                    10\n"
+              "cache hit (preprocessed)               5\n"
+              "cache miss                            15\n"
+              "files in cache                        70\n")
+    monkeypatch.setattr(pmb.chroot, "user", lambda *args, **kwargs: output)
+    os.makedirs(args.work + "/chroot_native/usr/bin")
+    open(args.work + "/chroot_native/usr/bin/ccache", "w").close()
+    assert func(args) == {"hits": 15, "misses": 15}
+
+
+def test_ccache_stats_run(args, monkeypatch, capfd):
+    # Run the command through pmb.helpers.run.core() without the chroot
+    output = "cache hit (direct)                    10\n"
+
+    def root(args, cmd, suffix, working_dir, log, auto_init, return_stdout,
+             check):
+        cmd = ["sh", "-c", "printf '" + output + "'; exit " + args.code]
+        return pmb.helpers.run.core(args, cmd, "% " + cmd[-1], log,
+                                    return_stdout, check)
+
+    monkeypatch.setattr(pmb.chroot, "root", root)
+    os.makedirs(args.work + "/chroot_native/usr/bin")
+    open(args.work + "/chroot_native/usr/bin/ccache", "w").close()
+    args.code = "0"
+    assert pmb.build.history.ccache_stats(args) == {"hits": 10, "misses": 0}
+
+    # Output goes to the log, not to the terminal
+    assert capfd.readouterr().out == ""
+    with open(args.log) as handle:
+        assert output in handle.read()
+
+    # ccache failed
+    args.code = "1"
+    assert pmb.build.history.ccache_stats(args) is None
+
+
+def test_measure_save_load(args):
+    apkbuild = {"pkgname": "hello-world", "pkgver": "1", "pkgrel": "0"}
+    record = pmb.build.history.start(args, apkbuild, "x86_64")
+    with pmb.build.history.measure(record, "run_abuild"):
+        pass
+    with pytest.raises(RuntimeError):
+        with pmb.build.history.measure(record, "finish"):
+            raise RuntimeError("failed")
+    with pmb.build.history.measure(None, "finish"):
+        pass
+
+    # Second package file is missing: no size
+    os.makedirs(args.work + "/packages/x86_64")
+    with open(args.work + "/packages/x86_64/hello-world-1-r0.apk", "w") as h:
+        h.write("x" * 2048)
+    pmb.build.history.save(args, record, "x86_64/hello-world-1-r0.apk")
+    pmb.build.history.save(args, pmb.build.history.start(args, apkbuild,
+                                                         "armhf"),
+                           "armhf/hello-world-1-r0.apk", binary_cache=True)
+    with open(pmb.build.history.path(args), "a") as handle:
+        handle.write("invalid\n")
+
+    records = pmb.build.history.load(args)
+    assert len(records) == 2
+    assert records[0]["pkgname"] == "hello-world"
+    assert records[0]["version"] == "1-r0"
+    assert records[0]["size"] == 2048
+    assert records[1]["size"] is None
+    assert records[0]["binary_cache"] is False
+    assert records[1]["binary_cache"] is True
+    assert sorted(records[0]["time"].keys()) == ["finish", "run_abuild",
+                                                 "total"]
+
+
+def test_table(args):
+    func = pmb.build.history.table
+    assert func([]) == "No builds recorded yet.\n"
+
+    records = [fake_record(args, "linux-fast", 10.0),
+               fake_record(args, "linux-slow", 100.0),
+               fake_record(args, "linux-slow", 300.0),
+               fake_record(args, "linux-slow", 400.0, {"hits": 3,
+                                                       "misses": 1}),
+               fake_record(args, "linux-slow", 0.0, binary_cache=True),
+               fake_record(args, "linux-cached", 0.0, binary_cache=True)]
+    assert func(records) == (
+        "pkgname       arch   version  cross  builds  cached  last    trend"
+        "  abuild  size  ccache\n"
+        "linux-slow    armhf  1.0-r2   -      3       1       400.0s  +100%"
+        "  400.0s  -     75%\n"
+        "linux-fast    armhf  1.0-r2   -      1       0       10.0s   -    "
+        "  10.0s   -     -\n"
+        "linux-cached  armhf  1.0-r2   -      0       1       -       -    "
+        "  -       -     -\n")
+    assert func(records, 1).count("\n") == 2
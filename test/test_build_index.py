@@ -0,0 +1,123 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+This file tests all functions from pmb.build.index.
+"""
+
+import base64
+import os
+import pytest
+import shutil
+import sys
+
+# Import from parent directory
+sys.path.append(os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+sys.path.append(os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/benchmark")))
+import synthetic
+import pmb.build
+import pmb.build.index
+import pmb.chroot
+import pmb.helpers.logging
+import pmb.parse.apk
+import pmb.parse.apkindex
+
+
+@pytest.fixture
+def args(request, tmpdir):
+    import pmb.parse
+    sys.argv = ["pmbootstrap.py", "index"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    args.work = str(tmpdir)
+    return args
+
+
+def test_index_block(tmpdir):
+    path = synthetic.apk(str(tmpdir) + "/test.apk", "test", "1.0-r2",
+                         "noarch", ["musl", "so:libc.musl-x86_64.so.1"],
+                         ["cmd:test"], 1024)
+    checksum = pmb.parse.apk.control(path)["checksum"]
+    block = pmb.build.index.index_block(path, "armhf")
+    assert block.startswith("C:Q1" + base64.b64encode(checksum).decode() +
+                            "\nP:test\nV:1.0-r2\nA:armhf\nS:" +
+                            str(os.path.getsize(path)) + "\nI:1024\n")
+    assert block.endswith("D:musl so:libc.musl-x86_64.so.1\np:cmd:test\n\n")
+
+
+def test_update(args, monkeypatch):
+    # Don't touch chroots
+    commands = []
+
+    def user_batch(args, cmds, *args_user, **kwargs):
+        commands.append(cmds)
+        for cmd in cmds:
+            paths = [path.replace("/tmp/", args.work + "/chroot_native/tmp/")
+                     .replace("/home/pmos/packages/pmos/",
+                              args.work + "/packages/") for path in cmd[1:]]
+            if cmd[0] == "cp":
+                shutil.copy(*paths)
+            elif cmd[0] == "mv":
+                os.rename(*paths)
+    monkeypatch.setattr(pmb.chroot, "user_batch", user_batch)
+    monkeypatch.setattr(pmb.build, "init", lambda args: None)
+    os.makedirs(args.work + "/chroot_native/tmp")
+
+    # Two repositories
+    folder = args.work + "/packages/"
+    for arch in ["x86_64", "armhf"]:
+        os.makedirs(folder + arch)
+        for i in range(3):
+            synthetic.apk(folder + arch + "/pkg" + str(i) + "-1-r0.apk",
+                          "pkg" + str(i), "1-r0", arch)
+    func = pmb.build.index.update
+
+    def pkgnames(arch):
+        blocks = pmb.parse.apkindex.parse_blocks(args, folder + arch +
+                                                 "/APKINDEX.tar.gz")
+        return sorted(block["pkgname"] for block in blocks)
+
+    # Initial index: one signing command for all repositories
+    func(args, ["x86_64", "armhf"])
+    assert len(commands) == 1
+    assert [cmd[0] for cmd in commands[0]].count("abuild-sign") == 2
+    assert pkgnames("armhf") == ["pkg0", "pkg1", "pkg2"]
+    assert os.listdir(args.work + "/chroot_native/tmp") == []
+
+    # Up to date
+    func(args, ["x86_64", "armhf"])
+    assert len(commands) == 1
+
+    # Only the new package gets read, removed packages get dropped
+    os.remove(folder + "x86_64/pkg1-1-r0.apk")
+    synthetic.apk(folder + "x86_64/pkg3-1-r0.apk", "pkg3", "1-r0")
+    reads = []
+    index_block = pmb.build.index.index_block
+    monkeypatch.setattr(pmb.build.index, "index_block",
+                        lambda path, arch: reads.append(path) or
+                        index_block(path, arch))
+    func(args, ["x86_64", "armhf"])
+    assert len(commands) == 2
+    assert [cmd[0] for cmd in commands[1]].count("abuild-sign") == 1
+    assert reads == [folder + "x86_64/pkg3-1-r0.apk"]
+    assert pkgnames("x86_64") == ["pkg0", "pkg2", "pkg3"]
@@ -17,6 +17,7 @@ You should have received a copy of the GNU General Public License
 along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
 import os
+import shutil
 import sys
 import pytest
 
@@ -91,3 +92,49 @@ def test_build_is_necessary_no_binary_available(args):
     aport = pmb.build.other.find_aport(args, "hello-world")
     apkbuild = pmb.parse.apkbuild(args, aport + "/APKBUILD")
     assert pmb.build.is_necessary(args, None, apkbuild, indexes) is True
+
+
+def test_build_is_necessary_fingerprint(args, monkeypatch, tmpdir):
+    """
+    Same version in the binary repo, but the aport changed after building.
+    """
+    # Copy of the hello-world aport, recorded fingerprint in tmpdir
+    tmpdir = str(tmpdir)
+    aport = tmpdir + "/hello-world"
+    shutil.copytree(pmb.build.other.find_aport(args, "hello-world"), aport)
+    args.cache["find_aport"]["hello-world"] = aport
+    monkeypatch.setattr(pmb.build.other, "fingerprint_path",
+                        lambda args, arch, pkgname: tmpdir + "/fingerprint")
+    apkbuild = pmb.parse.apkbuild(args, aport + "/APKBUILD")
+    version = apkbuild["pkgver"] + "-r" + apkbuild["pkgrel"]
+    indexes = list(args.cache["apkindex"].keys())
+    args.cache["apkindex"][indexes[0]]["multiple"] = {
+        "hello-world": {"hello-world": {"pkgname": "hello-world",
+                                        "version": version}}}
+
+    def record(version, fingerprint):
+        with open(tmpdir + "/fingerprint", "w") as handle:
+            handle.write(version + " " + fingerprint + "\n")
+
+    # Not recorded, or recorded for another version
+    func = pmb.build.is_necessary
+    assert func(args, "x86_64", apkbuild, indexes) is False
+    record("0-r0", "invalid")
+    assert func(args, "x86_64", apkbuild, indexes) is False
+
+    # Unchanged aport
+    fingerprint = pmb.build.other.fingerprint(args, apkbuild)
+    record(version, fingerprint)
+    assert func(args, "x86_64", apkbuild, indexes) is False
+
+    # Changed file (without pkgrel bump)
+    with open(aport + "/main.c", "a") as handle:
+        handle.write("/* changed */\n")
+    assert pmb.build.other.fingerprint(args, apkbuild) != fingerprint
+    assert func(args, "x86_64", apkbuild, indexes) is True
+
+    # Added file
+    record(version, pmb.build.other.fingerprint(args, apkbuild))
+    assert func(args, "x86_64", apkbuild, indexes) is False
+    open(aport + "/new.patch", "w").close()
+    assert func(args, "x86_64", apkbuild, indexes) is True
@@ -0,0 +1,291 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+This file tests all functions from pmb.build.scheduler.
+"""
+
+import os
+import pytest
+import sys
+import threading
+import time
+
+# Import from parent directory
+sys.path.append(os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.build._package
+import pmb.build.binary_cache
+import pmb.build.autodetect
+import pmb.build.history
+import pmb.build.other
+import pmb.build.scheduler
+import pmb.chroot
+import pmb.helpers.repo
+import pmb.helpers.logging
+
+
+@pytest.fixture
+def args(request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    return args
+
+
+def return_none(*args, **kwargs):
+    return None
+
+
+def fake_aports(monkeypatch, args, aports, necessary):
+    """
+    Let the scheduler work on fake APKBUILDs instead of the real aports.
+
+    :param aports: { pkgname: [depend, ...], ... }, packages that are not
+                   listed are upstream packages
+    :param necessary: list of pkgnames, that need to be built
+    """
+    def get_apkbuild(args, pkgname, arch, update_repo=True):
+        # The plan only uses the APKINDEX files, that exist already
+        assert not update_repo
+        if pkgname not in aports:
+            return None
+        return {"pkgname": pkgname, "pkgver": "1.0", "pkgrel": "0",
+                "arch": ["all"], "depends": [],
+                "makedepends": aports[pkgname], "subpackages": []}
+
+    def is_necessary_warn_depends(args, apkbuild, arch, force, built):
+        return force or apkbuild["pkgname"] in necessary
+
+    def suffix(args, apkbuild, arch):
+        if arch == args.arch_native:
+            return "native"
+        return "buildroot_" + arch
+
+    def crosscompile(args, apkbuild, arch, suffix):
+        return None
+
+    monkeypatch.setattr(pmb.build._package, "get_apkbuild", get_apkbuild)
+    monkeypatch.setattr(pmb.build._package, "is_necessary_warn_depends",
+                        is_necessary_warn_depends)
+    monkeypatch.setattr(pmb.build.autodetect, "suffix", suffix)
+    monkeypatch.setattr(pmb.build.autodetect, "crosscompile", crosscompile)
+
+
+def test_plan(args, monkeypatch):
+    aports = {"app": ["lib1", "lib2", "musl"],
+              "lib1": ["lib3"],
+              "lib2": ["lib3"],
+              "lib3": ["musl"],
+              "cycle1": ["cycle2"],
+              "cycle2": ["cycle1"]}
+    fake_aports(monkeypatch, args, aports, ["app", "lib1", "lib3"])
+    func = pmb.build.scheduler.plan
+
+    # Dependencies first, lib2 is up to date and passes on lib3
+    jobs = func(args, [("app", "x86_64")])
+    assert list(jobs.keys()) == [("lib3", "x86_64"), ("lib1", "x86_64"),
+                                 ("app", "x86_64")]
+    assert jobs[("lib3", "x86_64")]["after"] == set()
+    assert jobs[("lib1", "x86_64")]["after"] == {("lib3", "x86_64")}
+    assert jobs[("app", "x86_64")]["after"] == {("lib1", "x86_64"),
+                                                ("lib3", "x86_64")}
+
+    # Force only applies to the given packages
+    jobs = func(args, [("lib2", "armhf")], force=True)
+    assert list(jobs.keys()) == [("lib3", "armhf"), ("lib2", "armhf")]
+    assert jobs[("lib2", "armhf")]["force"] is True
+    assert jobs[("lib3", "armhf")]["force"] is False
+    assert jobs[("lib2", "armhf")]["suffix"] == "buildroot_armhf"
+
+    # Up to date
+    jobs = func(args, [("lib2", "x86_64"), ("musl", "x86_64")])
+    assert list(jobs.keys()) == [("lib3", "x86_64")]
+
+    # Circular dependencies do not recurse forever
+    jobs = func(args, [("cycle1", "x86_64")], force=True)
+    assert list(jobs.keys()) == [("cycle1", "x86_64")]
+
+
+def test_plan_missing_apkindex(args, monkeypatch, tmpdir):
+    fake_aports(monkeypatch, args, {"app": []}, ["app"])
+    paths = [str(tmpdir) + "/packages", str(tmpdir) + "/APKINDEX.tar.gz"]
+    monkeypatch.setattr(pmb.helpers.repo, "apkindex_files",
+                        lambda args, arch: paths)
+    warnings = []
+    monkeypatch.setattr(pmb.build.scheduler.logging, "warning",
+                        warnings.append)
+
+    # Local repository does not need to exist, others do
+    pmb.build.scheduler.plan(args, [("app", "armhf")])
+    assert len(warnings) == 2
+    assert "has not been downloaded yet" in warnings[0]
+    open(paths[1], "w").close()
+    warnings.clear()
+    pmb.build.scheduler.plan(args, [("app", "armhf")])
+    assert warnings == []
+
+
+def test_plan_table(args, monkeypatch):
+    aports = {"app": ["lib", "musl"], "lib": []}
+    fake_aports(monkeypatch, args, aports, ["app", "lib"])
+    func = pmb.build.scheduler.plan_table
+
+    jobs = pmb.build.scheduler.plan(args, [("app", "armhf")])
+    assert func(jobs) == ("#  pkgname  version  arch   chroot           cross"
+                          "  after\n"
+                          "1  lib      1.0-r0   armhf  buildroot_armhf  -"
+                          "      -\n"
+                          "2  app      1.0-r0   armhf  buildroot_armhf  -"
+                          "      lib/armhf\n")
+    assert func({}) == "Nothing to build, all packages are up to date.\n"
+
+
+def test_run(args, monkeypatch):
+    aports = {"app": ["lib1", "lib2"], "lib1": [], "lib2": [], "other": [],
+              "broken": []}
+    fake_aports(monkeypatch, args, aports, list(aports.keys()))
+
+    # Record the builds
+    lock = threading.Lock()
+    running = set()
+    parallel = []
+    finished = []
+    indexed = []
+    args.parse_jobs = 4
+
+    def init_buildenv_chroot(*args, **kwargs):
+        pass
+
+    def prepare_abuild(args, apkbuild, arch, *args_abuild):
+        assert args.parse_jobs == 1
+        return (arch + "/" + apkbuild["pkgname"] + ".apk",
+                ["abuild", apkbuild["pkgname"], arch], {})
+
+    def chroot_user(args, cmd, *args_user, **kwargs):
+        if cmd[0] != "abuild":
+            return
+        key = (cmd[1], cmd[2])
+        with lock:
+            running.add(key)
+            parallel.append(set(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(key)
+        if cmd[1] == "broken":
+            raise RuntimeError("build failed")
+
+    def finish(args, apkbuild, arch, output, *args_finish):
+        finished.append(output)
+
+    monkeypatch.setattr(pmb.build._package, "init_buildenv_chroot",
+                        init_buildenv_chroot)
+    monkeypatch.setattr(pmb.build._package, "prepare_abuild", prepare_abuild)
+    monkeypatch.setattr(pmb.chroot, "user", chroot_user)
+    monkeypatch.setattr(pmb.build._package, "finish", finish)
+    monkeypatch.setattr(pmb.build.other, "index_repo",
+                        lambda args, arch: indexed.append(arch))
+    monkeypatch.setattr(pmb.build.history, "ccache_stats", return_none)
+    monkeypatch.setattr(pmb.build.history, "save", return_none)
+    func = pmb.build.scheduler.run
+
+    # Same arch: one after another, dependencies first
+    jobs = pmb.build.scheduler.plan(args, [("app", "x86_64")])
+    assert func(args, jobs, 4) == ["x86_64/lib1.apk", "x86_64/lib2.apk",
+                                   "x86_64/app.apk"]
+    assert max(len(keys) for keys in parallel) == 1
+
+    # Different arches: in parallel, but not more than allowed
+    packages = [("other", arch) for arch in ["x86_64", "armhf", "aarch64"]]
+    jobs = pmb.build.scheduler.plan(args, packages)
+    parallel.clear()
+    assert len(func(args, jobs, 2)) == 3
+    assert max(len(keys) for keys in parallel) == 2
+    assert args.parse_jobs == 4
+
+    # Same arch, different chroots: in parallel, the repository gets updated
+    # after each build
+    monkeypatch.setattr(pmb.build.autodetect, "suffix",
+                        lambda args, apkbuild, arch:
+                        "native" if apkbuild["pkgname"] == "lib1" else
+                        "buildroot_" + arch)
+    packages = [("lib1", "armhf"), ("lib2", "armhf")]
+    jobs = pmb.build.scheduler.plan(args, packages)
+    parallel.clear()
+    indexed.clear()
+    assert len(func(args, jobs, 2)) == 2
+    assert max(len(keys) for keys in parallel) == 2
+    assert indexed == ["armhf", "armhf"]
+
+    # Cross-compiling with distcc uses the native chroot as well
+    monkeypatch.setattr(pmb.build.autodetect, "crosscompile",
+                        lambda args, apkbuild, arch, suffix:
+                        None if suffix == "native" else "distcc")
+    packages = [("other", arch) for arch in ["x86_64", "armhf"]]
+    jobs = pmb.build.scheduler.plan(args, packages)
+    parallel.clear()
+    assert len(func(args, jobs, 2)) == 2
+    assert max(len(keys) for keys in parallel) == 1
+
+    # Failed build: nothing depending on it gets built
+    aports["app"] = ["broken"]
+    jobs = pmb.build.scheduler.plan(args, [("app", "x86_64")], True)
+    finished.clear()
+    with pytest.raises(RuntimeError) as e:
+        func(args, jobs, 2)
+    assert str(e.value) == "build failed"
+    assert finished == []
+
+
+def test_build_job_binary_cache(args, monkeypatch):
+    fake_aports(monkeypatch, args, {"app": []}, ["app"])
+    saved = []
+
+    def save(args, record, output, ccache_before=None, binary_cache=False):
+        saved.append((output, binary_cache, "binary_cache" in record["time"]))
+
+    monkeypatch.setattr(pmb.build.binary_cache, "key", return_none)
+    monkeypatch.setattr(pmb.build.binary_cache, "restore",
+                        lambda *args: "x86_64/app.apk")
+    monkeypatch.setattr(pmb.build._package, "init_buildenv_chroot",
+                        return_none)
+    monkeypatch.setattr(pmb.build.history, "save", save)
+    args.binary_cache = "/tmp/binary_cache"
+
+    # Cache hit: not built, but recorded in the build history
+    jobs = pmb.build.scheduler.plan(args, [("app", "x86_64")])
+    job = jobs[("app", "x86_64")]
+    assert (pmb.build.scheduler.build_job(args, job, False,
+                                          threading.Lock()) ==
+            "x86_64/app.apk")
+    assert saved == [("x86_64/app.apk", True, True)]
+
+
+def test_package(args, monkeypatch):
+    fake_aports(monkeypatch, args, {"app": ["lib"], "lib": []}, ["lib"])
+    monkeypatch.setattr(pmb.build.scheduler, "run", lambda *args: [])
+    func = pmb.build.scheduler.package
+
+    # Only lib gets built, both are not checked again in this session
+    assert func(args, [("app", "x86_64"), ("lib", "x86_64")]) == {
+        ("lib", "x86_64")}
+    assert args.cache["built"]["x86_64"] == ["app", "lib"]
@@ -75,6 +75,10 @@ def test_config_user(args, tmpdir, monkeypatch):
     argv_jobs = ["pmbootstrap.py", "-c", path_config, "-j", "1000", "config"]
     assert args_patched(monkeypatch, argv_jobs).jobs == "1000"
 
+    # Enable the binary cache in the config
+    change_config(monkeypatch, path_config, "binary_cache", tmpdir + "/cache")
+    assert args_patched(monkeypatch, argv).binary_cache == tmpdir + "/cache"
+
     # Override a config option with something that evaluates to false
     argv_empty = ["pmbootstrap.py", "-c", path_config, "-w", "", "config"]
     assert args_patched(monkeypatch, argv_empty).work == ""
@@ -0,0 +1,99 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import pytest
+import sys
+
+# Import from parent directory
+sys.path.append(os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.build.other
+import pmb.helpers.aports
+import pmb.helpers.logging
+
+
+@pytest.fixture
+def args(tmpdir, request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap.py", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    return args
+
+
+def write_apkbuild(path, pkgname, subpackages="", provides=""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as handle:
+        handle.write("pkgname=" + pkgname + "\n"
+                     "pkgver=1.0\n"
+                     "pkgrel=0\n"
+                     "arch=\"all\"\n"
+                     "subpackages=\"" + subpackages + "\"\n"
+                     "provides=\"" + provides + "\"\n"
+                     "\n")
+
+
+def test_aports_index(args, tmpdir):
+    # Fake aports folder, index stored in tmpdir
+    args.work = str(tmpdir)
+    args.aports = str(tmpdir) + "/aports"
+    write_apkbuild(args.aports + "/main/a/APKBUILD", "a", "$pkgname-dev",
+                   "a-provide")
+    write_apkbuild(args.aports + "/device/b/APKBUILD", "b", "b-doc")
+
+    # Package, subpackage, provides, missing package
+    func = pmb.helpers.aports.find
+    assert func(args, "a") == args.aports + "/main/a"
+    assert func(args, "a-dev") == args.aports + "/main/a"
+    assert func(args, "a-provide") == args.aports + "/main/a"
+    assert func(args, "b-doc") == args.aports + "/device/b"
+    assert func(args, "c") is None
+    assert os.path.exists(pmb.helpers.aports.index_path(args))
+
+    # Added aport is found in the same session
+    write_apkbuild(args.aports + "/main/c/APKBUILD", "c", "c-doc")
+    assert func(args, "c-doc") == args.aports + "/main/c"
+
+    # Changed aport is found in the next session (persistent index)
+    args.cache["apkbuild"] = {}
+    args.cache["apkbuild_persistent"] = {}
+    args.cache["aports_index"] = {}
+    write_apkbuild(args.aports + "/device/b/APKBUILD", "b", "b-dev")
+    os.utime(args.aports + "/device/b/APKBUILD", ns=(0, 0))
+    assert func(args, "b-doc") is None
+    assert func(args, "b-dev") == args.aports + "/device/b"
+    index = pmb.helpers.aports.index(args)
+    assert index["aports"][args.aports + "/main/a"]["names"] == ["a-dev",
+                                                                 "a-provide"]
+
+    # Same package in multiple folders
+    args.cache["aports_index"] = {}
+    write_apkbuild(args.aports + "/device/a/APKBUILD", "a")
+    with pytest.raises(RuntimeError) as e:
+        func(args, "a")
+    assert "found in multiple aports subfolders" in str(e.value)
+
+
+def test_find_aport(args):
+    func = pmb.build.other.find_aport
+    assert func(args, "hello-world") == args.aports + "/main/hello-world"
+    assert func(args, "invalid-package", False) is None
+    assert args.cache["find_aport"]["invalid-package"] is None
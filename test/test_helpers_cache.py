@@ -0,0 +1,71 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+This file tests all functions from pmb.helpers.cache.
+"""
+
+import os
+import sys
+import pytest
+
+# Import from parent directory
+sys.path.append(os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+import pmb.helpers.cache
+import pmb.helpers.logging
+
+
+@pytest.fixture
+def args(request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap.py", "chroot"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    return args
+
+
+def test_save_load(args, tmpdir):
+    path = str(tmpdir) + "/folder/cache.pickle"
+    assert pmb.helpers.cache.load(path, "1") is None
+
+    # Missing folders get created, no temporary files are left over
+    pmb.helpers.cache.save(path, "1", {"key": "value"})
+    assert os.listdir(str(tmpdir) + "/folder") == ["cache.pickle"]
+    assert pmb.helpers.cache.load(path, "1") == {"key": "value"}
+
+    # Other version
+    assert pmb.helpers.cache.load(path, "2") is None
+
+    # Broken file
+    with open(path, "wb") as handle:
+        handle.write(b"broken")
+    assert pmb.helpers.cache.load(path, "1") is None
+
+
+def test_save_failure(args, tmpdir):
+    # The temporary file gets removed, the old cache file stays
+    path = str(tmpdir) + "/cache.pickle"
+    pmb.helpers.cache.save(path, "1", "old")
+    with pytest.raises(Exception):
+        pmb.helpers.cache.save(path, "1", lambda: "can't be pickled")
+    assert os.listdir(str(tmpdir)) == ["cache.pickle"]
+    assert pmb.helpers.cache.load(path, "1") == "old"
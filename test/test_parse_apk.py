@@ -0,0 +1,136 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+This file tests all functions from pmb.parse.apk.
+"""
+
+import hashlib
+import os
+import pytest
+import sys
+import zlib
+
+# Import from parent directory
+sys.path.append(os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/..")))
+sys.path.append(os.path.realpath(
+    os.path.join(os.path.dirname(__file__) + "/benchmark")))
+import synthetic
+import pmb.parse.apk
+
+
+def segments(path):
+    """
+    Split an apk file into its compressed segments with zlib directly.
+    """
+    with open(path, "rb") as handle:
+        content = handle.read()
+    ret = []
+    while content:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        decompressor.decompress(content)
+        end = len(content) - len(decompressor.unused_data)
+        ret.append(content[:end])
+        content = content[end:]
+    return ret
+
+
+def test_control_signed(tmpdir):
+    path = synthetic.apk(str(tmpdir) + "/test.apk", "test", "1.0-r2",
+                         "noarch", ["musl", "so:libc.musl-x86_64.so.1"],
+                         ["cmd:test", "so:libtest.so.1=1.0"], 1024)
+    apk = pmb.parse.apk.control(path)
+    assert len(segments(path)) == 3
+    assert apk["checksum"] == hashlib.sha1(segments(path)[1]).digest()
+    (start, end) = apk["control_range"]
+    with open(path, "rb") as handle:
+        assert handle.read()[start:end] == segments(path)[1]
+    assert apk["signature"]["name"] == ".SIGN.RSA.synthetic.rsa.pub"
+    assert len(apk["signature"]["data"]) == 256
+    assert apk["filesize"] == os.path.getsize(path)
+    assert list(apk["files"].keys()) == [".PKGINFO"]
+
+    pkginfo = apk["pkginfo"]
+    assert pkginfo["pkgname"] == "test"
+    assert pkginfo["pkgver"] == "1.0-r2"
+    assert pkginfo["size"] == "1024"
+    assert pkginfo["depend"] == ["musl", "so:libc.musl-x86_64.so.1"]
+    assert pkginfo["provides"] == ["cmd:test", "so:libtest.so.1=1.0"]
+    assert pkginfo["install_if"] == []
+    assert pmb.parse.apk.sonames(pkginfo) == ["libtest.so.1"]
+
+
+def test_control_unsigned(tmpdir):
+    path = synthetic.apk(str(tmpdir) + "/test.apk", "test", "1.0-r2",
+                         signed=False)
+    apk = pmb.parse.apk.control(path)
+    assert apk["signature"] is None
+    assert apk["checksum"] == hashlib.sha1(segments(path)[0]).digest()
+    assert apk["pkginfo"]["pkgname"] == "test"
+
+
+def test_control_skips_data(tmpdir):
+    # The data segment does not get read: a truncated data segment is fine
+    path = synthetic.apk(str(tmpdir) + "/test.apk", "test", "1.0-r2",
+                         data_size=1024 * 1024)
+    (signature, control, data) = segments(path)
+    with open(path, "wb") as handle:
+        handle.write(signature + control + data[:100])
+    assert pmb.parse.apk.control(path)["pkginfo"]["pkgname"] == "test"
+
+
+def test_control_invalid(tmpdir):
+    path = synthetic.apk(str(tmpdir) + "/test.apk", "test", "1.0-r2")
+    (signature, control, data) = segments(path)
+
+    # Truncated control segment
+    with open(path, "wb") as handle:
+        handle.write(signature + control[:50])
+    with pytest.raises(RuntimeError) as e:
+        pmb.parse.apk.control(path)
+    assert "Unexpected end of file" in str(e.value)
+
+    # Signature only
+    with open(path, "wb") as handle:
+        handle.write(signature)
+    with pytest.raises(RuntimeError) as e:
+        pmb.parse.apk.control(path)
+    assert "Could not find .PKGINFO" in str(e.value)
+
+    # No gzip stream
+    with open(path, "wb") as handle:
+        handle.write(b"not an apk file")
+    with pytest.raises(RuntimeError) as e:
+        pmb.parse.apk.control(path)
+    assert "Invalid gzip stream" in str(e.value)
+
+
+def test_parse_pkginfo():
+    pkginfo = pmb.parse.apk.parse_pkginfo("# comment\n"
+                                          "pkgname = test\n"
+                                          "pkgdesc = a = b\n"
+                                          "depend = a\n"
+                                          "depend = b\n"
+                                          "invalid\n")
+    assert pkginfo["pkgname"] == "test"
+    assert pkginfo["pkgdesc"] == "a = b"
+    assert pkginfo["depend"] == ["a", "b"]
+    assert pkginfo["provides"] == []
+    assert "invalid" not in pkginfo
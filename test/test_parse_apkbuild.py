@@ -18,16 +18,30 @@ along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import os
+import pickle
 import pytest
+import shutil
 import sys
 
 # Import from parent directory
 pmb_src = os.path.realpath(os.path.join(os.path.dirname(__file__) + "/.."))
 sys.path.append(pmb_src)
 
+import pmb.helpers.logging
 import pmb.parse._apkbuild
 
 
+@pytest.fixture
+def args(tmpdir, request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap.py", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    return args
+
+
 def test_subpkgdesc():
     func = pmb.parse._apkbuild.subpkgdesc
     testdata = pmb_src + "/test/testdata"
@@ -48,3 +62,99 @@ def test_subpkgdesc():
     with pytest.raises(RuntimeError) as e:
         func(path, "subpackage")
     assert str(e.value).startswith("Could not find pkgdesc of subpackage")
+
+
+def test_apkbuild_cache_persistent(args, tmpdir):
+    # Copy an APKBUILD, store the persistent cache in tmpdir
+    args.work = str(tmpdir)
+    path = str(tmpdir) + "/hello-world/APKBUILD"
+    os.mkdir(os.path.dirname(path))
+    shutil.copy(pmb_src + "/aports/main/hello-world/APKBUILD", path)
+    func = pmb.parse.apkbuild
+    apkbuild = func(args, path)
+    cache_file = pmb.parse._apkbuild.cache_path(args)
+    pmb.parse._apkbuild.cache_save(args)
+    assert os.path.exists(cache_file)
+
+    # Use the persistent cache in a new session (without reading the file)
+    args.cache["apkbuild"] = {}
+    args.cache["apkbuild_persistent"] = {}
+    entry = pmb.parse._apkbuild.cache_entries(args)[path]
+    entry["data"] = pickle.dumps(dict(apkbuild, pkgdesc="cached"))
+    assert func(args, path)["pkgdesc"] == "cached"
+
+    # Sanity checks still run for cached results
+    args.cache["apkbuild"] = {}
+    entry["data"] = pickle.dumps(dict(apkbuild, pkgver="1-r1"))
+    with pytest.raises(RuntimeError) as e:
+        func(args, path)
+    assert str(e.value).startswith("Invalid pkgver")
+
+    # Parse again, when the size changed
+    args.cache["apkbuild"] = {}
+    with open(path, "a") as handle:
+        handle.write("# changed\n")
+    assert func(args, path) == apkbuild
+
+    # Clear the cache
+    pmb.parse._apkbuild.clear_cache(args, path)
+    assert path not in args.cache["apkbuild"]
+    assert path not in pmb.parse._apkbuild.cache_entries(args)
+
+    # Remove entries of deleted APKBUILDs when saving
+    func(args, path)
+    os.remove(path)
+    pmb.parse._apkbuild.cache_save(args)
+    args.cache["apkbuild_persistent"] = {}
+    assert pmb.parse._apkbuild.cache_entries(args) == {}
+
+
+def test_parse_file(tmpdir):
+    path = str(tmpdir) + "/APKBUILD"
+    with open(path, "w") as handle:
+        handle.write("pkgname=test\n"
+                     "pkgver=1.0\n"
+                     "pkgdesc=\"test package\"\n"
+                     "_pkgname=ignored\n"
+                     "arch\n"
+                     "depends=\"\n"
+                     "\tdep1\n"
+                     "\tdep2 dep3\"\n"
+                     "makedepends=\"make1 $depends_dev\"\n"
+                     "depends_dev=\"dev1\n"
+                     "\tdev2\"\n"
+                     "arch=\"all\"\n"
+                     "subpackages=\"$pkgname-dev $pkgname-doc:doc\"\n"
+                     "\n")
+    ret = pmb.parse._apkbuild.parse_file(path)
+    assert ret["pkgname"] == "test"
+    assert ret["pkgver"] == "1.0"
+    assert ret["pkgdesc"] == "test package"
+    assert ret["arch"] == ["all"]
+    assert ret["depends"] == ["dep1", "dep2", "dep3"]
+    assert ret["makedepends"] == ["make1", "dev1", "dev2"]
+    assert ret["subpackages"] == ["test-dev", "test-doc"]
+    assert "_pkgname" not in ret
+
+
+def test_apkbuild_all(args, tmpdir):
+    # One valid and one broken APKBUILD, cache in tmpdir
+    args.work = str(tmpdir)
+    args.parse_jobs = 2
+    paths = []
+    for pkgname in ["hello-world", "broken"]:
+        path = str(tmpdir) + "/" + pkgname + "/APKBUILD"
+        os.mkdir(os.path.dirname(path))
+        shutil.copy(pmb_src + "/aports/main/hello-world/APKBUILD", path)
+        paths.append(path)
+
+    # Errors get returned, they don't abort the batch
+    apkbuilds, errors = pmb.parse.apkbuild_all(args, paths)
+    assert list(apkbuilds.keys()) == [paths[0]]
+    assert list(errors.keys()) == [paths[1]]
+    assert errors[paths[1]].startswith("The pkgname must be equal")
+
+    # Results from the worker processes are in the cache
+    assert args.cache["apkbuild"][paths[0]] is apkbuilds[paths[0]]
+    entries = pmb.parse._apkbuild.cache_entries(args)
+    assert sorted(entries.keys()) == sorted(paths)
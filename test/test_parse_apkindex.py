@@ -22,7 +22,9 @@ This file tests all functions from pmb.parse.apkindex.
 """
 
 import collections
+import itertools
 import os
+import pickle
 import pytest
 import sys
 
@@ -73,10 +75,10 @@ def test_parse_next_block_no_error(args):
     # First block
     start = [0]
     block = {'arch': 'x86_64',
-             'depends': [],
+             'depends': (),
              'origin': 'musl',
              'pkgname': 'musl',
-             'provides': ['so:libc.musl-x86_64.so.1'],
+             'provides': ('so:libc.musl-x86_64.so.1',),
              'timestamp': '1515217616',
              'version': '1.1.18-r5'}
     assert func(args, path, lines, start) == block
@@ -84,13 +86,13 @@ def test_parse_next_block_no_error(args):
 
     # Second block
     block = {'arch': 'x86_64',
-             'depends': ['ca-certificates',
+             'depends': ('ca-certificates',
                          'so:libc.musl-x86_64.so.1',
                          'so:libcurl.so.4',
-                         'so:libz.so.1'],
+                         'so:libz.so.1'),
              'origin': 'curl',
              'pkgname': 'curl',
-             'provides': ['cmd:curl'],
+             'provides': ('cmd:curl',),
              'timestamp': '1512030418',
              'version': '7.57.0-r0'}
     assert func(args, path, lines, start) == block
@@ -114,10 +116,10 @@ def test_parse_next_block_virtual(args):
     # First block
     start = [0]
     block = {'arch': 'x86_64',
-             'depends': ['so:libc.musl-x86_64.so.1'],
+             'depends': ('so:libc.musl-x86_64.so.1',),
              'origin': 'hello-world',
              'pkgname': 'hello-world',
-             'provides': ['cmd:hello-world'],
+             'provides': ('cmd:hello-world',),
              'timestamp': '1500000000',
              'version': '2-r0'}
     assert func(args, path, lines, start) == block
@@ -125,9 +127,9 @@ def test_parse_next_block_virtual(args):
 
     # Second block: virtual package
     block = {'arch': 'noarch',
-             'depends': ['hello-world'],
+             'depends': ('hello-world',),
              'pkgname': '.pmbootstrap',
-             'provides': [],
+             'provides': (),
              'version': '0'}
     assert func(args, path, lines, start) == block
     assert start == [31]
@@ -137,6 +139,35 @@ def test_parse_next_block_virtual(args):
     assert start == [31]
 
 
+def test_block(args):
+    path = pmb.config.pmb_src + "/test/testdata/apkindex/virtual_package"
+    blocks = pmb.parse.apkindex.parse_blocks(args, path)
+    block = blocks[0]
+
+    # Dict-like access
+    assert block["pkgname"] == "hello-world"
+    assert block.get("invalid") is None
+    assert "timestamp" in block
+    assert "timestamp" not in blocks[1]
+    with pytest.raises(KeyError):
+        blocks[1]["timestamp"]
+    assert dict(block)["version"] == "2-r0"
+
+    # Equal lists are shared between blocks
+    shared_lists = {}
+    func = pmb.parse.apkindex.format_block
+    block_a = func(path, {"arch": "x86_64", "pkgname": "a", "version": "1",
+                          "depends": "b c>1"}, shared_lists)
+    block_b = func(path, {"arch": "x86_64", "pkgname": "b", "version": "1",
+                          "depends": "b c>1"}, shared_lists)
+    assert block_a["depends"] == ("b", "c")
+    assert block_a["depends"] is block_b["depends"]
+    assert block_a["provides"] is block_b["provides"] == ()
+
+    # Pickle (persistent cache)
+    assert pickle.loads(pickle.dumps(block)) == block
+
+
 def test_parse_add_block(args):
     func = pmb.parse.apkindex.parse_add_block
     multiple_providers = False
@@ -230,23 +261,78 @@ def test_parse_cached(args, tmpdir):
     assert pmb.parse.apkindex.clear_cache(args, path) is False
 
 
+def test_parse_cached_persistent(args, tmpdir):
+    # Parse a copy of an APKINDEX, store the persistent cache in tmpdir
+    args.work = str(tmpdir)
+    path = str(tmpdir) + "/APKINDEX"
+    pmb.helpers.run.user(args, ["cp", pmb.config.pmb_src +
+                                "/test/testdata/apkindex/no_error", path])
+    func = pmb.parse.apkindex.parse
+    ret = func(args, path)
+    cache_file = pmb.parse.apkindex.cache_path(args, path, "multiple")
+    assert os.path.exists(cache_file)
+
+    # Use the persistent cache in a new session
+    stat = os.stat(path)
+    args.cache["apkindex"] = {}
+    pmb.parse.apkindex.cache_save(args, path, "multiple", stat.st_mtime,
+                                  stat.st_size, "cached_result_multiple")
+    assert func(args, path) == "cached_result_multiple"
+    assert args.cache["apkindex"][path]["multiple"] == "cached_result_multiple"
+
+    # Ignore the persistent cache when the size does not match
+    args.cache["apkindex"] = {}
+    pmb.parse.apkindex.cache_save(args, path, "multiple", stat.st_mtime,
+                                  stat.st_size + 1, "cached_result_multiple")
+    assert func(args, path) == ret
+
+    # Clearing the cache removes the cache files
+    assert pmb.parse.apkindex.clear_cache(args, path) is True
+    assert not os.path.exists(cache_file)
+
+
+def test_parse_many(args, tmpdir):
+    # Copies of an APKINDEX, persistent cache in tmpdir
+    args.work = str(tmpdir)
+    args.parse_jobs = 2
+    paths = []
+    for i in range(3):
+        path = str(tmpdir) + "/APKINDEX." + str(i)
+        pmb.helpers.run.user(args, ["cp", pmb.config.pmb_src +
+                                    "/test/testdata/apkindex/no_error", path])
+        paths.append(path)
+    paths.append(str(tmpdir) + "/does_not_exist")
+
+    # Parsed in worker processes, same result as parsing serially
+    ret = pmb.parse.apkindex.parse_many(args, paths)
+    for i, path in enumerate(paths[:3]):
+        cache_file = pmb.parse.apkindex.cache_path(args, path, "multiple")
+        assert os.path.exists(cache_file)
+        assert args.cache["apkindex"][path]["multiple"] is ret[i]
+    assert ret[3] == {}
+    args.cache["apkindex"] = {}
+    pmb.parse.apkindex.clear_cache(args, paths[0])
+    args.parse_jobs = 1
+    assert pmb.parse.apkindex.parse_many(args, paths) == ret
+
+
 def test_parse(args):
     path = pmb.config.pmb_src + "/test/testdata/apkindex/no_error"
     block_musl = {'arch': 'x86_64',
-                  'depends': [],
+                  'depends': (),
                   'origin': 'musl',
                   'pkgname': 'musl',
-                  'provides': ['so:libc.musl-x86_64.so.1'],
+                  'provides': ('so:libc.musl-x86_64.so.1',),
                   'timestamp': '1515217616',
                   'version': '1.1.18-r5'}
     block_curl = {'arch': 'x86_64',
-                  'depends': ['ca-certificates',
+                  'depends': ('ca-certificates',
                               'so:libc.musl-x86_64.so.1',
                               'so:libcurl.so.4',
-                              'so:libz.so.1'],
+                              'so:libz.so.1'),
                   'origin': 'curl',
                   'pkgname': 'curl',
-                  'provides': ['cmd:curl'],
+                  'provides': ('cmd:curl',),
                   'timestamp': '1512030418',
                   'version': '7.57.0-r0'}
 
@@ -274,10 +360,10 @@ def test_parse_virtual(args):
     """
     path = pmb.config.pmb_src + "/test/testdata/apkindex/virtual_package"
     block = {'arch': 'x86_64',
-             'depends': ['so:libc.musl-x86_64.so.1'],
+             'depends': ('so:libc.musl-x86_64.so.1',),
              'origin': 'hello-world',
              'pkgname': 'hello-world',
-             'provides': ['cmd:hello-world'],
+             'provides': ('cmd:hello-world',),
              'timestamp': '1500000000',
              'version': '2-r0'}
     ret = {"hello-world": block, "cmd:hello-world": block}
@@ -322,6 +408,83 @@ def test_providers_highest_version(args, monkeypatch):
     assert providers["test"]["version"] == "3"
 
 
+def test_merge(args, monkeypatch):
+    # Fake parse function
+    block_i0 = {"pkgname": "test", "version": "2"}
+    block_i1 = {"pkgname": "test", "version": "3"}
+    block_test2 = {"pkgname": "test2", "version": "1"}
+    parsed = {"i0": {"test": {"test": block_i0}},
+              "i1": {"test": {"test": block_i1, "test2": block_test2},
+                     "test2": {"test2": block_test2}},
+              "i2": {}}
+
+    def return_fake_parse(args, path):
+        return parsed[path]
+    monkeypatch.setattr(pmb.parse.apkindex, "parse", return_fake_parse)
+
+    # Highest version wins, providers only in one file are not copied
+    func = pmb.parse.apkindex.merge
+    indexes = ["i0", "i1", "i2"]
+    merged = func(args, indexes)
+    assert merged["test"] == {"test": block_i1, "test2": block_test2}
+    assert merged["test2"] is parsed["i1"]["test2"]
+    assert parsed["i0"] == {"test": {"test": block_i0}}
+
+    # Cached result
+    assert func(args, indexes) is merged
+
+    # Merge again, when one of the files was parsed again
+    block_i0_new = {"pkgname": "test", "version": "4"}
+    parsed["i0"] = {"test": {"test": block_i0_new}}
+    assert func(args, indexes)["test"]["test"] == block_i0_new
+
+    # Versions, that are not transitive ("1_p-r1" is equal to "1-r1" and
+    # "1-r2"): the lower version never wins, no matter in which order the
+    # files are. Same versions: the last file wins.
+    parsed = {"r1": {"test": {"test": {"pkgname": "test",
+                                       "version": "1-r1"}}},
+              "r2": {"test": {"test": {"pkgname": "test",
+                                       "version": "1-r2"}}},
+              "p": {"test": {"test": {"pkgname": "test",
+                                      "version": "1_p-r1"}}}}
+    for indexes in itertools.permutations(["r1", "r2", "p"]):
+        assert func(args, list(indexes))["test"]["test"]["version"] != "1-r1"
+    assert func(args, ["r1", "r2", "p"])["test"]["test"]["version"] == "1_p-r1"
+    assert func(args, ["r1", "p", "r2"])["test"]["test"]["version"] == "1-r2"
+
+
+def test_providers_many(args, monkeypatch):
+    # Fake parse function
+    block_test = {"pkgname": "test", "version": "1"}
+    block_test2 = {"pkgname": "test2", "version": "1"}
+
+    def return_fake_parse(args, path):
+        return {"test": {"test": block_test},
+                "so:libtest.so.1": {"test": block_test, "test2": block_test2}}
+    monkeypatch.setattr(pmb.parse.apkindex, "parse", return_fake_parse)
+
+    # Providers of all packages
+    func = pmb.parse.apkindex.providers_many
+    indexes = ["i0"]
+    packages = ["test", "so:libtest.so.1", "invalid"]
+    assert func(args, packages, None, False, indexes) == {
+        "test": {"test": block_test},
+        "so:libtest.so.1": {"test": block_test, "test2": block_test2},
+        "invalid": {}}
+
+    # Missing package with must_exist
+    with pytest.raises(RuntimeError) as e:
+        func(args, packages, None, True, indexes)
+    assert str(e.value) == "Could not find package 'invalid'!"
+
+    # Package data of all packages
+    func = pmb.parse.apkindex.package_many
+    assert func(args, packages, None, False, indexes) == {
+        "test": block_test,
+        "so:libtest.so.1": block_test,
+        "invalid": None}
+
+
 def test_package(args, monkeypatch):
     # Override pmb.parse.apkindex.providers()
     providers = collections.OrderedDict()
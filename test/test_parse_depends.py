@@ -165,7 +165,11 @@ def test_recurse(args, monkeypatch):
         "so:libtest.so.1": ["libtest_depend"],
     }
 
-    def package_from_index(args, pkgname, install, aport, suffix):
+    installs = {}
+
+    def package_from_index(args, pkgname, install, aport, suffix,
+                           providers=None):
+        installs[pkgname] = [name for name in depends if name in install]
         return {"pkgname": pkgname, "depends": depends[pkgname]}
     monkeypatch.setattr(pmb.parse.depends, "package_from_index",
                         package_from_index)
@@ -175,3 +179,77 @@ def test_recurse(args, monkeypatch):
     pkgnames = ["test", "so:libtest.so.1"]
     result = ["test", "so:libtest.so.1", "libtest", "libtest_depend"]
     assert func(args, pkgnames) == result
+
+    # Packages to be installed: already found and still queued ones
+    assert installs["test"] == ["so:libtest.so.1"]
+    assert installs["libtest"] == ["test", "libtest_depend",
+                                   "so:libtest.so.1"]
+    assert installs["libtest_depend"] == ["test", "libtest", "libtest_depend",
+                                          "so:libtest.so.1"]
+
+
+def test_recurse_cached(args, monkeypatch):
+    monkeypatch.setattr(pmb.parse.depends, "package_from_aports",
+                        return_none)
+    calls = []
+
+    def package_from_index(args, pkgname, install, aport, suffix,
+                           providers=None):
+        calls.append(pkgname)
+        return {"pkgname": pkgname, "depends": []}
+    monkeypatch.setattr(pmb.parse.depends, "package_from_index",
+                        package_from_index)
+
+    # Second call is cached, the result can be modified safely
+    func = pmb.parse.depends.recurse
+    ret = func(args, ["test"])
+    ret.append("modified")
+    assert func(args, ["test"]) == ["test"]
+    assert calls == ["test"]
+
+    # Other installed packages in the chroot: calculate again
+    installed = {"other": {"pkgname": "other"}}
+    monkeypatch.setattr(pmb.chroot.apk, "installed", lambda *args: installed)
+    assert func(args, ["test"]) == ["test"]
+    assert calls == ["test", "test"]
+    assert func(args, ["test"], "buildroot_" + args.arch_native) == ["test"]
+    assert calls == ["test", "test"]
+
+
+def test_graph(args, monkeypatch):
+    # "test" from aports (depends on "so:libtest.so.1"), which is provided by
+    # two binary packages
+    block_libtest = {"pkgname": "libtest", "version": "1-r0", "depends": []}
+    block_libtest2 = {"pkgname": "libtest2", "version": "1-r0", "depends": []}
+    aport_test = {"pkgname": "test", "version": "2-r0",
+                  "depends": ["so:libtest.so.1"]}
+    providers = {"test": {},
+                 "so:libtest.so.1": {"libtest": block_libtest,
+                                     "libtest2": block_libtest2}}
+
+    def providers_many(args, packages, arch, must_exist):
+        return {package: providers[package] for package in packages}
+    monkeypatch.setattr(pmb.parse.apkindex, "providers_many", providers_many)
+    monkeypatch.setattr(pmb.parse.depends, "package_from_aports",
+                        lambda args, pkgname: aport_test if pkgname == "test"
+                        else None)
+    monkeypatch.setattr(pmb.chroot.apk, "installed", lambda *args: {})
+
+    graph = pmb.parse.depends.graph(args, ["test"])
+    assert graph["resolved"] == ["test", "libtest"]
+    assert list(graph["nodes"].keys()) == ["test", "so:libtest.so.1"]
+    node = graph["nodes"]["test"]
+    assert node["origin"] == "aport"
+    assert node["rule"] == "no binary package provider"
+    assert node["depends"] == ["so:libtest.so.1"]
+    node = graph["nodes"]["so:libtest.so.1"]
+    assert node["pkgname"] == "libtest"
+    assert node["origin"] == "binary"
+    assert node["providers"] == ["libtest", "libtest2"]
+    assert node["rule"] == "first of multiple providers"
+    assert node["seconds"] >= 0
+
+    dot = pmb.parse.depends.graph_dot(graph)
+    assert dot.startswith("digraph deptree {\n")
+    assert '\t"test" -> "so:libtest.so.1";\n' in dot
+    assert "=> libtest" in dot
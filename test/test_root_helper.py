@@ -0,0 +1,177 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+This file tests all functions from pmb.helpers.root_helper.
+"""
+
+import os
+import sys
+import pytest
+import threading
+
+# Import from parent directory
+pmb_src = os.path.realpath(os.path.join(os.path.dirname(__file__) + "/.."))
+sys.path.append(pmb_src)
+import pmb.chroot
+import pmb.chroot.root
+import pmb.helpers.logging
+import pmb.helpers.root_helper
+import pmb.helpers.run
+
+
+@pytest.fixture
+def args(request, monkeypatch):
+    import pmb.parse
+    sys.argv = ["pmbootstrap.py", "--root-helper", "chroot"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    request.addfinalizer(lambda: pmb.helpers.root_helper.stop(args))
+
+    # Start the helper as current user, don't require sudo in the testsuite
+    start_cmd = pmb.helpers.root_helper.start_cmd
+    monkeypatch.setattr(pmb.helpers.root_helper, "start_cmd",
+                        lambda: start_cmd()[1:])
+    return args
+
+
+def log_content(args):
+    with open(args.log) as handle:
+        return handle.read()
+
+
+def test_run(args, tmpdir):
+    func = pmb.helpers.run.root
+    assert func(args, ["echo", "test"], return_stdout=True) == "test\n"
+    assert func(args, ["pwd"], working_dir=str(tmpdir),
+                return_stdout=True) == str(tmpdir) + "\n"
+    env = {"TEST": "long value with spaces and special characters: '\"\\!$"}
+    assert func(args, ["sh", "-c", "echo \"$TEST\""], return_stdout=True,
+                env=env) == env["TEST"] + "\n"
+
+    # All commands ran with the same helper process
+    assert len(args.cache["root_helper"]) == 1
+
+    # Output and log message like with sudo
+    func(args, ["echo", "output in the log"])
+    content = log_content(args)
+    assert "% sudo echo output in the log\n" in content
+    assert "\noutput in the log\n" in content
+
+
+def test_run_failure(args):
+    func = pmb.helpers.run.root
+    with pytest.raises(RuntimeError) as e:
+        func(args, ["false"])
+    assert str(e.value) == "Command failed: % sudo false"
+    assert func(args, ["false"], check=False) is None
+
+    with pytest.raises(RuntimeError) as e:
+        func(args, ["pmbootstrap-command-does-not-exist"])
+    assert "Command failed" in str(e.value)
+    assert "root helper: " in log_content(args)
+
+    # The helper keeps running after failed commands
+    assert len(args.cache["root_helper"]) == 1
+    assert func(args, ["echo", "test"], return_stdout=True) == "test\n"
+
+
+def test_run_died(args):
+    pmb.helpers.run.root(args, ["true"])
+    process = args.cache["root_helper"][0]
+    process.kill()
+    process.wait()
+    with pytest.raises(RuntimeError) as e:
+        pmb.helpers.run.root(args, ["true"])
+    assert "exited unexpectedly" in str(e.value)
+
+    # A new one gets started for the next command
+    assert args.cache["root_helper"] == []
+    pmb.helpers.run.root(args, ["true"])
+    assert len(args.cache["root_helper"]) == 1
+
+
+def test_stop(args):
+    func = pmb.helpers.root_helper.stop
+    pmb.helpers.run.root(args, ["true"])
+    process = args.cache["root_helper"][0]
+    func(args)
+    assert process.returncode == 0
+    assert args.cache["root_helper"] == []
+
+    # Helper did not exit cleanly
+    pmb.helpers.run.root(args, ["true"])
+    process = args.cache["root_helper"][0]
+    process.terminate()
+    with pytest.raises(RuntimeError) as e:
+        func(args)
+    assert "exited with code" in str(e.value)
+    assert args.cache["root_helper"] == []
+
+
+def test_run_threads(args):
+    # Both commands run at the same time, so each one needs its own helper
+    barrier = threading.Barrier(2)
+    fifo = args.work + "/root_helper_test_fifo"
+    if os.path.exists(fifo):
+        os.remove(fifo)
+    os.mkfifo(fifo)
+
+    def thread_func(cmd):
+        barrier.wait()
+        pmb.helpers.run.root(args, cmd)
+    threads = [threading.Thread(target=thread_func,
+                                args=(["sh", "-c", "cat " + fifo],)),
+               threading.Thread(target=thread_func,
+                                args=(["sh", "-c", "echo test > " + fifo],))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    os.remove(fifo)
+    assert len(args.cache["root_helper"]) == 2
+
+
+def test_disabled(args, monkeypatch):
+    func = pmb.helpers.run.use_helper
+    assert func(args)
+    assert not func(args, log=False)
+    assert not func(args, background=True)
+    args.root_helper = False
+    assert not func(args)
+
+
+def test_chroot_root(args, monkeypatch):
+    # Only check the command, that gets passed to core()
+    calls = []
+    monkeypatch.setattr(pmb.chroot, "init", lambda args, suffix: None)
+    monkeypatch.setattr(pmb.helpers.run, "core",
+                        lambda *args, **kwargs: calls.append((args, kwargs)))
+    pmb.chroot.root(args, ["echo", "test"], "buildroot_armhf", "/home",
+                    env={"JOBS": "5"})
+    ((args_core, kwargs_core),) = calls
+    cmd = args_core[1]
+    assert kwargs_core == {"helper": True}
+    assert args_core[2] == "(buildroot_armhf) % JOBS=5 cd /home; echo test"
+    assert cmd[:2] == ["env", "-i"]
+    assert "JOBS=5" in cmd
+    assert cmd[-4:] == [args.work + "/chroot_buildroot_armhf", "/bin/sh",
+                        "-c", "cd /home;echo test"]
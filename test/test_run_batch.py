@@ -0,0 +1,122 @@
+"""
+Copyright 2018 Oliver Smith
+
+This file is part of pmbootstrap.
+
+pmbootstrap is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pmbootstrap is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+This file tests the batch functions from pmb.helpers.run and pmb.chroot.
+"""
+
+import os
+import sys
+import pytest
+
+# Import from parent directory
+pmb_src = os.path.realpath(os.path.join(os.path.dirname(__file__) + "/.."))
+sys.path.append(pmb_src)
+import pmb.chroot
+import pmb.config
+import pmb.helpers.logging
+import pmb.helpers.run
+
+
+@pytest.fixture
+def args(request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap.py", "chroot"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(args.logfd.close)
+    return args
+
+
+def run_user(args, calls):
+    """
+    :returns: function for pmb.helpers.run.batch(), that runs the shell as
+              current user and remembers the calls
+    """
+    def func(cmd):
+        calls.append(cmd)
+        return pmb.helpers.run.user(args, cmd)
+    return func
+
+
+def test_batch(args, tmpdir):
+    calls = []
+    path = str(tmpdir) + "/test"
+    pmb.helpers.run.batch([["mkdir", path],
+                           ["touch", path + "/file with spaces"],
+                           ["sh", "-c", "echo '$test' > " + path + "/b"]],
+                          run_user(args, calls))
+    assert len(calls) == 1
+    assert sorted(os.listdir(path)) == ["b", "file with spaces"]
+    with open(path + "/b") as handle:
+        assert handle.read() == "$test\n"
+
+    # Commands in the log
+    with open(args.log) as handle:
+        assert "\n% touch " + path + "/file with spaces\n" in handle.read()
+
+
+def test_batch_failure(args, tmpdir):
+    calls = []
+    path = str(tmpdir) + "/test"
+    with pytest.raises(RuntimeError) as e:
+        pmb.helpers.run.batch([["mkdir", path],
+                               ["sh", "-c", "exit 3"],
+                               ["rmdir", path]],
+                              run_user(args, calls), "(native) % ")
+    assert str(e.value) == "Command failed: (native) % sh -c exit 3"
+    assert e.value.__cause__.returncode == 2
+
+    # Stopped after the failed command
+    assert os.path.exists(path)
+    with open(args.log) as handle:
+        assert "\nExit code: 3\n" in handle.read()
+
+    # Errors, that are not caused by one of the commands
+    def func(cmd):
+        raise RuntimeError("Chroot does not exist")
+    with pytest.raises(RuntimeError) as e:
+        pmb.helpers.run.batch([["true"]], func)
+    assert str(e.value) == "Chroot does not exist"
+
+
+def test_batch_split(args, monkeypatch):
+    monkeypatch.setattr(pmb.config, "batch_commands_max", 2)
+    calls = []
+    cmds = [["true"], ["true"], ["true"], ["false"], ["true"]]
+    with pytest.raises(RuntimeError) as e:
+        pmb.helpers.run.batch(cmds, run_user(args, calls))
+    assert str(e.value) == "Command failed: % false"
+    assert len(calls) == 2
+
+
+def test_root_batch(args, monkeypatch):
+    calls = []
+
+    def chroot_root(args, cmd, suffix, working_dir, **kwargs):
+        calls.append((suffix, working_dir, kwargs))
+        return pmb.helpers.run.user(args, cmd)
+    monkeypatch.setattr(pmb.chroot, "root", chroot_root)
+    with pytest.raises(RuntimeError) as e:
+        pmb.chroot.root_batch(args, [["true"], ["false"]], "rootfs_test",
+                              "/tmp", env={"JOBS": "5"})
+    assert str(e.value) == "Command failed: (rootfs_test) % false"
+    assert calls == [("rootfs_test", "/tmp", {"auto_init": True,
+                                              "env": {"JOBS": "5"}})]
@@ -16,7 +16,10 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with pmbootstrap.  If not, see <http://www.gnu.org/licenses/>.
 """
+import glob
+import itertools
 import os
+import random
 import sys
 import pytest
 
@@ -72,3 +75,129 @@ def test_version(args):
     for error in errors:
         print(error)
     assert errors == []
+
+
+def legacy_compare(a_version, b_version, fuzzy=False):
+    """
+    pmb.parse.version.compare() as it was before version_key() existed,
+    parsing both strings one token at a time.
+    """
+    get_token = pmb.parse.version.get_token
+    token_value = pmb.parse.version.token_value
+    a_token = "digit"
+    b_token = "digit"
+    a_value = 0
+    b_value = 0
+    a_rest = a_version
+    b_rest = b_version
+    while (a_token == b_token and a_token not in ["end", "invalid"] and
+           a_value == b_value):
+        (a_token, a_value, a_rest) = get_token(a_token, a_rest)
+        (b_token, b_value, b_rest) = get_token(b_token, b_rest)
+    if a_value < b_value:
+        return -1
+    if a_value > b_value:
+        return 1
+    if a_token == b_token or fuzzy:
+        return 0
+    if a_token == "suffix":
+        (a_token, a_value, a_rest) = get_token(a_token, a_rest)
+        if a_value < 0:
+            return -1
+    if b_token == "suffix":
+        (b_token, b_value, b_rest) = get_token(b_token, b_rest)
+        if b_value < 0:
+            return 1
+    if token_value(a_token) > token_value(b_token):
+        return -1
+    if token_value(a_token) < token_value(b_token):
+        return 1
+    return 0
+
+
+def real_versions():
+    """
+    :returns: sorted list of the versions from apk-tools' version tests, the
+              APKINDEX files in the testdata and the APKBUILDs in aports/
+    """
+    ret = set()
+    with open(pmb_src + "/test/testdata/version/version.data") as handle:
+        for line in handle:
+            split = line.split(" ")
+            ret.add(split[0])
+            ret.add(split[2].split("#")[0].rstrip())
+
+    for path in glob.glob(pmb_src + "/test/testdata/apkindex/*"):
+        with open(path) as handle:
+            for line in handle:
+                if line.startswith("V:"):
+                    ret.add(line[2:-1])
+
+    for path in glob.glob(pmb_src + "/aports/*/*/APKBUILD"):
+        pkgver = None
+        pkgrel = None
+        with open(path) as handle:
+            for line in handle:
+                if line.startswith("pkgver="):
+                    pkgver = line[7:].strip()
+                elif line.startswith("pkgrel="):
+                    pkgrel = line[7:].strip()
+        if pkgver and pkgrel and "$" not in pkgver + pkgrel:
+            ret.add(pkgver + "-r" + pkgrel)
+    return sorted(ret)
+
+
+def test_version_key_differential():
+    # Same results as the previous implementation for neighbouring versions
+    # (similar strings) and random pairs of real versions
+    versions = real_versions()
+    pairs = list(zip(versions, versions[1:]))
+    rand = random.Random(1)
+    pairs += [(rand.choice(versions), rand.choice(versions))
+              for i in range(20000)]
+    for a, b in pairs:
+        for fuzzy in [False, True]:
+            for x, y in [(a, b), (b, a), (a, a)]:
+                expected = legacy_compare(x, y, fuzzy)
+                assert pmb.parse.version.compare(x, y, fuzzy) == expected
+
+
+def test_version_key():
+    func = pmb.parse.version.version_key
+    assert func("1.2-r1") == ((1, 0), (2, 5), (1, 6))
+    assert func("1.2-r1") is func("1.2-r1")
+    assert func("1-x")[-1][1] == pmb.parse.version.token_value("invalid")
+
+
+def test_version_max():
+    func = pmb.parse.version.max
+    versions = ["1.2", "1.2_rc1", "2.1", "1.2.1", "1.2-r1"]
+    assert func(versions) == "2.1"
+    assert func([]) is None
+
+    # Equal versions: first one wins
+    assert func(["1.2_p", "1.2"]) == "1.2_p"
+    assert func(["1.2", "1.2_p"]) == "1.2"
+
+    # Not transitive: "1_p-r1" is equal to "1-r1" and "1-r2", but a lower
+    # version never wins, no matter in which order they are
+    assert pmb.parse.version.compare("1_p-r1", "1-r1") == 0
+    assert pmb.parse.version.compare("1_p-r1", "1-r2") == 0
+    for versions in itertools.permutations(["1-r2", "1_p-r1", "1-r1"]):
+        assert func(versions) != "1-r1"
+    assert func(["1-r2", "1_p-r1", "1-r1"]) == "1-r2"
+    assert func(["1-r1", "1_p-r1", "1-r2"]) == "1_p-r1"
+
+    # APKINDEX blocks
+    blocks = [{"pkgname": "a", "version": "1.2-r1"},
+              {"pkgname": "b", "version": "1.10-r0"},
+              {"pkgname": "c", "version": "1.2-r0"}]
+    assert func(blocks, lambda block: block["version"]) is blocks[1]
+
+    # Same result as comparing with compare()
+    versions = real_versions()
+    rand = random.Random(1)
+    rand.shuffle(versions)
+    ret = func(versions)
+    for version in versions:
+        assert pmb.parse.version.compare(version, ret) != 1